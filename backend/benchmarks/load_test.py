@@ -0,0 +1,285 @@
+"""
+Load test of /auth/login, /deals/list and /deals/{id}/files against the mock upstream.
+
+    cd backend && python -m benchmarks.load_test --concurrency 20 --duration 10 --output after.json
+    python -m benchmarks.load_test --compare before.json after.json
+
+By default the mock upstream (benchmarks.mock_upstream) and the API (uvicorn main:app) are
+started as subprocesses, with FO1_BASE_URL / FO2_BASE_URL pointed at the mock. Mock options
+are passed as --mock key=value (e.g. --mock latency_ms=50 --mock deals=5000). Use --api-url
+to drive an API that is already running instead (add --api-pid to sample its RSS).
+
+Results are JSON: per scenario, request and error counts, status codes, p50/p95/p99 latency
+in ms, requests per second and the API's peak RSS while the scenario ran.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import httpx
+
+try:
+    import psutil
+except ImportError:  # optional, /proc is read instead (Linux)
+    psutil = None
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("login", "list", "files")
+#metrics shown by --compare, and whether higher is better
+COMPARED_METRICS = (("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("requests_per_second", True), ("peak_rss_mb", False))
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    #nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def run_scenario(
+    send: Callable[[int], Awaitable[httpx.Response]],
+    concurrency: int,
+    duration: float,
+    max_requests: Optional[int],
+    api_pid: Optional[int]
+) -> Dict[str, Any]:
+    """Call send(n) from `concurrency` workers until the duration or request count is reached"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    failures = 0
+    issued = 0
+    peak_rss = rss_bytes(api_pid) if api_pid else None
+    deadline = time.perf_counter() + duration
+
+    async def worker() -> None:
+        nonlocal issued, failures
+        while time.perf_counter() < deadline and (max_requests is None or issued < max_requests):
+            n = issued
+            issued += 1
+            start = time.perf_counter()
+            try:
+                response = await send(n)
+                statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+                if response.status_code >= 400:
+                    failures += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+                failures += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    async def sample_rss() -> None:
+        nonlocal peak_rss
+        while True:
+            await asyncio.sleep(0.2)
+            rss = rss_bytes(api_pid)
+            if rss is not None:
+                peak_rss = max(peak_rss or 0, rss)
+
+    sampler = asyncio.ensure_future(sample_rss()) if api_pid else None
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    if sampler is not None:
+        sampler.cancel()
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": failures,
+        "statuses": statuses,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss / (1024 * 1024), 1) if peak_rss else None
+    }
+
+
+async def run_load_test(args: argparse.Namespace, api_url: str, api_pid: Optional[int]) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=api_url, timeout=args.timeout, limits=limits) as client:
+        cache_control = {"cache_control": args.cache_control} if args.cache_control else {}
+
+        async def login(username: str) -> httpx.Response:
+            return await client.post("/auth/login", json={"username": username, "password": "secret", "website": args.website})
+
+        #one session shared by the list / files scenarios; a 409 (injected "logged in elsewhere")
+        #kills it, and like a real client the workers then log in again
+        session = {"website": args.website, "session_id": None}
+        relogin_lock = asyncio.Lock()
+
+        async def relogin(stale_session_id: Optional[str]) -> None:
+            async with relogin_lock:
+                if session["session_id"] != stale_session_id:
+                    return
+                for _ in range(10):
+                    response = await login("bench@example.com")
+                    if response.status_code == 200:
+                        session["session_id"] = response.json()["session_id"]
+                        return
+                response.raise_for_status()
+
+        async def with_session(send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+            session_id = session["session_id"]
+            response = await send()
+            if response.status_code in (401, 409):
+                await relogin(session_id)
+            return response
+
+        deal_ids: List[int] = []
+        for _ in range(10):
+            await relogin(session["session_id"])
+            response = await client.post("/deals/list", json={**session, "limit": 200})
+            if response.status_code == 200:
+                deal_ids = [deal["id"] for deal in response.json()["deals"]]
+                break
+        deal_ids = deal_ids or [1]
+
+        def files(n: int) -> Awaitable[httpx.Response]:
+            deal_id = deal_ids[n % len(deal_ids)]
+            return with_session(lambda: client.post(f"/deals/{deal_id}/files", json={**session, **cache_control, "deal_id": deal_id}))
+
+        requests = {
+            "login": lambda n: login(f"user{n}@example.com"),
+            "list": lambda n: with_session(lambda: client.post("/deals/list", json={**session, **cache_control})),
+            "files": files
+        }
+
+        results = {}
+        for name in args.scenarios.split(","):
+            results[name] = await run_scenario(requests[name], args.concurrency, args.duration, args.requests, api_pid)
+            print(f"{name:>6}: {json.dumps(results[name])}", file=sys.stderr)
+        return results
+
+
+def wait_until_up(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def spawn_servers(args: argparse.Namespace) -> List[subprocess.Popen]:
+    env = {**os.environ, "DEBUG_MODE": "False", "LOG_API_REQUESTS": "False"}
+    for option in args.mock:
+        name, _, value = option.partition("=")
+        env[f"MOCK_{name.upper()}"] = value
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_upstream", "--port", str(args.mock_port)],
+        cwd=BACKEND_DIR, env=env
+    )
+    wait_until_up(f"{mock_url}/docs", 20)
+
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**env, "FO1_BASE_URL": mock_url, "FO2_BASE_URL": mock_url},
+        stdout=subprocess.DEVNULL
+    )
+    wait_until_up(f"http://127.0.0.1:{args.api_port}/docs", 20)
+    return [api, mock]
+
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path) as f:
+        before = json.load(f)["scenarios"]
+    with open(after_path) as f:
+        after = json.load(f)["scenarios"]
+
+    print(f"{'scenario':<8} {'metric':<20} {'before':>10} {'after':>10} {'change':>9}")
+    for name in [name for name in SCENARIOS if name in before and name in after]:
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = before[name].get(metric), after[name].get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            marker = "" if abs(change) < 5 else (" +" if better else " -")
+            print(f"{name:<8} {metric:<20} {old:>10} {new:>10} {change:>+8.1f}%{marker}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--requests", type=int, default=None, help="stop a scenario after this many requests")
+    parser.add_argument("--website", default="fo1")
+    parser.add_argument("--cache-control", choices=("no-cache", "no-store"), default=None, help="bypass the API cache")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--api-url", default=None, help="drive a running API instead of starting one")
+    parser.add_argument("--api-pid", type=int, default=None, help="pid of the running API, for RSS")
+    parser.add_argument("--api-port", type=int, default=8765)
+    parser.add_argument("--mock-port", type=int, default=9765)
+    parser.add_argument("--mock", action="append", default=[], metavar="KEY=VALUE", help="mock upstream option")
+    parser.add_argument("--output", default=None, help="write the JSON results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    processes = []
+    try:
+        if args.api_url:
+            api_url, api_pid = args.api_url, args.api_pid
+        else:
+            processes = spawn_servers(args)
+            api_url, api_pid = f"http://127.0.0.1:{args.api_port}", processes[0].pid
+        scenarios = asyncio.run(run_load_test(args, api_url, api_pid))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "cache_control": args.cache_control,
+            "mock": args.mock
+        },
+        "scenarios": scenarios
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Local mock of the fo1/fo2 upstream API: login, deals-list, paginated deals-cards, files and file blobs.
+
+    cd backend && python -m benchmarks.mock_upstream --port 9001 --latency-ms 50 --deals 2000
+
+Point the API at it with FO1_BASE_URL=http://127.0.0.1:9001 (and/or FO2_BASE_URL).
+Every option can also be set through the MOCK_* environment variable of the same name,
+e.g. MOCK_LATENCY_MS=50.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import secrets
+from dataclasses import dataclass
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from config import config
+
+
+@dataclass
+class MockSettings:
+    deals: int = 500
+    per_page: int = 50
+    files_per_deal: int = 5
+    #share of the deals (every n-th) that appear in deals-list, like the real API
+    list_every: int = 1
+    latency_ms: float = 20.0
+    jitter_ms: float = 5.0
+    #extra bytes of description text per card, to grow payloads
+    padding_bytes: int = 0
+    file_bytes: int = 64 * 1024
+    #probability that a data request fails with 500 / 409
+    error_rate: float = 0.0
+    conflict_rate: float = 0.0
+
+
+def settings_from_env() -> MockSettings:
+    settings = MockSettings()
+    for name, default in vars(MockSettings()).items():
+        value = os.getenv(f"MOCK_{name.upper()}")
+        if value is not None:
+            setattr(settings, name, type(default)(value))
+    return settings
+
+
+def create_app(settings: MockSettings) -> FastAPI:
+    app = FastAPI(title="Mock upstream")
+    #tokens issued by login; a token stays valid for the life of the process
+    tokens = set()
+
+    async def delay() -> None:
+        await asyncio.sleep(max(0.0, settings.latency_ms + random.uniform(-settings.jitter_ms, settings.jitter_ms)) / 1000)
+
+    async def check(request: Request):
+        #simulated latency, then auth and injected failures; returns an error response or None
+        await delay()
+        if request.cookies.get(config.TOKEN_COOKIE_NAME) not in tokens:
+            return JSONResponse({"message": "Unauthenticated."}, status_code=401)
+        roll = random.random()
+        if roll < settings.conflict_rate:
+            return JSONResponse({"message": "Logged in from another device."}, status_code=409)
+        if roll < settings.conflict_rate + settings.error_rate:
+            return JSONResponse({"message": "Server Error"}, status_code=500)
+        return None
+
+    def card(deal_id: int) -> dict:
+        return {
+            "id": deal_id,
+            "title": f"Deal {deal_id} {('Growth', 'Buyout', 'Venture', 'Credit')[deal_id % 4]} Fund",
+            "created_at": f"2024-{deal_id % 12 + 1:02d}-{deal_id % 28 + 1:02d}T09:30:00.000000Z",
+            "deal_owner_value": f"Firm {deal_id % 40}",
+            "asset_class": {"id": deal_id % 5, "name": ("Private Equity", "Venture Capital", "Real Estate", "Private Credit", "Infrastructure")[deal_id % 5]},
+            "status": {"id": deal_id % 3, "name": ("Open", "Closed", "Due Diligence")[deal_id % 3]},
+            "currencies": [{"value": ("USD", "EUR", "GBP")[deal_id % 3]}],
+            "user_id": deal_id % 100,
+            "description": "x" * settings.padding_bytes
+        }
+
+    @app.post(config.LOGIN_ENDPOINT)
+    async def login(request: Request):
+        await delay()
+        body = await request.json()
+        if not body.get("email") or body.get("password") == "invalid":
+            return JSONResponse({"message": "Invalid credentials"}, status_code=401)
+        token = secrets.token_hex(16)
+        tokens.add(token)
+        response = JSONResponse({"message": "ok"})
+        response.set_cookie(config.TOKEN_COOKIE_NAME, token)
+        return response
+
+    @app.post(config.DEALS_LIST_ENDPOINT)
+    async def deals_list(request: Request):
+        error = await check(request)
+        if error:
+            return error
+        return {"data": [{"id": i, "title": f"Deal {i}"} for i in range(1, settings.deals + 1, settings.list_every)]}
+
+    @app.post(config.DEALS_CARDS_ENDPOINT)
+    async def deals_cards(request: Request):
+        error = await check(request)
+        if error:
+            return error
+        page = max(int(request.query_params.get("page", "1")), 1)
+        last_page = max(-(-settings.deals // settings.per_page), 1)
+        first = (page - 1) * settings.per_page + 1
+        return {
+            "current_page": page,
+            "data": [card(i) for i in range(first, min(first + settings.per_page, settings.deals + 1))],
+            "last_page": last_page,
+            "per_page": settings.per_page,
+            "total": settings.deals
+        }
+
+    @app.get(config.DEALS_FILES_ENDPOINT)
+    async def deal_files(deal_id: int, request: Request):
+        error = await check(request)
+        if error:
+            return error
+        base_url = str(request.base_url).rstrip("/")
+        return {"data": {
+            str(k): {
+                "id": k,
+                "name": f"deal_{deal_id}_document_{k}.pdf",
+                "size_in_bytes": settings.file_bytes,
+                "file_url": f"{base_url}/mock/blob/{deal_id}/{k}",
+                "type": "pdf",
+                "created_at": "2024-01-01T00:00:00.000000Z",
+                "state": "ready"
+            }
+            for k in range(settings.files_per_deal)
+        }}
+
+    @app.get("/mock/blob/{deal_id}/{file_id}")
+    async def blob(deal_id: int, file_id: int):
+        await delay()
+        return Response(bytes(settings.file_bytes), media_type="application/pdf")
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    defaults = settings_from_env()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    for name, default in vars(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+
+    settings = MockSettings(**{name: getattr(args, name) for name in vars(defaults)})
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Per-request CPU of encoding a deals response, old path vs fast path.
+
+    cd backend && python -m benchmarks.serialization [--sizes 1000,10000,50000] [--repeat 20]
+
+old:  Deal(**deal) per card, DealsResponse, then FastAPI's response_model pass
+      (dump to dict, validate again, serialize)
+fast: the parsed records, validated once per upstream fetch, encoded with services.serialization
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List
+from pydantic import TypeAdapter
+from models.deals import Deal, DealsResponse
+from services import serialization
+from services.records import DealRecord, validate_deals, to_dict
+
+
+_response_adapter = TypeAdapter(DealsResponse)
+
+
+def make_deals(count: int) -> List[DealRecord]:
+    #parsed cards shaped like _map_card output
+    return validate_deals([
+        {
+            "id": i,
+            "title": f"Deal {i} - Growth Capital Fund {i % 97}",
+            "created_at": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T10:00:00Z",
+            "firm": f"Firm {i % 250}",
+            "asset_class": ("Private Equity", "Venture", "Real Estate", "Credit")[i % 4],
+            "deal_status": ("Open", "Closed", "Due Diligence")[i % 3],
+            "currency": ("USD", "EUR", "GBP")[i % 3],
+            "user_id": i % 1000,
+            "deal_capital_seeker_email": ""
+        }
+        for i in range(count)
+    ])
+
+
+def old_path(deals: List[Dict[str, Any]]) -> bytes:
+    response = DealsResponse(deals=[Deal(**deal) for deal in deals], total=len(deals), next_cursor=None)
+    #what FastAPI does with a returned model and response_model=DealsResponse
+    content = response.model_dump()
+    return _response_adapter.dump_json(_response_adapter.validate_python(content))
+
+
+def fast_path(deals: List[DealRecord]) -> bytes:
+    return serialization.dumps({"deals": deals, "total": len(deals), "next_cursor": None})
+
+
+def fast_path_gzip(deals: List[DealRecord]) -> bytes:
+    body, _ = serialization.compress(fast_path(deals), "gzip")
+    return body
+
+
+def cpu_ms(fn: Callable[[], bytes], repeat: int) -> float:
+    fn()
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        deals = make_deals(size)
+        #the old path started from plain dicts
+        inputs = {"old": [to_dict(deal) for deal in deals], "fast": deals, "fast_gzip": deals}
+        result = {"deals": size, "encoder": "orjson" if serialization.orjson is not None else "json"}
+        for name, fn in (("old", old_path), ("fast", fast_path), ("fast_gzip", fast_path_gzip)):
+            result[f"{name}_cpu_ms"] = round(cpu_ms(lambda: fn(inputs[name]), args.repeat), 3)
+            result[f"{name}_bytes"] = len(fn(inputs[name]))
+        result["speedup"] = round(result["old_cpu_ms"] / result["fast_cpu_ms"], 1)
+        results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'deals':>7} {'old ms':>9} {'fast ms':>9} {'gzip ms':>9} {'speedup':>8} {'bytes':>10} {'gzip bytes':>11}")
+    for r in results:
+        print(
+            f"{r['deals']:>7} {r['old_cpu_ms']:>9} {r['fast_cpu_ms']:>9} {r['fast_gzip_cpu_ms']:>9} "
+            f"{r['speedup']:>7}x {r['fast_bytes']:>10} {r['fast_gzip_bytes']:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 import os
-from typing import Dict
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,11 +7,9 @@ class Config:
     """Configuration class that loads from environment variables"""
     
     # ---------------------------------------- website settings ----------------------------------------
-    FO1_BASE_URL: str = os.getenv("FO1_BASE_URL", "https://fo1.api.altius.finance")
-    FO2_BASE_URL: str = os.getenv("FO2_BASE_URL", "https://fo2.api.altius.finance")
-    
-    FO1_WEBSITE_URL: str = os.getenv("FO1_WEBSITE_URL", "https://fo1.altius.finance")
-    FO2_WEBSITE_URL: str = os.getenv("FO2_WEBSITE_URL", "https://fo2.altius.finance")
+    #upstream sites; each one's URLs come from {NAME}_BASE_URL / {NAME}_WEBSITE_URL or SITES_FILE (see services/sites.py)
+    SITES: str = os.getenv("SITES", "fo1,fo2")
+    SITES_FILE: str = os.getenv("SITES_FILE", "")  # JSON: site name -> URLs, endpoints, headers and tuning
     
     # ---------------------------------------- api endpoints ----------------------------------------
     LOGIN_ENDPOINT: str = os.getenv("LOGIN_ENDPOINT", "/api/v0.0.2/login")
@@ -28,71 +25,118 @@ class Config:
     )
     REQUEST_TIMEOUT: int = int(os.getenv("REQUEST_TIMEOUT", "30"))
     MAX_RETRIES: int = int(os.getenv("MAX_RETRIES", "3"))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    
+    # ---------------------------------------- retry settings ----------------------------------------
+    RETRY_BASE_DELAY: float = float(os.getenv("RETRY_BASE_DELAY", "0.2"))
+    RETRY_MAX_DELAY: float = float(os.getenv("RETRY_MAX_DELAY", "2"))
+    RETRY_BUDGET_RATIO: float = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))  # retries earned per request
+    RETRY_BUDGET_MAX: float = float(os.getenv("RETRY_BUDGET_MAX", "10"))
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RECOVERY_TIMEOUT: float = float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "15"))
+    
+    # ---------------------------------------- connection pool settings ----------------------------------------
+    HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", "100"))
+    HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "True").lower() == "true"
+    
+    # ---------------------------------------- admission settings ----------------------------------------
+    #token bucket + concurrency limit per website, and per website endpoint (login, list, cards, files); rate 0 = unlimited
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "True").lower() == "true"
+    UPSTREAM_RATE_LIMIT: float = float(os.getenv("UPSTREAM_RATE_LIMIT", "50"))  # requests/s per website
+    UPSTREAM_RATE_BURST: float = float(os.getenv("UPSTREAM_RATE_BURST", "100"))
+    UPSTREAM_MAX_CONCURRENCY: int = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "32"))
+    ENDPOINT_RATE_LIMIT: float = float(os.getenv("ENDPOINT_RATE_LIMIT", "0"))  # requests/s per website endpoint
+    ENDPOINT_RATE_BURST: float = float(os.getenv("ENDPOINT_RATE_BURST", "50"))
+    ENDPOINT_MAX_CONCURRENCY: int = int(os.getenv("ENDPOINT_MAX_CONCURRENCY", "16"))
+    STORAGE_RATE_LIMIT: float = float(os.getenv("STORAGE_RATE_LIMIT", "0"))  # requests/s per website's external file storage
+    STORAGE_RATE_BURST: float = float(os.getenv("STORAGE_RATE_BURST", "50"))
+    STORAGE_MAX_CONCURRENCY: int = int(os.getenv("STORAGE_MAX_CONCURRENCY", "32"))
+    DOWNLOAD_MAX_OPEN_BODIES: int = int(os.getenv("DOWNLOAD_MAX_OPEN_BODIES", "48"))  # file bodies streaming to clients per website / storage
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "500"))  # waiting calls per gate
+    ADMISSION_INTERACTIVE_TIMEOUT: float = float(os.getenv("ADMISSION_INTERACTIVE_TIMEOUT", "5"))  # max queue time, seconds
+    ADMISSION_BACKGROUND_TIMEOUT: float = float(os.getenv("ADMISSION_BACKGROUND_TIMEOUT", "30"))  # prefetch / refresh
+    
+    # ---------------------------------------- pagination settings ----------------------------------------
+    DEALS_CARDS_PAGE_CONCURRENCY: int = int(os.getenv("DEALS_CARDS_PAGE_CONCURRENCY", "4"))
+    DEALS_CARDS_MAX_PAGES: int = int(os.getenv("DEALS_CARDS_MAX_PAGES", "1000"))  # hard cap on deals-cards pages per listing
+    #parse upstream payloads record by record from the response stream (needs ijson)
+    UPSTREAM_STREAM_PARSE: bool = os.getenv("UPSTREAM_STREAM_PARSE", "True").lower() == "true"
+    
+    # ---------------------------------------- session settings ----------------------------------------
+    SESSION_TTL: int = int(os.getenv("SESSION_TTL", str(12 * 60 * 60)))
+    SESSION_IDLE_TIMEOUT: int = int(os.getenv("SESSION_IDLE_TIMEOUT", str(60 * 60)))
+    SESSION_REVALIDATE_AFTER: int = int(os.getenv("SESSION_REVALIDATE_AFTER", "300"))
+    SESSION_MAINTENANCE_INTERVAL: int = int(os.getenv("SESSION_MAINTENANCE_INTERVAL", "60"))
+    #how long the upstream keeps an unused login; background refreshes stop after this much inactivity
+    UPSTREAM_SESSION_LIFETIME: int = int(os.getenv("UPSTREAM_SESSION_LIFETIME", str(15 * 60)))
+    
+    # ---------------------------------------- deal index settings ----------------------------------------
+    DEAL_INDEX_MAX_ENTRIES: int = int(os.getenv("DEAL_INDEX_MAX_ENTRIES", "1000"))
+    
+    # ---------------------------------------- search settings ----------------------------------------
+    SEARCH_MAX_SCOPES: int = int(os.getenv("SEARCH_MAX_SCOPES", "2000"))  # users whose index is kept
+    SEARCH_MAX_EXPANSIONS: int = int(os.getenv("SEARCH_MAX_EXPANSIONS", "50"))  # indexed terms per prefix
+    SEARCH_FUZZY_MIN_LENGTH: int = int(os.getenv("SEARCH_FUZZY_MIN_LENGTH", "4"))
+    SEARCH_BISECT_BATCH: int = int(os.getenv("SEARCH_BISECT_BATCH", "64"))  # index updates up to this size are applied in place, bigger ones merged
+    
+    # ---------------------------------------- sync settings ----------------------------------------
+    SYNC_MAX_USERS: int = int(os.getenv("SYNC_MAX_USERS", "5000"))
+    SYNC_HISTORY: int = int(os.getenv("SYNC_HISTORY", "5"))  # snapshots kept per user for deltas
+    SYNC_MAX_ENTRIES: int = int(os.getenv("SYNC_MAX_ENTRIES", "1000000"))  # deal fingerprints kept across all users' snapshots
+    
+    # ---------------------------------------- prefetch settings ----------------------------------------
+    PREFETCH_ENABLED: bool = os.getenv("PREFETCH_ENABLED", "True").lower() == "true"
+    PREFETCH_CONCURRENCY: int = int(os.getenv("PREFETCH_CONCURRENCY", "4"))
+    PREFETCH_TOP_FILES: int = int(os.getenv("PREFETCH_TOP_FILES", "5"))
+    PREFETCH_INTERVAL: int = int(os.getenv("PREFETCH_INTERVAL", "45"))  # keep below CACHE_TTL so entries stay warm
+    PREFETCH_TICK: float = float(os.getenv("PREFETCH_TICK", "1"))
+    
+    # ---------------------------------------- batch settings ----------------------------------------
+    BATCH_FILES_CONCURRENCY: int = int(os.getenv("BATCH_FILES_CONCURRENCY", "8"))
+    BATCH_FILES_MAX_DEALS: int = int(os.getenv("BATCH_FILES_MAX_DEALS", "200"))
+    
+    # ---------------------------------------- file streaming settings ----------------------------------------
+    FILE_STREAM_CHUNK_SIZE: int = int(os.getenv("FILE_STREAM_CHUNK_SIZE", str(64 * 1024)))
+    ZIP_DOWNLOAD_CONCURRENCY: int = int(os.getenv("ZIP_DOWNLOAD_CONCURRENCY", "4"))
+    ZIP_BUFFER_CHUNKS: int = int(os.getenv("ZIP_BUFFER_CHUNKS", "16"))
+    
+    # ---------------------------------------- response encoding settings ----------------------------------------
+    RESPONSE_COMPRESSION: bool = os.getenv("RESPONSE_COMPRESSION", "True").lower() == "true"
+    RESPONSE_COMPRESS_MIN_SIZE: int = int(os.getenv("RESPONSE_COMPRESS_MIN_SIZE", "1024"))  # bytes
+    RESPONSE_GZIP_LEVEL: int = int(os.getenv("RESPONSE_GZIP_LEVEL", "1"))  # 1 is ~2x cheaper than 5 for ~15% larger bodies
+    RESPONSE_BROTLI_QUALITY: int = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))  # used when brotli is installed
+    
+    # ---------------------------------------- cache settings ----------------------------------------
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "True").lower() == "true"
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")  # memory | redis
+    CACHE_TTL: int = int(os.getenv("CACHE_TTL", "60"))
+    CACHE_MAX_BYTES: int = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    CACHE_REDIS_URL: str = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    
+    # ---------------------------------------- snapshot settings ----------------------------------------
+    SNAPSHOT_ENABLED: bool = os.getenv("SNAPSHOT_ENABLED", "True").lower() == "true"
+    SNAPSHOT_PATH: str = os.getenv("SNAPSHOT_PATH", "snapshots.sqlite3")
+    SNAPSHOT_MAX_BYTES: int = int(os.getenv("SNAPSHOT_MAX_BYTES", str(256 * 1024 * 1024)))  # least recently read snapshots are dropped beyond this
+    SNAPSHOT_MAX_AGE: int = int(os.getenv("SNAPSHOT_MAX_AGE", str(24 * 3600)))  # seconds; older snapshots are never served
+    SNAPSHOT_BUSY_TIMEOUT_MS: int = int(os.getenv("SNAPSHOT_BUSY_TIMEOUT_MS", "5000"))  # wait for another worker's write
     
     # ---------------------------------------- api settings ----------------------------------------
     CONTENT_TYPE: str = os.getenv("CONTENT_TYPE", "application/json")
     ACCEPT_TYPE: str = os.getenv("ACCEPT_TYPE", "application/json")
     TOKEN_COOKIE_NAME: str = os.getenv("TOKEN_COOKIE_NAME", "Authorization2")
     
-    # ---------------------------------------- debug settings ----------------------------------------
-    DEBUG_MODE: bool = os.getenv("DEBUG_MODE", "True").lower() == "true"
-    LOG_API_REQUESTS: bool = os.getenv("LOG_API_REQUESTS", "True").lower() == "true"
-    
-    # ---------------------------------------- helper methods ----------------------------------------
-    
-    @classmethod
-    def get_base_url(cls, website: str) -> str:
-        """Get base URL for specified website"""
-        url_mapping = {
-            "fo1": cls.FO1_BASE_URL,
-            "fo2": cls.FO2_BASE_URL
-        }
-        
-        if website not in url_mapping:
-            raise ValueError(f"Unsupported website: {website}. Supported: {list(url_mapping.keys())}")
-        
-        return url_mapping[website]
-    
-    @classmethod
-    def get_website_url(cls, website: str) -> str:
-        #get website URL for specified website
-        url_mapping = {
-            "fo1": cls.FO1_WEBSITE_URL,
-            "fo2": cls.FO2_WEBSITE_URL
-        }
-        
-        if website not in url_mapping:
-            raise ValueError(f"Unsupported website: {website}. Supported: {list(url_mapping.keys())}")
-        
-        return url_mapping[website]
-    
-    @classmethod
-    def get_common_headers(cls, website: str) -> Dict[str, str]:
-        #get common headers for API requests
-        website_url = cls.get_website_url(website)
-        
-        return {
-            "User-Agent": cls.USER_AGENT,
-            "Accept": cls.ACCEPT_TYPE,
-            "Content-Type": cls.CONTENT_TYPE,
-            "Origin": website_url,
-            "Referer": f"{website_url}/"
-        }
-    
-    @classmethod
-    def get_endpoint_url(cls, website: str, endpoint: str, **kwargs) -> str:
-        #get full URL for specific endpoint
-        base_url = cls.get_base_url(website)
-        formatted_endpoint = endpoint.format(**kwargs)
-        return f"{base_url}{formatted_endpoint}"
-    
-    @classmethod
-    def is_debug_enabled(cls) -> bool:
-        return cls.DEBUG_MODE
-    
-    @classmethod
-    def should_log_requests(cls) -> bool:
-        return cls.LOG_API_REQUESTS
+    # ---------------------------------------- metrics settings ----------------------------------------
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True").lower() == "true"  # /metrics and route timing
+    
+    # ---------------------------------------- logging settings ----------------------------------------
+    DEBUG_MODE: bool = os.getenv("DEBUG_MODE", "False").lower() == "true"  # debug events: upstream errors, retries, session checks
+    LOG_API_REQUESTS: bool = os.getenv("LOG_API_REQUESTS", "False").lower() == "true"  # a debug trace of every upstream call (with DEBUG_MODE)
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")  # used when DEBUG_MODE is off
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")  # json, or text (key=value)
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # records waiting for the writer thread; beyond it they are dropped
+    LOG_SAMPLE_EVERY: int = max(int(os.getenv("LOG_SAMPLE_EVERY", "20")), 1)  # high-volume events: one in N is written
 
 
 #global config
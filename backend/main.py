@@ -1,13 +1,44 @@
 """Main FastAPI application with properly separated routes"""
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes.auth import auth_router
 from routes.deals import deals_router
+from routes.stats import stats_router
+from routes.metrics import metrics_router
+from services.http_client import init_clients, close_clients
+from services.cache import close_cache
+from services.snapshots import snapshot_store
+from services.scraper import validate_token
+from services.sessions import session_store
+from services.prefetch import prefetcher
+from services.metrics import MetricsMiddleware
+from services.log import RequestIdMiddleware, REQUEST_ID_HEADER, get_logger, start_logging, stop_logging
+from config import config
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # open the per-website upstream connection pools for the app lifetime
+    start_logging()
+    await init_clients()
+    session_store.start(validate=validate_token)
+    prefetcher.start()
+    yield
+    await prefetcher.stop()
+    await session_store.stop()
+    await close_clients()
+    await close_cache()
+    await snapshot_store.close()
+    # write out the queued log records
+    stop_logging()
+
 
 # Initialize FastAPI application
 app = FastAPI(
-    title="Altius Capital API")
+    title="Altius Capital API",
+    lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,14 +46,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[REQUEST_ID_HEADER],
 )
 
+# Time every request by route template; it wraps CORS, so CORS handling is included
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Tag every request and its log records with a request id; outermost, so every layer sees it
+app.add_middleware(RequestIdMiddleware)
+
 # Include authentication routes under /auth prefix
 app.include_router(auth_router, prefix="/auth")
 
 # Include deals routes under /deals prefix  
 app.include_router(deals_router, prefix="/deals")
 
+# Include runtime stats routes under /stats prefix
+app.include_router(stats_router, prefix="/stats")
+
+# Include Prometheus metrics under /metrics
+if config.METRICS_ENABLED:
+    app.include_router(metrics_router, prefix="/metrics")
+
 
-print("\033[92mServer is running on http://localhost:8000\033[0m")
-print("\033[92mAPI Documentation available at: http://localhost:8000/docs\033[0m")
\ No newline at end of file
+get_logger("main").info("app_ready", url="http://localhost:8000", docs="http://localhost:8000/docs")
\ No newline at end of file
@@ -1,14 +1,32 @@
 # Models package initialization
-from .auth import LoginRequest, LoginResponse
-from .deals import DealsRequest, DealsResponse, FilesRequest, FilesResponse, Deal, FileInfo
+from .auth import LoginRequest, LoginResponse, LogoutRequest
+from .deals import (
+    DealsRequest, DealsResponse, FilesRequest, FilesResponse, Deal, FileInfo,
+    BatchFilesRequest, BatchFilesItem, DealsSyncRequest, DealsSyncResponse,
+    DealsFiltersResponse, SearchHit, SearchResponse, DealsStreamRequest,
+    SiteCredentials, AggregatedDealsRequest, AggregatedDealsResponse, SiteError
+)
 
 __all__ = [
     "LoginRequest",
     "LoginResponse", 
+    "LogoutRequest",
     "DealsRequest",
     "DealsResponse",
     "FilesRequest",
     "FilesResponse",
     "Deal",
-    "FileInfo"
+    "FileInfo",
+    "BatchFilesRequest",
+    "BatchFilesItem",
+    "DealsSyncRequest",
+    "DealsSyncResponse",
+    "DealsFiltersResponse",
+    "SearchHit",
+    "SearchResponse",
+    "DealsStreamRequest",
+    "SiteCredentials",
+    "AggregatedDealsRequest",
+    "AggregatedDealsResponse",
+    "SiteError"
 ] 
\ No newline at end of file
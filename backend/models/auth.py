@@ -1,4 +1,5 @@
 from pydantic import BaseModel, EmailStr
+from typing import Optional
 
 
 class LoginRequest(BaseModel):
@@ -11,4 +12,10 @@ class LoginRequest(BaseModel):
 class LoginResponse(BaseModel):
     #response model for successful login - only authentication data
     token: str
-    website: str 
\ No newline at end of file
+    website: str
+    session_id: Optional[str] = None  # opaque id of the server-side session
+
+
+class LogoutRequest(BaseModel):
+    #request model for ending a server-side session
+    session_id: str 
\ No newline at end of file
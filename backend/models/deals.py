@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
 
 
 class Deal(BaseModel):
@@ -13,6 +13,7 @@ class Deal(BaseModel):
     currency: Optional[str] = "USD"
     user_id: Optional[int] = 0
     deal_capital_seeker_email: Optional[str] = ""
+    source: Optional[str] = None  # website the deal came from, set in aggregated listings only
 
 
 class FileInfo(BaseModel):
@@ -30,24 +31,127 @@ class FileInfo(BaseModel):
 class DealsRequest(BaseModel):
     #request model for fetching deals
     website: str
-    token: str
+    token: Optional[str] = None
+    session_id: Optional[str] = None  # server-side session, used instead of token
+    cache_control: Optional[Literal["no-cache", "no-store"]] = None  # bypass the response cache
+    #filters: a deal matches when its field equals any of the given values (case-insensitive)
+    asset_class: Optional[List[str]] = None
+    deal_status: Optional[List[str]] = None
+    currency: Optional[List[str]] = None
+    firm: Optional[List[str]] = None
+    #sort field, prefixed with "-" for descending order, e.g. "-created_at"
+    sort: Optional[str] = Field(None, pattern=r"^-?(id|title|created_at|asset_class|deal_status|currency|firm)$")
+    cursor: Optional[str] = None  # next_cursor of the previous page
+    limit: Optional[int] = Field(None, gt=0, le=1000)  # page size, all deals when omitted
 
 
 class DealsResponse(BaseModel):
     #response model for deals list
     deals: List[Deal]
+    total: int  # deals matching the filters, across all pages
+    next_cursor: Optional[str] = None
+
+
+class SiteCredentials(BaseModel):
+    #one website of an aggregated request and how to authenticate with it
+    website: str
+    token: Optional[str] = None
+    session_id: Optional[str] = None  # server-side session, used instead of token
+
+
+class AggregatedDealsRequest(BaseModel):
+    #request model for listing the deals of several websites at once
+    sites: List[SiteCredentials] = Field(..., min_length=1)
+    cache_control: Optional[Literal["no-cache", "no-store"]] = None  # bypass the response cache
+    stream: bool = False  # NDJSON, one Deal (or SiteError) per line as each website answers
+
+
+class SiteError(BaseModel):
+    #a website that failed within an aggregated listing, with the error it would get on its own
+    source: str
+    status: int
+    error: str
+    message: str
+
+
+class AggregatedDealsResponse(DealsResponse):
+    #response model for aggregated deals: every website's deals, tagged with their source
+    errors: List[SiteError] = []
+
+
+class DealsFiltersResponse(BaseModel):
+    #response model for filter facets: field -> value -> number of deals
+    facets: Dict[str, Dict[str, int]]
+
+
+class SearchHit(BaseModel):
+    #one search result: a deal, or a file within a deal
+    type: Literal["deal", "file"]
+    deal_id: int
+    file_id: Optional[int | str] = None
+    title: str  # deal title or file name
+    firm: Optional[str] = ""
+    score: float
+
+
+class SearchResponse(BaseModel):
+    #response model for deal / file search
+    results: List[SearchHit]
+    total: int
+
+
+class DealsStreamRequest(BaseModel):
+    #request model for streaming every deal as NDJSON
+    website: str
+    token: Optional[str] = None
+    session_id: Optional[str] = None  # server-side session, used instead of token
+    cache_control: Optional[Literal["no-cache", "no-store"]] = None  # bypass the response cache
+
+
+class DealsSyncRequest(BaseModel):
+    #request model for incremental deals sync
+    website: str
+    token: Optional[str] = None
+    session_id: Optional[str] = None  # server-side session, used instead of token
+    cache_control: Optional[Literal["no-cache", "no-store"]] = None  # bypass the response cache
+    sync_cursor: Optional[str] = None  # cursor from the previous sync, omit for a full listing
+
+
+class DealsSyncResponse(BaseModel):
+    #response model for incremental deals sync
+    cursor: str
+    full: bool  # True when the cursor was unknown and `added` holds every deal
+    added: List[Deal]
+    changed: List[Deal]
+    removed: List[int]
     total: int
 
 
 class FilesRequest(BaseModel):
     """Request model for fetching deal files"""
     website: str
-    token: str
+    token: Optional[str] = None
+    session_id: Optional[str] = None  # server-side session, used instead of token
     deal_id: int
+    cache_control: Optional[Literal["no-cache", "no-store"]] = None  # bypass the response cache
 
 
 class FilesResponse(BaseModel):
     """Response model for deal files"""
     files: List[FileInfo]
     total: int
-    error: Optional[str] = None 
\ No newline at end of file
+    error: Optional[str] = None 
+
+
+class BatchFilesRequest(BaseModel):
+    """Request model for fetching the files of several deals at once"""
+    website: str
+    token: Optional[str] = None
+    session_id: Optional[str] = None  # server-side session, used instead of token
+    deal_ids: List[int]
+    cache_control: Optional[Literal["no-cache", "no-store"]] = None  # bypass the response cache
+
+
+class BatchFilesItem(FilesResponse):
+    """One NDJSON line of the batch files stream"""
+    deal_id: int
@@ -1,5 +1,7 @@
 # Routes package initialization
 from .auth import auth_router
 from .deals import deals_router
+from .stats import stats_router
+from .metrics import metrics_router
 
-__all__ = ["auth_router", "deals_router"] 
\ No newline at end of file
+__all__ = ["auth_router", "deals_router", "stats_router", "metrics_router"] 
\ No newline at end of file
@@ -1,39 +1,69 @@
 from fastapi import APIRouter, HTTPException, status
-from models.auth import LoginRequest, LoginResponse
+from models.auth import LoginRequest, LoginResponse, LogoutRequest
 from services.scraper import perform_login
-import traceback
+from services.sessions import session_store
+from services.prefetch import prefetcher
+from services.retry import UpstreamUnavailableError
+from services.admission import UpstreamBusyError
+from services.log import get_logger
 
 auth_router = APIRouter(tags=["Authentication"])
 
+log = get_logger("auth")
+
 
 @auth_router.post("/login", response_model=LoginResponse)
 async def login_user(payload: LoginRequest):
     #authenticate user and return token
     try:
         #perform login to get authentication token from third party website
-        print(f"DEBUG: Starting login for {payload.username} on {payload.website}")
-        token = perform_login(payload.website, payload.username, payload.password)
-        print(f"DEBUG: Login successful, token received")
+        log.debug("login_started", website=payload.website, username=payload.username)
+        token = await perform_login(payload.website, payload.username, payload.password)
+        
+        # keep the upstream token server-side under an opaque session id
+        session = session_store.create(payload.website, payload.username, token)
+        
+        # warm deals and the newest deals' files in the background
+        prefetcher.register(session)
         
         # return authentication data
         response = LoginResponse(
             token=token,
-            website=payload.website
+            website=payload.website,
+            session_id=session.session_id
         )
-        print(f"DEBUG: LoginResponse created successfully")
+        log.info("login_succeeded", website=payload.website)
         
         return response
         
     except ValueError as e:
-        print(f"DEBUG: ValueError in login: {str(e)}")
+        log.info("login_rejected", website=payload.website, error=str(e))
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Authentication failed: {str(e)}"
         )
+    except UpstreamBusyError as e:
+        log.warning("login_not_admitted", website=payload.website, status=e.status_code)
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except UpstreamUnavailableError as e:
+        log.warning("login_upstream_unavailable", website=payload.website, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
     except Exception as e:
-        print(f"DEBUG: Unexpected error in login: {str(e)}")
-        traceback.print_exc()
+        log.exception("login_error", website=payload.website, error=str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Login process failed: {str(e)}"
-        ) 
\ No newline at end of file
+        ) 
+
+
+@auth_router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout_user(payload: LogoutRequest):
+    #drop the server-side session
+    session_store.delete(payload.session_id)
@@ -1,65 +1,389 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Header, HTTPException, Query, Request, status
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from config import config
 from models.deals import (
-    DealsRequest, DealsResponse, Deal,
-    FilesRequest, FilesResponse
+    DealsRequest, DealsResponse,
+    FilesRequest, FilesResponse,
+    BatchFilesRequest,
+    DealsSyncRequest, DealsSyncResponse,
+    DealsFiltersResponse, SearchHit, SearchResponse, DealsStreamRequest,
+    AggregatedDealsRequest, AggregatedDealsResponse
 )
-from services.scraper import fetch_deals, download_deal_files
+from services.scraper import fetch_deals, iter_deals, iter_sites_deals, download_deal_files, iter_deal_files, open_deal_file, UpstreamFetchError
+from services.archive import stream_deal_archive
+from services.sessions import session_store, user_key
+from services.retry import UpstreamUnavailableError
+from services.admission import UpstreamBusyError
+from services.sync import sync_store
+from services.deal_index import get_index, encode_cursor, decode_cursor, FACET_FIELDS
+from services.search import search_index
+from services.serialization import json_response, dumps
+from services.sites import site_registry
+from services.records import to_dict
 
 deals_router = APIRouter(tags=["Deals"])
 
+#upstream file response headers passed through to the client
+FILE_RESPONSE_HEADERS = (
+    "Content-Length", "Content-Range", "Content-Type", "Content-Encoding",
+    "Content-Disposition", "Accept-Ranges", "ETag", "Last-Modified"
+)
+
+
+def _unavailable_error(e: UpstreamUnavailableError) -> HTTPException:
+    #the upstream is down or its circuit is open: tell the client to come back later
+    if isinstance(e, UpstreamBusyError):
+        #not admitted by the upstream rate limit / queue: 429 or 503 right away, with a hint when to retry
+        return HTTPException(
+            status_code=e.status_code,
+            detail={
+                "error": "RATE_LIMITED" if e.status_code == status.HTTP_429_TOO_MANY_REQUESTS else "UPSTREAM_BUSY",
+                "message": str(e)
+            },
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail={
+            "error": "UPSTREAM_UNAVAILABLE",
+            "message": str(e)
+        }
+    )
+
+
+def _fetch_error(e: UpstreamFetchError) -> HTTPException:
+    #the upstream answered, but with an error status or a payload that could not be read
+    return HTTPException(
+        status_code=status.HTTP_502_BAD_GATEWAY,
+        detail={
+            "error": "UPSTREAM_ERROR",
+            "message": str(e)
+        }
+    )
+
+
+def _session_error(e: ValueError) -> HTTPException:
+    #map the scraper's ValueError codes to the HTTP errors the frontend expects
+    error_message = str(e)
+    
+    if error_message == "SESSION_CONFLICT":
+        # handle session conflict (409) - user logged in from another device
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "error": "SESSION_CONFLICT",
+                "message": "Your session has been terminated because you logged in from another device. Please log in again."
+            }
+        )
+    elif error_message == "UNAUTHORIZED":
+        # handle unauthorized (401) - token invalid or expired
+        return HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={
+                "error": "UNAUTHORIZED", 
+                "message": "Your session has expired. Please log in again."
+            }
+        )
+    elif error_message == "FILE_NOT_FOUND":
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found in this deal"
+        )
+    else:
+        # handle other authentication/authorization errors
+        return HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Token validation failed: {str(e)}"
+        )
+
+
+def _bearer_token(authorization: Optional[str]) -> Optional[str]:
+    #GET routes take the token as "Authorization: Bearer <token>" (or a session in X-Session-Id), never in the
+    #query string, which ends up in access logs, proxies and browser history
+    scheme, _, credentials = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    return credentials.strip() or None
+
 
 @deals_router.post("/list", response_model=DealsResponse)
-async def get_deals_list(payload: DealsRequest):
+async def get_deals_list(payload: DealsRequest, request: Request):
     #fetch list of available deals using authentication token
     try:
-        #fetch deals data from the API
-        deals_data = fetch_deals(payload.website, payload.token)
+        token = session_store.resolve_token(payload.website, payload.token, payload.session_id)
         
-        #convert to Deal models
-        deals = [Deal(**deal) for deal in deals_data] if deals_data else []
+        try:
+            offset = decode_cursor(payload.cursor)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
         
-        return DealsResponse(
-            deals=deals,
-            total=len(deals)
+        #fetch deals data from the API
+        deals_data = await fetch_deals(payload.website, token, payload.cache_control)
+        
+        #filter, sort and page through the index built from the parsed cards
+        index = get_index(payload.website, token, deals_data or [])
+        page, total, next_offset = index.query(
+            {name: getattr(payload, name) for name in FACET_FIELDS},
+            sort=payload.sort,
+            offset=offset,
+            limit=payload.limit
         )
         
-    except ValueError as e:
-        error_message = str(e)
+        #deals were validated when parsed, so the page is encoded as-is
+        return json_response(request, {
+            "deals": page,
+            "total": total,
+            "next_cursor": encode_cursor(next_offset) if next_offset is not None else None
+        })
         
-        if error_message == "SESSION_CONFLICT":
-            # handle session conflict (409) - user logged in from another device
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail={
-                    "error": "SESSION_CONFLICT",
-                    "message": "Your session has been terminated because you logged in from another device. Please log in again."
-                }
-            )
-        elif error_message == "UNAUTHORIZED":
-            # handle unauthorized (401) - token invalid or expired
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise _session_error(e)
+    except UpstreamUnavailableError as e:
+        raise _unavailable_error(e)
+    except UpstreamFetchError as e:
+        raise _fetch_error(e)
+    except Exception as e:
+        #handle unexpected errors
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching deals: {str(e)}"
+        )
+
+
+@deals_router.post("/stream", response_class=StreamingResponse)
+async def stream_deals(payload: DealsStreamRequest):
+    """Stream every deal as NDJSON (one Deal per line) while the upstream pages are parsed"""
+    try:
+        token = session_store.resolve_token(payload.website, payload.token, payload.session_id)
+        pages = iter_deals(payload.website, token, payload.cache_control)
+        #the first page surfaces session and availability errors while a status code can still be sent
+        first_page = await pages.__anext__()
+    except StopAsyncIteration:
+        first_page = []
+    except ValueError as e:
+        raise _session_error(e)
+    except UpstreamUnavailableError as e:
+        raise _unavailable_error(e)
+    except UpstreamFetchError as e:
+        raise _fetch_error(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching deals: {str(e)}"
+        )
+    
+    async def stream_lines():
+        try:
+            for deal in first_page:
+                yield dumps(deal) + b"\n"
+            async for page in pages:
+                for deal in page:
+                    yield dumps(deal) + b"\n"
+        except Exception as e:
+            #headers are already sent, so a failure mid-stream ends the stream with an error line
+            yield dumps({"error": f"Error fetching deals: {str(e)}"}) + b"\n"
+        finally:
+            await pages.aclose()
+    
+    return StreamingResponse(stream_lines(), media_type="application/x-ndjson")
+
+
+def _site_error(website: str, e: Exception) -> HTTPException:
+    #the HTTP error one website of an aggregated listing would have answered on its own
+    if isinstance(e, ValueError):
+        return _session_error(e)
+    if isinstance(e, UpstreamUnavailableError):
+        return _unavailable_error(e)
+    if isinstance(e, UpstreamFetchError):
+        return _fetch_error(e)
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Error fetching deals from {website}: {str(e)}"
+    )
+
+
+def _site_error_item(website: str, e: Exception) -> Dict[str, Any]:
+    #a SiteError entry: the error code and message of _site_error, tagged with the website
+    error = _site_error(website, e)
+    detail = error.detail if isinstance(error.detail, dict) else {"error": "UPSTREAM_ERROR", "message": error.detail}
+    return {"source": website, "status": error.status_code, **detail}
+
+
+@deals_router.post("/aggregate", response_model=AggregatedDealsResponse)
+async def get_aggregated_deals(payload: AggregatedDealsRequest, request: Request):
+    """
+    Deals of several websites at once, each website fetched concurrently and every deal tagged
+    with its source. With stream=true the deals are sent as NDJSON as each website answers;
+    otherwise they are merged in request order. A failing website is reported in errors (or as
+    an error line) instead of failing the others.
+    """
+    websites = [site.website for site in payload.sites]
+    if len(set(websites)) != len(websites):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Each website can only be listed once"
+        )
+    for website in websites:
+        try:
+            site_registry.get(website)
+        except ValueError as e:
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail={
-                    "error": "UNAUTHORIZED", 
-                    "message": "Your session has expired. Please log in again."
-                }
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
             )
+    
+    #a website whose session is already known to be invalid fails without an upstream call
+    credentials: List[Tuple[str, str]] = []
+    failed: Dict[str, Exception] = {}
+    for site in payload.sites:
+        try:
+            credentials.append((site.website, session_store.resolve_token(site.website, site.token, site.session_id)))
+        except ValueError as e:
+            failed[site.website] = e
+    
+    if payload.stream:
+        async def stream_lines():
+            for website, e in failed.items():
+                yield dumps(_site_error_item(website, e)) + b"\n"
+            async for website, deals, e in iter_sites_deals(credentials, payload.cache_control):
+                if e is not None:
+                    yield dumps(_site_error_item(website, e)) + b"\n"
+                    continue
+                for deal in deals:
+                    yield dumps({**to_dict(deal), "source": website}) + b"\n"
+        
+        return StreamingResponse(stream_lines(), media_type="application/x-ndjson")
+    
+    results: Dict[str, list] = {}
+    async for website, deals, e in iter_sites_deals(credentials, payload.cache_control):
+        if e is not None:
+            failed[website] = e
         else:
-            # handle other authentication/authorization errors
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=f"Token validation failed: {str(e)}"
-            )
+            results[website] = deals
+    
+    if not results:
+        #no website answered: fail like a single-website listing would, with the first website's error
+        raise _site_error(websites[0], failed[websites[0]])
+    
+    deals = [
+        {**to_dict(deal), "source": website}
+        for website in websites if website in results
+        for deal in results[website]
+    ]
+    return json_response(request, {
+        "deals": deals,
+        "total": len(deals),
+        "next_cursor": None,
+        "errors": [_site_error_item(website, failed[website]) for website in websites if website in failed]
+    })
+
+
+@deals_router.post("/filters", response_model=DealsFiltersResponse)
+async def get_deals_filters(payload: DealsRequest):
+    """Filter facets (value counts per field), precomputed by the same index /list queries"""
+    try:
+        token = session_store.resolve_token(payload.website, payload.token, payload.session_id)
+        deals_data = await fetch_deals(payload.website, token, payload.cache_control)
+        index = get_index(payload.website, token, deals_data or [])
+        return DealsFiltersResponse(facets=index.facets)
+    
+    except ValueError as e:
+        raise _session_error(e)
+    except UpstreamUnavailableError as e:
+        raise _unavailable_error(e)
+    except UpstreamFetchError as e:
+        raise _fetch_error(e)
     except Exception as e:
-        #handle unexpected errors
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error fetching deals: {str(e)}"
         )
 
 
+@deals_router.get("/search", response_model=SearchResponse)
+async def search_deals(
+    website: str,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, gt=0, le=100),
+    authorization: Optional[str] = Header(None),
+    x_session_id: Optional[str] = Header(None)
+):
+    """Search deal titles, firms and file names (prefix and typo-tolerant)"""
+    try:
+        token = session_store.resolve_token(website, _bearer_token(authorization), x_session_id)
+        scope = user_key(website, token)
+        
+        #the index fills as deals and files are fetched; load the deals on a cold start
+        if not search_index.has_deals(scope):
+            await fetch_deals(website, token)
+        
+        hits = search_index.search(scope, q, limit)
+        return SearchResponse(
+            results=[SearchHit(**vars(hit)) for hit in hits],
+            total=len(hits)
+        )
+    
+    except ValueError as e:
+        raise _session_error(e)
+    except UpstreamUnavailableError as e:
+        raise _unavailable_error(e)
+    except UpstreamFetchError as e:
+        raise _fetch_error(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error searching deals: {str(e)}"
+        )
+
+
+@deals_router.post("/sync", response_model=DealsSyncResponse)
+async def sync_deals(payload: DealsSyncRequest, request: Request):
+    """Return only the deals added, changed or removed since the client's cursor (304 when nothing changed)"""
+    try:
+        token = session_store.resolve_token(payload.website, payload.token, payload.session_id)
+        deals_data = await fetch_deals(payload.website, token, payload.cache_control)
+    except ValueError as e:
+        raise _session_error(e)
+    except UpstreamUnavailableError as e:
+        raise _unavailable_error(e)
+    except UpstreamFetchError as e:
+        raise _fetch_error(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching deals: {str(e)}"
+        )
+    
+    #a failed fetch raised above, so an empty listing is real and recorded like any other
+    key = user_key(payload.website, token)
+    snapshot, _ = sync_store.record(key, deals_data)
+    
+    #the cursor doubles as an ETag, so If-None-Match works as well as sync_cursor
+    since_cursor = payload.sync_cursor or request.headers.get("If-None-Match", "").replace("W/", "").strip('"') or None
+    etag = {"ETag": f'"{snapshot.cursor}"'}
+    if since_cursor == snapshot.cursor:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag)
+    
+    delta = sync_store.diff(key, since_cursor, snapshot)
+    return json_response(request, {
+        "cursor": delta.cursor,
+        "full": delta.full,
+        "added": delta.added,
+        "changed": delta.changed,
+        "removed": delta.removed,
+        "total": len(snapshot.fingerprints)
+    }, headers=etag)
+
+
 @deals_router.post("/{deal_id}/files", response_model=FilesResponse)
-async def get_deal_files(deal_id: int, payload: FilesRequest):
+async def get_deal_files(deal_id: int, payload: FilesRequest, request: Request):
     """Fetch files for a specific deal using authentication token"""
     try:
         #validate that deal_id matches the payload
@@ -69,41 +393,140 @@ async def get_deal_files(deal_id: int, payload: FilesRequest):
                 detail="Deal ID in URL doesn't match request payload"
             )
         
+        token = session_store.resolve_token(payload.website, payload.token, payload.session_id)
+        
         #fetch files data from the API
-        result = download_deal_files(payload.website, payload.token, payload.deal_id)
+        result = await download_deal_files(payload.website, token, payload.deal_id, payload.cache_control)
         
-        return FilesResponse(**result)
+        return json_response(request, result)
         
+    except HTTPException:
+        raise
     except ValueError as e:
-        error_message = str(e)
-        
-        if error_message == "SESSION_CONFLICT":
-            # handle session conflict (409) - user logged in from another device
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail={
-                    "error": "SESSION_CONFLICT",
-                    "message": "Your session has been terminated because you logged in from another device. Please log in again."
-                }
-            )
-        elif error_message == "UNAUTHORIZED":
-            # handle unauthorized (401) - token invalid or expired
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail={
-                    "error": "UNAUTHORIZED", 
-                    "message": "Your session has expired. Please log in again."
-                }
-            )
-        else:
-            # handle other authentication/authorization errors
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=f"Token validation failed: {str(e)}"
-            )
+        raise _session_error(e)
+    except UpstreamUnavailableError as e:
+        raise _unavailable_error(e)
     except Exception as e:
         #handle unexpected errors
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error fetching files: {str(e)}"
-        ) 
\ No newline at end of file
+        ) 
+
+
+@deals_router.post("/files/batch", response_class=StreamingResponse)
+async def get_batch_files(payload: BatchFilesRequest):
+    """Fetch files for many deals, streamed back as NDJSON (one BatchFilesItem per line) as each completes"""
+    try:
+        site_registry.get(payload.website)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    try:
+        token = session_store.resolve_token(payload.website, payload.token, payload.session_id)
+    except ValueError as e:
+        raise _session_error(e)
+    
+    #drop duplicates but keep the requested order
+    deal_ids = list(dict.fromkeys(payload.deal_ids))
+    if len(deal_ids) > config.BATCH_FILES_MAX_DEALS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many deals in one batch (max {config.BATCH_FILES_MAX_DEALS})"
+        )
+    
+    async def stream_lines():
+        async for deal_id, result in iter_deal_files(payload.website, token, deal_ids, payload.cache_control):
+            yield dumps({**result, "deal_id": deal_id}) + b"\n"
+    
+    return StreamingResponse(stream_lines(), media_type="application/x-ndjson")
+
+
+@deals_router.get("/{deal_id}/files/archive")
+async def get_deal_files_archive(
+    deal_id: int,
+    website: str,
+    authorization: Optional[str] = Header(None),
+    x_session_id: Optional[str] = Header(None)
+):
+    """Download every file of a deal as one ZIP, streamed while the files download"""
+    try:
+        token = session_store.resolve_token(website, _bearer_token(authorization), x_session_id)
+        result = await download_deal_files(website, token, deal_id)
+    except ValueError as e:
+        raise _session_error(e)
+    except UpstreamUnavailableError as e:
+        raise _unavailable_error(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Error fetching files: {str(e)}"
+        )
+    
+    if result.get("error"):
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=result["error"]
+        )
+    if not result["files"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="This deal has no files"
+        )
+    
+    return StreamingResponse(
+        stream_deal_archive(website, token, result["files"]),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="deal_{deal_id}_files.zip"'}
+    )
+
+
+@deals_router.get("/{deal_id}/files/{file_id}/content")
+async def get_deal_file_content(
+    deal_id: int,
+    file_id: str,
+    website: str,
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    x_session_id: Optional[str] = Header(None)
+):
+    """Stream one file's bytes from the upstream, forwarding Range and conditional headers"""
+    try:
+        token = session_store.resolve_token(website, _bearer_token(authorization), x_session_id)
+        file_info, upstream = await open_deal_file(website, token, deal_id, file_id, request.headers)
+    except ValueError as e:
+        raise _session_error(e)
+    except UpstreamUnavailableError as e:
+        raise _unavailable_error(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Error fetching file: {str(e)}"
+        )
+    
+    headers = {name: upstream.headers[name] for name in FILE_RESPONSE_HEADERS if name in upstream.headers}
+    if "Content-Disposition" not in headers:
+        filename = (file_info.name or "download").replace('"', "")
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    
+    if upstream.status_code == status.HTTP_304_NOT_MODIFIED:
+        await upstream.aclose()
+        return Response(status_code=upstream.status_code, headers=headers)
+    
+    async def stream_body():
+        #raw chunks: no decoding and never more than one chunk held in memory
+        try:
+            async for chunk in upstream.aiter_raw(config.FILE_STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            await upstream.aclose()
+    
+    return StreamingResponse(
+        stream_body(),
+        status_code=upstream.status_code,
+        headers=headers,
+        background=BackgroundTask(upstream.aclose)
+    )
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from services.metrics import registry
+
+metrics_router = APIRouter(tags=["Metrics"])
+
+
+@metrics_router.get("", response_class=PlainTextResponse)
+async def get_metrics():
+    #expose upstream, fetch stage and route metrics in the Prometheus text format
+    return PlainTextResponse(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
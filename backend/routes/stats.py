@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+from services.http_client import get_pool_stats
+from services.cache import get_cache_stats
+from services.scraper import upstream_calls
+from services.sessions import session_store
+from services.retry import get_retry_stats
+from services.admission import get_admission_stats
+from services.log import get_log_stats
+from services.sync import sync_store
+from services.prefetch import prefetcher
+from services.search import search_index
+from services.snapshots import snapshot_store
+
+stats_router = APIRouter(tags=["Stats"])
+
+
+@stats_router.get("")
+async def get_stats():
+    #expose runtime counters for the upstream pools, cache, call coalescing, sessions, retries, admission, logging, sync, prefetch, search and snapshots
+    return {
+        "http_pool": get_pool_stats(),
+        "cache": get_cache_stats(),
+        "single_flight": upstream_calls.get_stats(),
+        "sessions": session_store.get_stats(),
+        "retry": get_retry_stats(),
+        "admission": get_admission_stats(),
+        "logging": get_log_stats(),
+        "sync": sync_store.get_stats(),
+        "prefetch": prefetcher.get_stats(),
+        "search": search_index.get_stats(),
+        "snapshots": snapshot_store.get_stats()
+    }
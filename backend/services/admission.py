@@ -0,0 +1,260 @@
+"""Admission control for upstream calls: token-bucket rate limits and bounded concurrency per website and endpoint"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from config import config
+from services.retry import UpstreamUnavailableError
+from services.sites import Limits, site_registry
+
+
+#queued calls are admitted in priority order, then first come first served
+INTERACTIVE = 0
+BACKGROUND = 1
+
+#priority of the upstream calls made from the current context; prefetch and background refreshes lower it
+request_priority: ContextVar[int] = ContextVar("request_priority", default=INTERACTIVE)
+
+
+class SharedPriority:
+    """The priority of every upstream call of one coalesced flight, raised when a more urgent caller joins it"""
+    __slots__ = ("value",)
+
+    def __init__(self, value: int):
+        self.value = value
+
+
+#set inside a single-flight call; wins over request_priority
+shared_priority: ContextVar[Optional[SharedPriority]] = ContextVar("shared_priority", default=None)
+
+
+def current_priority() -> int:
+    shared = shared_priority.get()
+    return shared.value if shared is not None else request_priority.get()
+
+
+def raise_priority(shared: SharedPriority, priority: int) -> None:
+    #move the flight's calls that are already queued up to their new place
+    if priority >= shared.value:
+        return
+    shared.value = priority
+    for gate in _gates.values():
+        gate.reprioritize(shared)
+
+
+class UpstreamBusyError(UpstreamUnavailableError):
+    #the call was not admitted: 429 when the rate limit alone rules it out, 503 when the queue is full or timed out
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Gate:
+    """
+    A token bucket (rate, burst) and a concurrency limit in front of one upstream target.
+    Calls that cannot start right away wait in a priority queue, each until its deadline.
+    """
+
+    def __init__(self, name: str, limits: Limits, max_queue: int):
+        self.name = name
+        self.rate = limits.rate
+        self.burst = max(limits.burst, 1.0)
+        self.concurrency = limits.concurrency
+        self.max_queue = max_queue
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.in_use = 0
+        #heap of [priority, seq, future, shared priority or None]; entries whose future is done are dropped lazily
+        self._queue: List[list] = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats: Dict[str, int] = {
+            "admitted": 0,
+            "queued": 0,
+            "rate_limited": 0,
+            "rejected": 0,
+            "timed_out": 0
+        }
+
+    async def acquire(self, priority: int, timeout: float) -> None:
+        self._refill()
+        if not self._queued and self._can_start():
+            self._start()
+            return
+
+        if self._queued >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise UpstreamBusyError(f"{self.name} is busy, please try again shortly", 503, 1)
+
+        #fail fast when the tokens alone cannot arrive before the deadline
+        if self.rate > 0:
+            token_wait = (self._queued + 1 - self.tokens) / self.rate
+            if token_wait > timeout:
+                self.stats["rate_limited"] += 1
+                raise UpstreamBusyError(f"Too many requests to {self.name}, please slow down", 429, math.ceil(token_wait))
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, [priority, next(self._seq), future, shared_priority.get()])
+        self._queued += 1
+        self.stats["queued"] += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._queued -= 1
+            self.stats["timed_out"] += 1
+            raise UpstreamBusyError(f"{self.name} is busy, please try again shortly", 503, math.ceil(timeout))
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                #admitted just as the caller went away: hand the slot back
+                self.release()
+            else:
+                self._queued -= 1
+            raise
+
+    def release(self) -> None:
+        self.in_use -= 1
+        self._dispatch()
+
+    def reprioritize(self, shared: SharedPriority) -> None:
+        changed = False
+        for entry in self._queue:
+            if entry[3] is shared and entry[0] != shared.value:
+                entry[0] = shared.value
+                changed = True
+        if changed:
+            heapq.heapify(self._queue)
+
+    def _refill(self) -> None:
+        if self.rate > 0:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def _can_start(self) -> bool:
+        return self.in_use < self.concurrency and (self.rate <= 0 or self.tokens >= 1)
+
+    def _start(self) -> None:
+        self.in_use += 1
+        if self.rate > 0:
+            self.tokens -= 1
+        self.stats["admitted"] += 1
+
+    def _dispatch(self) -> None:
+        #admit queued calls while slots and tokens last; wake up again when the next token is due
+        self._refill()
+        while self._queue and self._can_start():
+            future = heapq.heappop(self._queue)[2]
+            if future.done():
+                continue
+            self._queued -= 1
+            self._start()
+            future.set_result(None)
+        while self._queue and self._queue[0][2].done():
+            heapq.heappop(self._queue)
+
+        if self._queue and self.in_use < self.concurrency and self.rate > 0 and self._timer is None:
+            delay = (1 - self.tokens) / self.rate
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def get_stats(self) -> Dict[str, object]:
+        return {**self.stats, "in_use": self.in_use, "waiting": self._queued}
+
+
+#gates of a website beside its own and its UPSTREAM_ENDPOINTS': its external file storage (named like the
+#storage circuit breaker), and the download bodies open on either, which are read at the client's pace
+STORAGE = "storage"
+BODIES = "bodies"
+STORAGE_BODIES = "storage bodies"
+
+_gates: Dict[Tuple[str, Optional[str]], Gate] = {}
+
+
+def _get_gate(website: str, endpoint: Optional[str]) -> Gate:
+    gate = _gates.get((website, endpoint))
+    if gate is None:
+        site = site_registry.get(website)
+        if endpoint is None:
+            limits, name = site.limits, website
+        elif endpoint == STORAGE:
+            limits, name = site.storage_limits, f"{website}-storage"
+        elif endpoint in (BODIES, STORAGE_BODIES):
+            limits = Limits(rate=0, burst=1, concurrency=config.DOWNLOAD_MAX_OPEN_BODIES)
+            name = f"{website}-storage bodies" if endpoint == STORAGE_BODIES else f"{website} bodies"
+        else:
+            limits, name = site.endpoint_limits[endpoint], f"{website} {endpoint}"
+        gate = _gates[(website, endpoint)] = Gate(name, limits, config.ADMISSION_MAX_QUEUE)
+    return gate
+
+
+def _timeout() -> Tuple[int, float]:
+    priority = current_priority()
+    return priority, config.ADMISSION_INTERACTIVE_TIMEOUT if priority == INTERACTIVE else config.ADMISSION_BACKGROUND_TIMEOUT
+
+
+async def acquire(website: str, endpoint: str, external: bool = False) -> None:
+    """
+    Wait for the endpoint's and then the website's gate, in the context's priority order; a call to
+    external storage (external=True) waits for the website's storage gate alone.
+    Raises UpstreamBusyError when a gate cannot admit the call before the queue deadline.
+    Every successful acquire must be paired with a release.
+    """
+    if not config.ADMISSION_ENABLED:
+        return
+    priority, timeout = _timeout()
+    if external:
+        await _get_gate(website, STORAGE).acquire(priority, timeout)
+        return
+    deadline = time.monotonic() + timeout
+
+    endpoint_gate = _get_gate(website, endpoint)
+    await endpoint_gate.acquire(priority, timeout)
+    try:
+        await _get_gate(website, None).acquire(priority, max(deadline - time.monotonic(), 0.0))
+    except BaseException:
+        endpoint_gate.release()
+        raise
+
+
+def release(website: str, endpoint: str, external: bool = False) -> None:
+    if not config.ADMISSION_ENABLED:
+        return
+    if external:
+        _get_gate(website, STORAGE).release()
+        return
+    _get_gate(website, None).release()
+    _get_gate(website, endpoint).release()
+
+
+async def acquire_body(website: str, external: bool = False) -> None:
+    """
+    Wait for room for one more download body streaming to a client. The body holds this slot until it
+    is closed, while the call slot is freed once the headers arrived: slow clients use up download
+    bodies, never the capacity of the upstream calls. Pair with release_body.
+    """
+    if not config.ADMISSION_ENABLED:
+        return
+    priority, timeout = _timeout()
+    await _get_gate(website, STORAGE_BODIES if external else BODIES).acquire(priority, timeout)
+
+
+def release_body(website: str, external: bool = False) -> None:
+    if not config.ADMISSION_ENABLED:
+        return
+    _get_gate(website, STORAGE_BODIES if external else BODIES).release()
+
+
+def get_admission_stats() -> Dict[str, object]:
+    if not config.ADMISSION_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **{gate.name: gate.get_stats() for gate in _gates.values()}}
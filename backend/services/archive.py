@@ -0,0 +1,133 @@
+"""Streaming ZIP archive of a deal's files, built while the files download"""
+
+import asyncio
+import io
+import time
+import zipfile
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from config import config
+from services.scraper import open_file
+from services.records import FileRecord
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, non-seekable target for ZipFile; the bytes are drained after each write.
+
+    Because it is not seekable, ZipFile writes sizes and CRCs in data
+    descriptors after each entry instead of seeking back into the archive.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+#marks the end of one file's chunk queue
+_END_OF_FILE = None
+
+
+async def stream_deal_archive(website: str, token: str, files: List[FileRecord]) -> AsyncIterator[bytes]:
+    """
+    Yield a ZIP archive of the given files (as returned by download_deal_files).
+
+    Up to ZIP_DOWNLOAD_CONCURRENCY files download at once. Entries are written
+    in the order the downloads start answering, so the first bytes go out as
+    soon as the first file arrives. Each download buffers at most
+    ZIP_BUFFER_CHUNKS chunks before it waits for the writer, so memory stays
+    bounded whatever the file sizes. Files that fail are listed in _errors.txt
+    at the end of the archive.
+    """
+    semaphore = asyncio.Semaphore(config.ZIP_DOWNLOAD_CONCURRENCY)
+    #(file_info, chunk queue or None, error or None), in order of arrival
+    ready: "asyncio.Queue[Tuple[FileRecord, Optional[asyncio.Queue], Optional[str]]]" = asyncio.Queue()
+
+    async def download(file_info: FileRecord) -> None:
+        async with semaphore:
+            try:
+                response = await open_file(website, token, file_info, {})
+            except Exception as e:
+                await ready.put((file_info, None, str(e)))
+                return
+
+            chunks: asyncio.Queue = asyncio.Queue(maxsize=config.ZIP_BUFFER_CHUNKS)
+            await ready.put((file_info, chunks, None))
+            try:
+                async for chunk in response.aiter_bytes(config.FILE_STREAM_CHUNK_SIZE):
+                    await chunks.put(chunk)
+                await chunks.put(_END_OF_FILE)
+            except Exception as e:
+                await chunks.put(e)
+            finally:
+                await response.aclose()
+
+    workers = [asyncio.ensure_future(download(file_info)) for file_info in files]
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True)
+    used_names: Dict[str, int] = {}
+    failures: List[str] = []
+
+    try:
+        for _ in range(len(files)):
+            file_info, chunks, error = await ready.get()
+            name = _unique_name(file_info, used_names)
+            if chunks is None:
+                failures.append(f"{name}: {error}")
+                continue
+
+            entry = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            with archive.open(entry, mode="w", force_zip64=True) as destination:
+                while True:
+                    chunk = await chunks.get()
+                    if chunk is _END_OF_FILE:
+                        break
+                    if isinstance(chunk, Exception):
+                        failures.append(f"{name}: incomplete, download failed ({chunk})")
+                        break
+                    destination.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+
+        if failures:
+            archive.writestr("_errors.txt", "\n".join(failures) + "\n")
+        archive.close()
+        yield sink.drain()
+    finally:
+        #stop downloads still running if the client went away
+        for worker in workers:
+            worker.cancel()
+
+
+def _unique_name(file_info: FileRecord, used_names: Dict[str, int]) -> str:
+    #archive entry name from the file name, made safe and unique within the archive
+    name = str(file_info.name or f"file_{file_info.id}")
+    name = name.replace("\\", "_").replace("/", "_").lstrip(".") or f"file_{file_info.id}"
+
+    count = used_names.get(name, 0)
+    used_names[name] = count + 1
+    if count == 0:
+        return name
+
+    stem, dot, extension = name.rpartition(".")
+    if not dot:
+        return f"{name} ({count})"
+    return f"{stem} ({count}).{extension}"
@@ -0,0 +1,227 @@
+"""Per-token TTL cache for upstream deals and files responses"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from config import config
+from services.serialization import dumps
+
+
+#cache-control values accepted on DealsRequest / FilesRequest
+NO_CACHE = "no-cache"  #skip the cached copy but store the fresh response
+NO_STORE = "no-store"  #neither read nor write the cache
+
+
+def token_hash(token: str) -> str:
+    #tokens are never stored in keys, only a short digest of them
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+def make_key(website: str, token: str, endpoint: str, deal_id: Optional[int] = None) -> str:
+    #key layout: website:token_hash:endpoint:deal_id
+    return f"{token_prefix(website, token)}{endpoint}:{'' if deal_id is None else deal_id}"
+
+
+def token_prefix(website: str, token: str) -> str:
+    #prefix shared by every key of one (website, token) pair
+    return f"{website}:{token_hash(token)}:"
+
+
+def should_read(cache_control: Optional[str]) -> bool:
+    return cache_control not in (NO_CACHE, NO_STORE)
+
+
+def should_write(cache_control: Optional[str]) -> bool:
+    return cache_control != NO_STORE
+
+
+class CacheBackend:
+    """Interface shared by the cache backends"""
+
+    def __init__(self):
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "invalidations": 0
+        }
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        raise NotImplementedError
+
+    async def invalidate_prefix(self, prefix: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+
+#records encoded to estimate the size of a long listing
+SIZE_SAMPLE = 64
+
+
+def _entry_size(value: Any) -> int:
+    #approximate encoded size; long record lists are sized from a sample instead of being encoded in full
+    if isinstance(value, list) and len(value) > SIZE_SAMPLE:
+        return len(dumps(value[:SIZE_SAMPLE])) * len(value) // SIZE_SAMPLE
+    return len(dumps(value))
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache bounded by the approximate JSON size of its values"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        #key -> (expires_at, size, value), ordered from least to most recently used
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        expires_at, size, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return value
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        size = _entry_size(value)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self.used_bytes += size
+        self.stats["sets"] += 1
+
+        #evict least recently used entries until the memory bound holds again
+        while self.used_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.stats["evictions"] += 1
+
+    async def invalidate_prefix(self, prefix: str) -> None:
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            self._remove(key)
+            self.stats["invalidations"] += 1
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.used_bytes -= size
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "backend": "memory",
+            "entries": len(self._entries),
+            "used_bytes": self.used_bytes,
+            "max_bytes": self.max_bytes
+        }
+
+
+class RedisCache(CacheBackend):
+    """Cache shared by several workers through a Redis-compatible store.
+
+    The memory bound and LRU eviction are delegated to the server
+    (maxmemory + allkeys-lru); TTLs are set per key.
+    """
+
+    KEY_NAMESPACE = "altius:cache:"
+
+    def __init__(self, url: str):
+        super().__init__()
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self._redis = redis_asyncio.from_url(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._redis.get(self.KEY_NAMESPACE + key)
+        if raw is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        await self._redis.set(self.KEY_NAMESPACE + key, dumps(value), ex=ttl)
+        self.stats["sets"] += 1
+
+    async def invalidate_prefix(self, prefix: str) -> None:
+        async for key in self._redis.scan_iter(match=f"{self.KEY_NAMESPACE}{prefix}*"):
+            await self._redis.delete(key)
+            self.stats["invalidations"] += 1
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "backend": "redis"}
+
+
+_cache: Optional[CacheBackend] = None
+
+
+def get_cache() -> CacheBackend:
+    #return the configured cache backend, creating it on first use
+    global _cache
+    if _cache is None:
+        if config.CACHE_BACKEND == "redis":
+            _cache = RedisCache(config.CACHE_REDIS_URL)
+        elif config.CACHE_BACKEND == "memory":
+            _cache = MemoryCache(config.CACHE_MAX_BYTES)
+        else:
+            raise ValueError(f"Unsupported cache backend: {config.CACHE_BACKEND}. Supported: ['memory', 'redis']")
+    return _cache
+
+
+async def close_cache() -> None:
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
+
+
+async def lookup(website: str, token: str, endpoint: str, deal_id: Optional[int] = None) -> Optional[Any]:
+    if not config.CACHE_ENABLED:
+        return None
+    return await get_cache().get(make_key(website, token, endpoint, deal_id))
+
+
+async def store(website: str, token: str, endpoint: str, value: Any, deal_id: Optional[int] = None) -> None:
+    if not config.CACHE_ENABLED:
+        return
+    await get_cache().set(make_key(website, token, endpoint, deal_id), value, config.CACHE_TTL)
+
+
+async def invalidate_token(website: str, token: str) -> None:
+    #drop everything cached for a token once the upstream rejected it (401/409)
+    if not config.CACHE_ENABLED:
+        return
+    await get_cache().invalidate_prefix(token_prefix(website, token))
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    if not config.CACHE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **get_cache().get_stats()}
@@ -0,0 +1,122 @@
+"""In-memory index over parsed deals: filtering, sorting, cursor pagination and facets"""
+
+import base64
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from config import config
+from services.cache import token_prefix
+from services.records import DealRecord
+
+
+#fields that can be filtered on, and that facets are counted for
+FACET_FIELDS = ("asset_class", "deal_status", "currency", "firm")
+
+#fields that can be sorted on
+SORT_FIELDS = ("id", "title", "created_at") + FACET_FIELDS
+
+
+class DealIndex:
+    """
+    Built once per deals snapshot. Keeps, for every facet field, the positions of the
+    deals holding each value, plus facet counts; sort orders are computed on first use.
+    """
+
+    def __init__(self, deals: List[DealRecord]):
+        self.deals = deals
+        #field -> casefolded value -> sorted positions in self.deals
+        self._postings: Dict[str, Dict[str, List[int]]] = {name: {} for name in FACET_FIELDS}
+        #field -> display value -> count
+        self.facets: Dict[str, Dict[str, int]] = {name: {} for name in FACET_FIELDS}
+        self._orders: Dict[str, List[int]] = {}
+
+        for position, deal in enumerate(deals):
+            for name in FACET_FIELDS:
+                value = str(getattr(deal, name) or "")
+                self._postings[name].setdefault(value.casefold(), []).append(position)
+                self.facets[name][value] = self.facets[name].get(value, 0) + 1
+
+    def query(
+        self,
+        filters: Dict[str, Optional[List[str]]],
+        sort: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Tuple[List[DealRecord], int, Optional[int]]:
+        """Return (page of deals, total matching, offset of the next page or None)"""
+        matching = self._match(filters)
+
+        if sort:
+            order = self._order(sort)
+            positions = order if matching is None else [p for p in order if p in matching]
+        elif matching is None:
+            positions = range(len(self.deals))
+        else:
+            positions = sorted(matching)
+
+        total = len(positions)
+        end = total if limit is None else min(offset + limit, total)
+        page = [self.deals[p] for p in positions[offset:end]]
+        return page, total, (end if end < total else None)
+
+    def _match(self, filters: Dict[str, Optional[List[str]]]) -> Optional[set]:
+        #positions matching every filter (any of the values within one field); None = no filter
+        matching = None
+        for name, values in filters.items():
+            if not values:
+                continue
+            postings = self._postings[name]
+            field_matches = set()
+            for value in values:
+                field_matches.update(postings.get(value.casefold(), ()))
+            matching = field_matches if matching is None else matching & field_matches
+            if not matching:
+                return set()
+        return matching
+
+    def _order(self, sort: str) -> List[int]:
+        order = self._orders.get(sort)
+        if order is None:
+            name = sort.lstrip("-")
+
+            def sort_key(position: int):
+                value = getattr(self.deals[position], name)
+                return (value is None, value if isinstance(value, (int, float)) else str(value or "").casefold())
+
+            order = sorted(range(len(self.deals)), key=sort_key, reverse=sort.startswith("-"))
+            self._orders[sort] = order
+        return order
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(f"o:{offset}".encode("ascii")).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    #raises ValueError on a cursor this server did not issue
+    if not cursor:
+        return 0
+    decoded = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("ascii")
+    if not decoded.startswith("o:"):
+        raise ValueError("invalid cursor")
+    offset = int(decoded[2:])
+    if offset < 0:
+        raise ValueError("invalid cursor")
+    return offset
+
+
+#(website, token) prefix -> index of the deals snapshot it was built from
+_indexes: "OrderedDict[str, DealIndex]" = OrderedDict()
+
+
+def get_index(website: str, token: str, deals: List[DealRecord]) -> DealIndex:
+    """Return the index for this deals snapshot, rebuilding it only when the snapshot changed"""
+    key = token_prefix(website, token)
+    index = _indexes.get(key)
+    #cache hits hand back the very same list object, so identity tells whether the data changed
+    if index is None or index.deals is not deals:
+        index = DealIndex(deals)
+        _indexes[key] = index
+        while len(_indexes) > config.DEAL_INDEX_MAX_ENTRIES:
+            _indexes.popitem(last=False)
+    _indexes.move_to_end(key)
+    return index
@@ -0,0 +1,136 @@
+"""Pooled keep-alive HTTP clients, one per upstream website"""
+
+import httpx
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Dict, Any, Optional
+from config import config
+from services.sites import Site, site_registry
+
+
+#one client (and connection pool) per website, created at startup
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+#shared client for file downloads hosted outside the website APIs (e.g. signed storage URLs)
+_download_client: Optional[httpx.AsyncClient] = None
+
+_stats: Dict[str, int] = {
+    "pool_hits": 0,
+    "pool_misses": 0,
+    "requests": 0,
+    "new_connections": 0,
+    "reused_connections": 0
+}
+
+
+class _RejectAllCookies(DefaultCookiePolicy):
+    #clients are shared between users, so upstream cookies must never be persisted
+    def set_ok(self, cookie, request):
+        return False
+
+
+def _http2_supported() -> bool:
+    #http/2 needs the optional h2 package (installed with httpx[http2])
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _timeout(request_timeout: float, connect_timeout: float) -> httpx.Timeout:
+    #a short connect timeout lets a dead upstream fail fast instead of holding sockets for REQUEST_TIMEOUT
+    return httpx.Timeout(request_timeout, connect=connect_timeout)
+
+
+def _build_client(site: Site) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=site.pool_size,
+        max_keepalive_connections=min(config.HTTP_MAX_KEEPALIVE, site.pool_size),
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY
+    )
+    return httpx.AsyncClient(
+        base_url=site.base_url,
+        headers=site.headers,
+        cookies=CookieJar(policy=_RejectAllCookies()),
+        timeout=_timeout(site.request_timeout, site.connect_timeout),
+        limits=limits,
+        http2=config.HTTP2_ENABLED and _http2_supported()
+    )
+
+
+async def init_clients() -> None:
+    #create the connection pools for every registered site
+    for website in site_registry.names:
+        if website not in _clients:
+            _clients[website] = _build_client(site_registry.get(website))
+
+
+async def close_clients() -> None:
+    #close all pools and their keep-alive connections
+    global _download_client
+    clients = list(_clients.values())
+    _clients.clear()
+    if _download_client is not None:
+        clients.append(_download_client)
+        _download_client = None
+    for client in clients:
+        await client.aclose()
+
+
+def get_client(website: str) -> httpx.AsyncClient:
+    #return the pooled client for a website, creating it lazily if startup did not
+    client = _clients.get(website)
+    if client is not None:
+        _stats["pool_hits"] += 1
+        return client
+
+    #raises ValueError for unsupported websites
+    client = _build_client(site_registry.get(website))
+    _stats["pool_misses"] += 1
+    _clients[website] = client
+    return client
+
+
+def get_download_client() -> httpx.AsyncClient:
+    #return the pooled client used for files stored outside the website APIs
+    global _download_client
+    if _download_client is None:
+        _download_client = httpx.AsyncClient(
+            headers={"User-Agent": config.USER_AGENT},
+            cookies=CookieJar(policy=_RejectAllCookies()),
+            timeout=_timeout(config.REQUEST_TIMEOUT, config.HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=config.HTTP_POOL_SIZE,
+                max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY
+            ),
+            http2=config.HTTP2_ENABLED and _http2_supported(),
+            follow_redirects=True
+        )
+    return _download_client
+
+
+async def request(website: str, method: str, url: str, stream: bool = False, external: bool = False, follow_redirects: bool = False, **kwargs: Any) -> httpx.Response:
+    #send a request through the website pool (external=True: the download client) and track connection reuse;
+    #stream=True leaves the body unread
+    client = get_download_client() if external else get_client(website)
+    opened_connection = False
+
+    async def trace(event_name: str, info: Dict[str, Any]) -> None:
+        nonlocal opened_connection
+        if event_name == "connection.connect_tcp.started":
+            opened_connection = True
+
+    upstream_request = client.build_request(method, url, extensions={"trace": trace}, **kwargs)
+    response = await client.send(upstream_request, stream=stream, follow_redirects=follow_redirects)
+
+    _stats["requests"] += 1
+    if opened_connection:
+        _stats["new_connections"] += 1
+    else:
+        _stats["reused_connections"] += 1
+    return response
+
+
+def get_pool_stats() -> Dict[str, int]:
+    return dict(_stats)
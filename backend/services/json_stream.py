@@ -0,0 +1,104 @@
+"""Incremental parsing of upstream JSON payloads, record by record from the response stream"""
+
+import json
+from typing import Any, AsyncIterator, Dict, Tuple
+import httpx
+from config import config
+
+try:
+    import ijson
+except ImportError:  # optional, payloads are then parsed in one piece
+    ijson = None
+
+
+_START_EVENTS = ("start_map", "start_array")
+_END_EVENTS = ("end_map", "end_array")
+
+
+class _ResponseReader:
+    #the async file-like object ijson reads from
+    def __init__(self, response: httpx.Response):
+        self._chunks = response.aiter_bytes()
+
+    async def read(self, size: int = -1) -> bytes:
+        #ijson probes with read(0) before parsing; otherwise an empty read means end of body
+        if size == 0:
+            return b""
+        async for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b""
+
+
+class DataRecords:
+    """
+    Async iterator over the records of a payload's top-level "data" field, which may be a
+    list or an object keyed by id. Yields (key, record) with key None for list items.
+
+    With ijson installed, each record is built from the byte stream and handed over before
+    the next one is read, so the whole payload never exists as one object tree. Top-level
+    scalar fields (current_page, last_page, total, ...) are collected into `meta` as they go by.
+    """
+
+    def __init__(self, response: httpx.Response):
+        self._response = response
+        self.meta: Dict[str, Any] = {}
+        self.count = 0
+
+    def __aiter__(self) -> AsyncIterator[Tuple[Any, Any]]:
+        if ijson is not None and config.UPSTREAM_STREAM_PARSE:
+            return self._iter_stream()
+        return self._iter_buffered()
+
+    async def _iter_stream(self) -> AsyncIterator[Tuple[Any, Any]]:
+        in_data = False
+        is_map = False
+        depth = 0
+        key = None
+        builder = None
+
+        async for prefix, event, value in ijson.parse_async(_ResponseReader(self._response), use_float=True):
+            if not in_data:
+                if prefix == "data" and event in _START_EVENTS:
+                    in_data = True
+                    is_map = event == "start_map"
+                elif prefix and "." not in prefix and event not in _START_EVENTS + _END_EVENTS + ("map_key",):
+                    self.meta[prefix] = value
+                continue
+
+            if depth == 0:
+                if event in _END_EVENTS:
+                    in_data = False
+                elif event == "map_key":
+                    key = value
+                elif event in _START_EVENTS:
+                    builder = ijson.ObjectBuilder()
+                    builder.event(event, value)
+                    depth = 1
+                else:
+                    self.count += 1
+                    yield (key if is_map else None), value
+                continue
+
+            builder.event(event, value)
+            if event in _START_EVENTS:
+                depth += 1
+            elif event in _END_EVENTS:
+                depth -= 1
+                if depth == 0:
+                    self.count += 1
+                    yield (key if is_map else None), builder.value
+                    builder = None
+
+    async def _iter_buffered(self) -> AsyncIterator[Tuple[Any, Any]]:
+        payload = json.loads(await self._response.aread())
+        if not isinstance(payload, dict):
+            return
+        data = payload.pop("data", None)
+        self.meta = {name: value for name, value in payload.items() if not isinstance(value, (dict, list))}
+        del payload
+
+        items = data.items() if isinstance(data, dict) else ((None, item) for item in data or ())
+        for key, record in items:
+            self.count += 1
+            yield key, record
@@ -0,0 +1,216 @@
+"""Structured logging: records are queued by the caller and formatted and written by one background thread"""
+
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+from config import config
+
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+#id of the API request being handled, set by RequestIdMiddleware and inherited by the tasks it starts
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_stats: Dict[str, int] = {
+    "dropped": 0,
+    "sampled_out": 0
+}
+
+
+class Logger:
+    """
+    An event name plus key=value fields. Nothing is formatted on the calling side: a disabled
+    level costs one cached level check, an enabled one a queue put.
+    Field values should be scalars, they are read later on the writer thread.
+    """
+    __slots__ = ("_logger", "_seen")
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(f"altius.{name}")
+        #per event, how many sampled calls were made
+        self._seen: Dict[str, int] = {}
+
+    def is_enabled(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def debug(self, event: str, **fields: Any) -> None:
+        if self._logger.isEnabledFor(DEBUG):
+            self._log(DEBUG, event, fields)
+
+    def info(self, event: str, **fields: Any) -> None:
+        if self._logger.isEnabledFor(INFO):
+            self._log(INFO, event, fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        if self._logger.isEnabledFor(WARNING):
+            self._log(WARNING, event, fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        if self._logger.isEnabledFor(ERROR):
+            self._log(ERROR, event, fields)
+
+    def exception(self, event: str, **fields: Any) -> None:
+        #an error with the traceback of the exception being handled
+        if self._logger.isEnabledFor(ERROR):
+            self._log(ERROR, event, fields, exc_info=True)
+
+    def sampled(self, level: int, event: str, **fields: Any) -> None:
+        #high-volume events: one call in LOG_SAMPLE_EVERY is written, tagged with the rate
+        if not self._logger.isEnabledFor(level):
+            return
+        seen = self._seen[event] = self._seen.get(event, 0) + 1
+        if (seen - 1) % config.LOG_SAMPLE_EVERY:
+            _stats["sampled_out"] += 1
+            return
+        fields["sample_every"] = config.LOG_SAMPLE_EVERY
+        self._log(level, event, fields)
+
+    def _log(self, level: int, event: str, fields: Dict[str, Any], exc_info: bool = False) -> None:
+        self._logger.log(level, event, exc_info=exc_info, extra={"fields": fields, "request_id": request_id.get()})
+
+
+def get_logger(name: str) -> Logger:
+    return Logger(name)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread as they are; a full queue drops the record instead of waiting"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        #the stock handler formats the message here, on the event loop; only the traceback is rendered
+        #now, so the record does not keep the frames alive in the queue
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _stats["dropped"] += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, event, request_id and the event's fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": _timestamp(record),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage()
+        }
+        request = getattr(record, "request_id", None)
+        if request:
+            entry["request_id"] = request
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """logfmt-style lines: ts level logger event key=value ..."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        parts = [_timestamp(record), record.levelname.lower(), record.name, record.getMessage()]
+        request = getattr(record, "request_id", None)
+        if request:
+            parts.append(f"request_id={request}")
+        for name, value in getattr(record, "fields", {}).items():
+            value = str(value)
+            parts.append(f"{name}={json.dumps(value) if ' ' in value or not value else value}")
+        line = " ".join(parts)
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        return line
+
+
+def _timestamp(record: logging.LogRecord) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+
+
+def _configure() -> QueueListener:
+    root = logging.getLogger("altius")
+    root.setLevel(DEBUG if config.DEBUG_MODE else config.LOG_LEVEL.upper())
+    root.propagate = False
+    #per-call upstream traces have their own switch on top of DEBUG_MODE
+    if not config.LOG_API_REQUESTS:
+        logging.getLogger("altius.requests").setLevel(max(INFO, root.level))
+
+    records: queue.Queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    root.addHandler(_NonBlockingQueueHandler(records))
+
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(TextFormatter() if config.LOG_FORMAT == "text" else JsonFormatter())
+    listener = QueueListener(records, writer, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+#global log writer (background thread)
+_listener = _configure()
+
+
+def start_logging() -> None:
+    #the writer runs from import; restart it when a previous shutdown stopped it
+    if _listener._thread is None:
+        _listener.start()
+
+
+def stop_logging() -> None:
+    #write out what is still queued and stop the writer thread
+    if _listener._thread is not None:
+        _listener.stop()
+
+
+atexit.register(stop_logging)
+
+
+def get_log_stats() -> Dict[str, int]:
+    return {**_stats, "queued": _listener.queue.qsize()}
+
+
+def _valid_request_id(value: str) -> bool:
+    return 0 < len(value) <= 64 and all(c.isalnum() or c in "-_." for c in value)
+
+
+class RequestIdMiddleware:
+    """ASGI middleware tagging each request (and every log record it produces) with an id, echoed in X-Request-ID"""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        #keep the caller's id (a proxy or the frontend) so logs line up across services
+        incoming = next((value for name, value in scope["headers"] if name == b"x-request-id"), b"").decode("latin-1")
+        current = incoming if _valid_request_id(incoming) else uuid.uuid4().hex
+        header = (REQUEST_ID_HEADER.lower().encode(), current.encode())
+
+        async def send_with_id(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), header]
+            await send(message)
+
+        reset = request_id.set(current)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(reset)
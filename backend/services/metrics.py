@@ -0,0 +1,108 @@
+"""Prometheus metrics: the app's metrics (prometheus_client) and the route timing middleware"""
+
+import time
+from typing import Any, Dict
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, disable_created_metrics
+
+
+#seconds; upstream calls and routes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+#bytes; upstream payloads
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KiB .. 256 MiB
+
+#global metrics registry; the app's metrics only, without the default process collectors
+registry = CollectorRegistry()
+#no *_created series: one more series per label set that nothing here reads
+disable_created_metrics()
+
+
+# ---------------------------------------- application metrics ----------------------------------------
+
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "upstream_request_seconds",
+    "Upstream call time until the response headers arrived, retries included",
+    ("website", "endpoint"),
+    buckets=LATENCY_BUCKETS,
+    registry=registry
+)
+UPSTREAM_RESPONSES = Counter(
+    "upstream_responses_total",
+    "Upstream responses by status code (error = no response: transport error or open circuit)",
+    ("website", "endpoint", "status"),
+    registry=registry
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "upstream_requests_in_flight",
+    "Upstream calls currently waiting for a response",
+    ("website", "endpoint"),
+    registry=registry
+)
+UPSTREAM_RESPONSE_BYTES = Histogram(
+    "upstream_response_bytes",
+    "Upstream response body size as downloaded",
+    ("website", "endpoint"),
+    buckets=SIZE_BUCKETS,
+    registry=registry
+)
+DEALS_FETCH_STAGE_SECONDS = Histogram(
+    "deals_fetch_stage_seconds",
+    "fetch_deals stages: list (STEP 1), cards (STEP 2, all pages), filter (STEP 3, incl. validation)",
+    ("website", "stage"),
+    buckets=LATENCY_BUCKETS,
+    registry=registry
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "API request time until the response body was sent",
+    ("method", "route", "status"),
+    buckets=LATENCY_BUCKETS,
+    registry=registry
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "API requests currently being handled",
+    registry=registry
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request, labelled by route template (not the raw path)"""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            HTTP_REQUEST_SECONDS.labels(scope["method"], _route_template(scope), status_code).observe(time.perf_counter() - start)
+
+
+def _route_template(scope: Dict[str, Any]) -> str:
+    #/deals/42/files -> /deals/{deal_id}/files, rebuilt from the path params the router matched;
+    #unmatched paths share one label so scanners cannot grow the label set
+    if scope.get("route") is None:
+        return "unmatched"
+    segments = scope["path"].split("/")
+    for name, value in scope.get("path_params", {}).items():
+        value = str(value)
+        for i, segment in enumerate(segments):
+            if segment == value:
+                segments[i] = "{" + name + "}"
+                break
+    return "/".join(segments)
@@ -0,0 +1,160 @@
+"""Background prefetch / refresh of deals and files for active sessions"""
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional, Tuple
+from config import config
+from services.scraper import fetch_deals, download_deal_files, SESSION_ERRORS
+from services.sessions import Session, is_idle, session_store
+from services import admission
+from services.log import get_logger
+
+
+log = get_logger("prefetch")
+
+
+#one unit of background work: ("deals", None) or ("files", deal_id)
+Unit = Tuple[str, Optional[int]]
+
+
+@dataclass
+class PrefetchJob:
+    """Warm-up and refresh state for one session"""
+    session_id: str
+    website: str
+    token: str
+    next_refresh: float
+    pending: Deque[Unit] = field(default_factory=deque)
+
+
+class PrefetchScheduler:
+    """
+    Warms the cache right after login, then refreshes it every PREFETCH_INTERVAL while the
+    session is in use; refreshes pause once it has been idle past UPSTREAM_SESSION_LIFETIME and
+    resume with the next request. Work is split into single upstream fetches ("units") and handed
+    out round-robin across sessions, so one large account cannot starve the others;
+    at most PREFETCH_CONCURRENCY units run at once across all users.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, PrefetchJob] = {}
+        #session ids with pending units, served round-robin
+        self._ready: Deque[str] = deque()
+        self._wakeup = asyncio.Event()
+        self._tasks: list = []
+        self.stats: Dict[str, int] = {
+            "units_run": 0,
+            "units_failed": 0,
+            "jobs_dropped": 0
+        }
+
+    def register(self, session: Session) -> None:
+        #schedule an immediate warm-up for a freshly logged-in session
+        if not config.PREFETCH_ENABLED:
+            return
+        self._jobs[session.session_id] = PrefetchJob(
+            session_id=session.session_id,
+            website=session.website,
+            token=session.token,
+            next_refresh=0.0
+        )
+
+    def start(self) -> None:
+        if not config.PREFETCH_ENABLED or self._tasks:
+            return
+        self._tasks.append(asyncio.ensure_future(self._schedule()))
+        for _ in range(config.PREFETCH_CONCURRENCY):
+            self._tasks.append(asyncio.ensure_future(self._work()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _schedule(self) -> None:
+        #queue a refresh for every active session that is due
+        while True:
+            now = time.time()
+            for session_id, job in list(self._jobs.items()):
+                session = session_store.get(session_id)
+                if session is None or session.error:
+                    self._drop(session_id)
+                    continue
+                if is_idle(session, now):
+                    continue
+                if job.next_refresh <= now and not job.pending:
+                    job.next_refresh = now + config.PREFETCH_INTERVAL
+                    self._enqueue(job, ("deals", None))
+            await asyncio.sleep(config.PREFETCH_TICK)
+
+    async def _work(self) -> None:
+        #queued upstream calls of users come first
+        admission.request_priority.set(admission.BACKGROUND)
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            #take one unit from the next session in line, then send that session to the back
+            session_id = self._ready.popleft()
+            job = self._jobs.get(session_id)
+            if job is None or not job.pending:
+                continue
+            unit = job.pending.popleft()
+            if job.pending:
+                self._ready.append(session_id)
+
+            await self._run_unit(job, unit)
+
+    async def _run_unit(self, job: PrefetchJob, unit: Unit) -> None:
+        kind, deal_id = unit
+        try:
+            #no-cache: always go to the upstream and store the fresh result
+            if kind == "deals":
+                deals = await fetch_deals(job.website, job.token, cache_control="no-cache")
+                for top_deal_id in _top_deal_ids(deals, config.PREFETCH_TOP_FILES):
+                    self._enqueue(job, ("files", top_deal_id))
+            else:
+                await download_deal_files(job.website, job.token, deal_id, cache_control="no-cache")
+            self.stats["units_run"] += 1
+        except ValueError as e:
+            self.stats["units_failed"] += 1
+            if str(e) in SESSION_ERRORS:
+                self._drop(job.session_id)
+        except Exception as e:
+            self.stats["units_failed"] += 1
+            log.warning("prefetch_failed", website=job.website, kind=kind, error=str(e))
+
+    def _enqueue(self, job: PrefetchJob, unit: Unit) -> None:
+        if job.session_id not in self._jobs:
+            return
+        if not job.pending:
+            self._ready.append(job.session_id)
+        job.pending.append(unit)
+        self._wakeup.set()
+
+    def _drop(self, session_id: str) -> None:
+        if self._jobs.pop(session_id, None) is not None:
+            self.stats["jobs_dropped"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": config.PREFETCH_ENABLED,
+            "sessions": len(self._jobs),
+            "queued_sessions": len(self._ready)
+        }
+
+
+def _top_deal_ids(deals: list, count: int) -> list:
+    #the most recently created deals are the ones users open first
+    ordered = sorted(deals, key=lambda deal: deal.created_at or "", reverse=True)
+    return [deal.id for deal in ordered[:count]]
+
+
+#global prefetch scheduler
+prefetcher = PrefetchScheduler()
@@ -0,0 +1,85 @@
+"""Compact in-memory records for parsed deals and files"""
+
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
+from pydantic import TypeAdapter
+
+
+#fields holding a handful of distinct values repeated across records; interned so records share one string
+DEAL_CATEGORICAL_FIELDS = ("firm", "asset_class", "deal_status", "currency")
+FILE_CATEGORICAL_FIELDS = ("type", "state")
+
+
+@dataclass(slots=True, kw_only=True)
+class DealRecord:
+    """A parsed deal, field for field the shape of models.Deal, without a per-record dict"""
+    id: int
+    title: str
+    created_at: str
+    firm: Optional[str] = ""
+    asset_class: Optional[str] = "General"
+    deal_status: Optional[str] = "Unknown"
+    currency: Optional[str] = "USD"
+    user_id: Optional[int] = 0
+    deal_capital_seeker_email: Optional[str] = ""
+
+
+@dataclass(slots=True, kw_only=True)
+class FileRecord:
+    """A parsed file, field for field the shape of models.FileInfo"""
+    id: Union[int, str]
+    name: str
+    size: int
+    url: str
+    type: Optional[str] = ""
+    download_url: str
+    created_at: Optional[str] = ""
+    state: Optional[str] = ""
+
+
+_deals_adapter = TypeAdapter(List[DealRecord])
+_files_adapter = TypeAdapter(List[FileRecord])
+
+
+def _intern(records: list, names: tuple) -> list:
+    for record in records:
+        for name in names:
+            value = getattr(record, name)
+            if type(value) is str:
+                setattr(record, name, sys.intern(value))
+    return records
+
+
+def validate_deals(deals: List[Dict[str, Any]]) -> List[DealRecord]:
+    #the single validation pass over parsed deals; the records returned are trusted from here on
+    return _intern(_deals_adapter.validate_python(deals), DEAL_CATEGORICAL_FIELDS)
+
+
+def validate_files(files: List[Dict[str, Any]]) -> List[FileRecord]:
+    #the single validation pass over parsed files
+    return _intern(_files_adapter.validate_python(files), FILE_CATEGORICAL_FIELDS)
+
+
+def as_deal_records(deals: list) -> List[DealRecord]:
+    #cache backends that store JSON (redis) hand back plain dicts; in-process values are returned as-is
+    if deals and isinstance(deals[0], dict):
+        return validate_deals(deals)
+    return deals
+
+
+def as_file_records(files: list) -> List[FileRecord]:
+    if files and isinstance(files[0], dict):
+        return validate_files(files)
+    return files
+
+
+def to_dict(record: Union[DealRecord, FileRecord]) -> Dict[str, Any]:
+    return {name: getattr(record, name) for name in record.__slots__}
+
+
+def json_default(value: Any) -> Any:
+    #json.dumps default: records become their dict form, anything else its string form
+    if isinstance(value, (DealRecord, FileRecord)):
+        return to_dict(value)
+    return str(value)
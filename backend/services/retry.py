@@ -0,0 +1,214 @@
+"""Retries with backoff and jitter, a retry budget and a circuit breaker per upstream website"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+import httpx
+from config import config
+from services.log import get_logger
+
+
+log = get_logger("retry")
+
+
+class UpstreamUnavailableError(Exception):
+    #the upstream is failing: circuit open, or retries exhausted on 5xx / transport errors
+    pass
+
+
+#transport errors raised before the request reached the upstream, safe to retry for any method
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How one upstream endpoint is retried"""
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+    #whether the request may be sent again after it reached the upstream
+    idempotent: bool
+    retry_statuses: tuple = (429, 500, 502, 503, 504)
+
+
+def _policy(idempotent: bool) -> RetryPolicy:
+    return RetryPolicy(
+        max_attempts=config.MAX_RETRIES + 1,
+        base_delay=config.RETRY_BASE_DELAY,
+        max_delay=config.RETRY_MAX_DELAY,
+        idempotent=idempotent
+    )
+
+
+#per-endpoint policies ("file": file content downloads); the deals-list / deals-cards POSTs only read data, so they are idempotent
+POLICIES: Dict[str, RetryPolicy] = {
+    "login": _policy(idempotent=False),
+    "list": _policy(idempotent=True),
+    "cards": _policy(idempotent=True),
+    "files": _policy(idempotent=True),
+    "file": _policy(idempotent=True)
+}
+
+
+class RetryBudget:
+    """Caps retries to a fraction of the traffic so retries cannot amplify an outage"""
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self) -> None:
+        #every first attempt earns a fraction of a retry
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """
+    Closed: requests flow. After CIRCUIT_FAILURE_THRESHOLD consecutive failures it opens
+    and requests fail fast for CIRCUIT_RECOVERY_TIMEOUT seconds. Then it is half-open:
+    one probe request goes through, and its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        #half-open: let exactly one probe through
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        #the probe ended without an outcome (e.g. the caller was cancelled)
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_budgets: Dict[str, RetryBudget] = {}
+_stats: Dict[str, int] = {
+    "retries": 0,
+    "budget_exhausted": 0,
+    "fail_fast": 0
+}
+
+
+def get_breaker(website: str) -> CircuitBreaker:
+    breaker = _breakers.get(website)
+    if breaker is None:
+        breaker = _breakers[website] = CircuitBreaker(config.CIRCUIT_FAILURE_THRESHOLD, config.CIRCUIT_RECOVERY_TIMEOUT)
+    return breaker
+
+
+def _get_budget(website: str) -> RetryBudget:
+    budget = _budgets.get(website)
+    if budget is None:
+        budget = _budgets[website] = RetryBudget(config.RETRY_BUDGET_RATIO, config.RETRY_BUDGET_MAX)
+    return budget
+
+
+def _backoff_delay(policy: RetryPolicy, attempt: int, response: Optional[httpx.Response] = None) -> float:
+    #honour a short numeric Retry-After, otherwise exponential backoff with full jitter
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit() and int(retry_after) <= policy.max_delay:
+            return float(retry_after)
+    return random.uniform(0, min(policy.max_delay, policy.base_delay * (2 ** (attempt - 1))))
+
+
+async def call_with_retry(website: str, endpoint: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+    """
+    Send an upstream request under the endpoint's retry policy and the website's circuit breaker.
+    Non-retryable responses (2xx, 4xx) are returned as-is for the caller to interpret.
+    Raises UpstreamUnavailableError when the circuit is open or retries are exhausted.
+    """
+    policy = POLICIES[endpoint]
+    breaker = get_breaker(website)
+    budget = _get_budget(website)
+    budget.deposit()
+    attempt = 0
+
+    while True:
+        if not breaker.allow():
+            _stats["fail_fast"] += 1
+            raise UpstreamUnavailableError(f"{website} is unavailable, please try again shortly")
+
+        attempt += 1
+        response = None
+        try:
+            response = await send()
+        except httpx.TransportError as e:
+            breaker.record_failure()
+            retryable = policy.idempotent or isinstance(e, NOT_SENT_ERRORS)
+            if not retryable or not _may_retry(policy, attempt, budget):
+                raise UpstreamUnavailableError(f"{website} did not respond: {type(e).__name__}") from e
+        except BaseException:
+            breaker.release_probe()
+            raise
+        else:
+            if response.status_code not in policy.retry_statuses:
+                breaker.record_success()
+                return response
+
+            breaker.record_failure()
+            #a streamed response holds its pooled connection until closed, whether or not it is retried
+            await response.aclose()
+            if not policy.idempotent or not _may_retry(policy, attempt, budget):
+                raise UpstreamUnavailableError(f"{website} answered with status {response.status_code}")
+
+        _stats["retries"] += 1
+        log.debug("upstream_retry", website=website, endpoint=endpoint, attempt=attempt + 1, max_attempts=policy.max_attempts)
+        await asyncio.sleep(_backoff_delay(policy, attempt, response))
+
+
+def _may_retry(policy: RetryPolicy, attempt: int, budget: RetryBudget) -> bool:
+    if attempt >= policy.max_attempts:
+        return False
+    if not budget.withdraw():
+        _stats["budget_exhausted"] += 1
+        return False
+    return True
+
+
+def get_retry_stats() -> Dict[str, object]:
+    return {
+        **_stats,
+        "circuits": {website: breaker.state for website, breaker in _breakers.items()}
+    }
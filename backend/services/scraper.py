@@ -1,220 +1,645 @@
 """Website scraper service for Altius Capital authentication and data fetching"""
 
-import requests
-from typing import List, Dict, Any
+import asyncio
+import time
+import httpx
+from collections import deque
+from typing import List, Dict, Any, Optional, Awaitable, AsyncIterator, Callable, Deque, Tuple
 from config import config
+from services import http_client, cache
+from services.singleflight import SingleFlight
+from services.sessions import session_store, user_key
+from services.search import search_index
+from services.retry import call_with_retry, UpstreamUnavailableError
+from services.records import DealRecord, FileRecord, validate_deals, validate_files, as_deal_records, as_file_records
+from services.json_stream import DataRecords
+from services.snapshots import snapshot_store
+from services.sites import Site, site_registry
+from services import metrics, admission
+from services.log import get_logger, DEBUG
+
+
+log = get_logger("scraper")
+#per-call upstream traces, switched by LOG_API_REQUESTS
+request_log = get_logger("requests")
+
+#upstream errors that mean the token itself is no longer usable
+SESSION_ERRORS = ("SESSION_CONFLICT", "UNAUTHORIZED")
+
+
+class UpstreamFetchError(RuntimeError):
+    """The upstream answered, but a fetch step failed (error status or unreadable payload)"""
+
+#identical concurrent upstream calls share one request
+upstream_calls = SingleFlight()
+
+#background refreshes of data served from a snapshot, by cache key
+_refreshes: Dict[str, asyncio.Task] = {}
+
+#client headers forwarded to the upstream when streaming file content
+FILE_FORWARD_HEADERS = ("Range", "If-Range", "If-None-Match", "If-Modified-Since")
+
+#upstream statuses passed straight through to the client when streaming file content
+FILE_PASSTHROUGH_STATUSES = (200, 206, 304, 416)
+
+#endpoints whose streamed bodies are read at the client's pace (file content, ZIP archive entries)
+CLIENT_PACED_ENDPOINTS = ("file",)
 
 
 
 
 #perform login and return authorization token
-def perform_login(website: str, username: str, password: str) -> str:
+async def perform_login(website: str, username: str, password: str) -> str:
     #authenticate user and return authorization token
-    login_url = config.get_endpoint_url(website, config.LOGIN_ENDPOINT)
-    headers = config.get_common_headers(website)
+    site = site_registry.get(website)
+    login_url = site.login_url
 
     login_data = {
         "email": username,
         "password": password
     }
 
-    if config.should_log_requests():
-        print(f"DEBUG: Login request to {login_url}")
+    request_log.debug("login_request", website=website, url=login_url)
 
     #api request to login and get token
-    response = requests.post(
-        login_url, 
-        json=login_data, 
-        headers=headers,
-        timeout=config.REQUEST_TIMEOUT
+    response = await _send(
+        website,
+        "login",
+        "POST",
+        login_url,
+        json=login_data
     )
     
     if response.status_code != 200:
-        if config.is_debug_enabled():
-            print(f"DEBUG: Login failed with status {response.status_code}")
+        log.debug("login_failed", website=website, status=response.status_code)
         raise ValueError("Invalid credentials or login failed")
 
     #extract token from cookies
-    token = response.cookies.get(config.TOKEN_COOKIE_NAME)
+    token = response.cookies.get(site.token_cookie)
     if not token:
-        if config.is_debug_enabled():
-            print("DEBUG: Authentication token not found in cookies")
+        log.debug("login_token_missing", website=website, cookie=site.token_cookie)
         raise ValueError("Authentication token not received")
 
-    if config.should_log_requests():
-        print("DEBUG: Login successful, token received")
+    request_log.debug("login_succeeded", website=website)
 
     return token
 
-def fetch_deals(website: str, token: str) -> List[Dict[str, Any]]:
+async def fetch_deals(website: str, token: str, cache_control: Optional[str] = None) -> List[DealRecord]:
+    #fetch deals through the per-token cache, then the on-disk snapshot (served while a refresh runs)
+    if cache.should_read(cache_control):
+        cached = await cache.lookup(website, token, "deals")
+        if cached is not None:
+            cached = as_deal_records(cached)
+            search_index.index_deals(user_key(website, token), cached)
+            return cached
+        
+        snapshot = await snapshot_store.load_deals(user_key(website, token))
+        if snapshot is not None:
+            search_index.index_deals(user_key(website, token), snapshot)
+            _refresh_in_background(cache.make_key(website, token, "deals"), lambda: _fetch_deals_fresh(website, token, None))
+            return snapshot
+    
+    return await _fetch_deals_fresh(website, token, cache_control)
+
+
+async def _fetch_deals_fresh(website: str, token: str, cache_control: Optional[str]) -> List[DealRecord]:
+    #joined callers share the flight's result and its single round of index, cache and snapshot writes
+    return await upstream_calls.do(
+        cache.make_key(website, token, "deals"),
+        lambda: _fetch_and_store_deals(website, token, cache_control)
+    )
+
+
+async def _fetch_and_store_deals(website: str, token: str, cache_control: Optional[str]) -> List[DealRecord]:
+    deals = await _call_upstream(website, token, _fetch_deals_upstream(website, token))
+    
+    #a failed step raises, so an empty list is an account without deals and is cached like any other
+    session_store.mark_validated(website, token)
+    search_index.index_deals(user_key(website, token), deals)
+    if cache.should_write(cache_control):
+        await cache.store(website, token, "deals", deals)
+        snapshot_store.save_deals(user_key(website, token), deals)
+    return deals
+
+
+def _refresh_in_background(key: str, refresh: Callable[[], Awaitable[Any]]) -> None:
+    #stale-while-revalidate: at most one refresh per key; failures are left to the next request
+    if key in _refreshes:
+        return
+    
+    async def run() -> None:
+        admission.request_priority.set(admission.BACKGROUND)
+        try:
+            await refresh()
+        except Exception as e:
+            log.warning("background_refresh_failed", key=key, error=str(e))
+        finally:
+            _refreshes.pop(key, None)
+    
+    _refreshes[key] = asyncio.ensure_future(run())
+
+
+async def iter_deals(website: str, token: str, cache_control: Optional[str] = None) -> AsyncIterator[List[DealRecord]]:
+    """
+    Yield the user's deals page by page, each page validated and filtered by the deals
+    list as soon as it is parsed. A cached listing is yielded in one piece; a streamed
+    listing is not cached, so memory stays bounded by a few pages instead of the account.
+    Raises ValueError / UpstreamUnavailableError / UpstreamFetchError like fetch_deals.
+    """
+    if cache.should_read(cache_control):
+        cached = await cache.lookup(website, token, "deals")
+        if cached is not None:
+            yield as_deal_records(cached)
+            return
+        
+        snapshot = await snapshot_store.load_deals(user_key(website, token))
+        if snapshot is not None:
+            _refresh_in_background(cache.make_key(website, token, "deals"), lambda: _fetch_deals_fresh(website, token, None))
+            yield snapshot
+            return
+    
+    site = site_registry.get(website)
+    headers = _auth_cookie(site, token)
+    
+    #the deals list (ids only) is small and needed to filter every page, so it comes first
+    list_deals = await _call_upstream(website, token, _fetch_deals_list(website, site.deals_list_url, headers))
+    if list_deals is None:
+        raise UpstreamFetchError("Failed to fetch the deals list")
+    session_store.mark_validated(website, token)
+    if not list_deals:
+        return
+    
+    def keep(cards: List[Dict[str, Any]]) -> List[DealRecord]:
+        return validate_deals([card for card in cards if card.get("id") in list_deals])
+    
+    #the same bounded page window as fetch_deals, consumed page by page instead of gathered
+    pages = _cards_pages(website, site.deals_cards_url, headers)
+    try:
+        page = 0
+        async for cards in pages:
+            page += 1
+            if cards is None:
+                raise UpstreamFetchError(f"Failed to fetch deals page {page}")
+            yield keep(cards)
+    except ValueError as e:
+        await _forget_rejected_token(website, token, e)
+        raise
+    finally:
+        #the client went away or a page failed: stop the pages still in flight
+        await pages.aclose()
+
+
+async def _fetch_deals_upstream(website: str, token: str) -> List[DealRecord]:
     """
     3-step process:
     1. Get deals list (ID + title)
     2. Get all cards  
     3. Filter cards to return only those that appear in the list
+
+    Steps 1 and 2 are independent, so both requests are issued concurrently.
     """
-    headers = config.get_common_headers(website)
-    base_url = config.get_base_url(website)
+    site = site_registry.get(website)
+    headers = _auth_cookie(site, token)
     
-    # STEP 1: Get deals list (ID + title)
-    list_url = f"{base_url}{config.DEALS_LIST_ENDPOINT}"
+    list_result, cards_result = await asyncio.gather(
+        _timed_stage(website, "list", _fetch_deals_list(website, site.deals_list_url, headers)),
+        _timed_stage(website, "cards", _fetch_deals_cards(website, site.deals_cards_url, headers)),
+        return_exceptions=True
+    )
+    
+    # Surface results in step order, exactly as the sequential flow did
+    if isinstance(list_result, BaseException):
+        raise list_result
+    if list_result is None:
+        raise UpstreamFetchError("Failed to fetch the deals list")
+    if isinstance(cards_result, BaseException):
+        raise cards_result
+    if cards_result is None:
+        raise UpstreamFetchError("Failed to fetch the deals cards")
+    list_deals, all_cards = list_result, cards_result
+    
+    # STEP 3: Filter cards - return only those that appear in the list
+    with metrics.DEALS_FETCH_STAGE_SECONDS.labels(website, "filter").time():
+        filtered_deals = []
+        for card in all_cards:
+            card_id = card.get("id")
+            if card_id in list_deals:
+                filtered_deals.append(card)
+        
+        request_log.debug("deals_filtered", website=website, deals=len(filtered_deals))
+        
+        #validated here, once per upstream fetch; routes encode the result without re-validating
+        return validate_deals(filtered_deals)
+
+
+async def _timed_stage(website: str, stage: str, call: Awaitable[Any]) -> Any:
+    #await one fetch_deals step, observing its duration whatever the outcome
+    with metrics.DEALS_FETCH_STAGE_SECONDS.labels(website, stage).time():
+        return await call
+
+
+async def _fetch_deals_list(website: str, list_url: str, headers: Dict[str, str]) -> Optional[Dict[Any, str]]:
+    # STEP 1: Get deals list (ID + title), None when the step failed
     try:
-        if config.should_log_requests():
-            print(f"DEBUG: STEP 1 - Fetching deals list from {list_url}")
+        request_log.debug("deals_list_request", website=website, url=list_url)
         
-        list_response = requests.post(
+        list_response = await _send(
+            website,
+            "list",
+            "POST",
             list_url,
             json={"filters": {}},
             headers=headers,
-            cookies={config.TOKEN_COOKIE_NAME: token},
-            timeout=config.REQUEST_TIMEOUT
+            stream=True
         )
         
-        if list_response.status_code == 409:
-            if config.is_debug_enabled():
-                print(f"DEBUG: Session conflict detected (409) - user logged in from another device")
-            raise ValueError("SESSION_CONFLICT")
-        elif list_response.status_code == 401:
-            if config.is_debug_enabled():
-                print(f"DEBUG: Unauthorized (401) - token invalid or expired")
-            raise ValueError("UNAUTHORIZED")
-        elif list_response.status_code != 200:
-            if config.is_debug_enabled():
-                print(f"DEBUG: Failed to fetch deals list: {list_response.status_code}")
-            return []
-        
-        list_data = list_response.json()
-        deal_list = list_data.get("data", [])
+        try:
+            if list_response.status_code == 409:
+                log.debug("session_conflict", website=website, endpoint="list")
+                raise ValueError("SESSION_CONFLICT")
+            elif list_response.status_code == 401:
+                log.debug("session_unauthorized", website=website, endpoint="list")
+                raise ValueError("UNAUTHORIZED")
+            elif list_response.status_code != 200:
+                log.debug("deals_list_failed", website=website, status=list_response.status_code)
+                return None
+            
+            # Save IDs and titles from list, read record by record
+            list_deals = {}  # id -> title mapping
+            async for _, deal in DataRecords(list_response):
+                if isinstance(deal, dict) and "id" in deal:
+                    list_deals[deal["id"]] = deal.get("title", "Unnamed Deal")
+        finally:
+            await list_response.aclose()
         
-        # Save IDs and titles from list
-        list_deals = {}  # id -> title mapping
-        for deal in deal_list:
-            if "id" in deal:
-                list_deals[deal["id"]] = deal.get("title", "Unnamed Deal")
+        request_log.debug("deals_list_received", website=website, deals=len(list_deals))
         
-        if config.should_log_requests():
-            print(f"DEBUG: STEP 1 Complete - Got {len(list_deals)} deals from list")
+        return list_deals
             
-    except ValueError as e:
+    except (ValueError, UpstreamUnavailableError) as e:
         # Re-raise specific errors for the API to handle
         raise e
     except Exception as e:
-        if config.is_debug_enabled():
-            print(f"DEBUG: STEP 1 Failed: {str(e)}")
-        return []
-    
-    # STEP 2: Get all cards in one request
-    cards_url = f"{base_url}{config.DEALS_CARDS_ENDPOINT}"
+        log.warning("deals_list_error", website=website, error=str(e))
+        return None
+
+
+async def _fetch_deals_cards(website: str, cards_url: str, headers: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    # STEP 2: Get all cards, page by page through a bounded window; None when the step failed
     try:
-        if config.should_log_requests():
-            print(f"DEBUG: STEP 2 - Fetching all cards from {cards_url}")
+        request_log.debug("deals_cards_request", website=website, url=cards_url)
         
-        cards_response = requests.post(
-            cards_url,
-            json={"filters": {}},
-            headers=headers,
-            cookies={config.TOKEN_COOKIE_NAME: token},
-            timeout=config.REQUEST_TIMEOUT
-        )
+        all_cards: List[Dict[str, Any]] = []
+        pages = 0
+        async for cards in _cards_pages(website, cards_url, headers):
+            if cards is None:
+                return None
+            all_cards.extend(cards)
+            pages += 1
+        
+        request_log.debug("deals_cards_received", website=website, cards=len(all_cards), pages=pages)
         
+        return all_cards
+            
+    except (ValueError, UpstreamUnavailableError) as e:
+        # Re-raise specific errors for the API to handle
+        raise e
+    except Exception as e:
+        log.warning("deals_cards_error", website=website, error=str(e))
+        return None
+
+
+async def _cards_pages(website: str, cards_url: str, headers: Dict[str, str]) -> AsyncIterator[Optional[List[Dict[str, Any]]]]:
+    """
+    Yield the mapped cards of every deals-cards page in page order: page 1, then pages 2..last_page
+    through a sliding window of the site's cards_page_concurrency requests, so no more than that many
+    pages are requested or held at once. A page the upstream failed is yielded as None and ends the
+    iteration; pages still in flight are cancelled when the caller stops early or a page raises.
+    """
+    first_page = await _fetch_cards_page(website, cards_url, headers, 1)
+    if first_page is None:
+        yield None
+        return
+    first_cards, last_page = first_page
+    yield first_cards
+    del first_cards
+    
+    if last_page > 1:
+        request_log.debug("deals_cards_pages", website=website, pages=last_page - 1)
+    
+    concurrency = site_registry.get(website).cards_page_concurrency
+    pending: Deque[asyncio.Task] = deque()
+    next_page = 2
+    try:
+        while pending or next_page <= last_page:
+            while next_page <= last_page and len(pending) < concurrency:
+                pending.append(asyncio.ensure_future(_fetch_cards_page(website, cards_url, headers, next_page)))
+                next_page += 1
+            result = await pending.popleft()
+            if result is None:
+                yield None
+                return
+            yield result[0]
+    finally:
+        for task in pending:
+            #a page that already failed is marked as seen, the others are stopped
+            if not task.cancel() and not task.cancelled():
+                task.exception()
+
+
+async def _fetch_cards_page(website: str, cards_url: str, headers: Dict[str, str], page: int) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+    #fetch one page of deals-cards as (mapped cards, last page), None when the upstream answered with an error status
+    paged = site_registry.get(website).pagination == "pages"
+    cards_response = await _send(
+        website,
+        "cards",
+        "POST",
+        cards_url,
+        params={"page": page} if paged else None,
+        json={"filters": {}},
+        headers=headers,
+        stream=True
+    )
+    
+    try:
         if cards_response.status_code == 409:
-            if config.is_debug_enabled():
-                print(f"DEBUG: Session conflict detected (409) - user logged in from another device")
+            log.debug("session_conflict", website=website, endpoint="cards")
             raise ValueError("SESSION_CONFLICT")
         elif cards_response.status_code == 401:
-            if config.is_debug_enabled():
-                print(f"DEBUG: Unauthorized (401) - token invalid or expired")
+            log.debug("session_unauthorized", website=website, endpoint="cards")
             raise ValueError("UNAUTHORIZED")
         elif cards_response.status_code != 200:
-            if config.is_debug_enabled():
-                print(f"DEBUG: Failed to fetch cards: {cards_response.status_code}")
-            return []
+            log.debug("deals_cards_page_failed", website=website, page=page, status=cards_response.status_code)
+            return None
         
-        cards_data = cards_response.json()
-        all_cards = _parse_deals_response(cards_data)
+        #each card is mapped as soon as it is parsed, so raw cards never pile up;
+        #paginated payloads send current_page before data, otherwise cards are mapped at the end
+        records = DataRecords(cards_response)
+        cards = []
+        paginated = None
+        async for _, card in records:
+            if paginated is None:
+                paginated = "current_page" in records.meta
+            if isinstance(card, dict):
+                cards.append(_map_card(card) if paginated else card)
+        if not paginated and "current_page" in records.meta:
+            cards = [_map_card(card) for card in cards]
         
-        if config.should_log_requests():
-            print(f"DEBUG: STEP 2 Complete - Got {len(all_cards)} total cards")
-            
-    except ValueError as e:
-        # Re-raise specific errors for the API to handle
-        raise e
-    except Exception as e:
-        if config.is_debug_enabled():
-            print(f"DEBUG: STEP 2 Failed: {str(e)}")
-        return []
+        #an unpaged site answers with everything in one response
+        return cards, _get_last_page(records.meta, records.count) if paged else 1
+    finally:
+        await cards_response.aclose()
+
+
+def _get_last_page(meta: Dict[str, Any], record_count: int) -> int:
+    #read the page count from the top-level fields of a paginated deals-cards payload; it never exceeds
+    #ceil(total / per_page) nor DEALS_CARDS_MAX_PAGES, so a bogus last_page cannot fan out without end
+    if 'current_page' not in meta:
+        return 1
     
-    # STEP 3: Filter cards - return only those that appear in the list
-    filtered_deals = []
-    for card in all_cards:
-        card_id = card.get("id")
-        if card_id in list_deals:
-            filtered_deals.append(card)
+    total = meta.get("total")
+    per_page = meta.get("per_page") or record_count
+    pages_for_total = None
+    if isinstance(total, int) and isinstance(per_page, int) and per_page > 0:
+        pages_for_total = -(-total // per_page)
+    
+    last_page = meta.get("last_page")
+    if not isinstance(last_page, int):
+        #fall back to total / per_page when last_page is missing
+        last_page = pages_for_total if pages_for_total is not None else 1
+    elif pages_for_total is not None:
+        last_page = min(last_page, pages_for_total)
+    
+    if last_page > config.DEALS_CARDS_MAX_PAGES:
+        log.warning("deals_cards_pages_capped", pages=last_page, max_pages=config.DEALS_CARDS_MAX_PAGES)
+        return config.DEALS_CARDS_MAX_PAGES
+    return max(last_page, 1)
+
+
+
+async def download_deal_files(website: str, token: str, deal_id: int, cache_control: Optional[str] = None) -> Dict[str, Any]:
+    #fetch files for a specific deal through the per-token cache, then the on-disk snapshot
+    if cache.should_read(cache_control):
+        cached = await cache.lookup(website, token, "files", deal_id)
+        if cached is not None:
+            cached["files"] = as_file_records(cached["files"])
+            search_index.index_files(user_key(website, token), deal_id, cached["files"])
+            return cached
+        
+        files = await snapshot_store.load_files(user_key(website, token), deal_id)
+        if files is not None:
+            search_index.index_files(user_key(website, token), deal_id, files)
+            _refresh_in_background(cache.make_key(website, token, "files", deal_id), lambda: _download_deal_files_fresh(website, token, deal_id, None))
+            return {"files": files, "total": len(files), "error": None}
     
-    if config.should_log_requests():
-        print(f"DEBUG: STEP 3 Complete - Filtered to {len(filtered_deals)} deals that appear in list")
+    return await _download_deal_files_fresh(website, token, deal_id, cache_control)
+
+
+async def _download_deal_files_fresh(website: str, token: str, deal_id: int, cache_control: Optional[str]) -> Dict[str, Any]:
+    #as for deals: the writes happen once, inside the shared flight
+    return await upstream_calls.do(
+        cache.make_key(website, token, "files", deal_id),
+        lambda: _fetch_and_store_files(website, token, deal_id, cache_control)
+    )
+
+
+async def _fetch_and_store_files(website: str, token: str, deal_id: int, cache_control: Optional[str]) -> Dict[str, Any]:
+    result = await _call_upstream(website, token, _download_deal_files_upstream(website, token, deal_id))
     
-    return filtered_deals
+    if result.get("error") is None:
+        session_store.mark_validated(website, token)
+        search_index.index_files(user_key(website, token), deal_id, result["files"])
+        if cache.should_write(cache_control):
+            await cache.store(website, token, "files", result, deal_id)
+            snapshot_store.save_files(user_key(website, token), deal_id, result["files"])
+    return result
 
 
+async def validate_token(website: str, token: str) -> bool:
+    #probe the upstream with the cheap deals-list call; raises ValueError on 401/409
+    site = site_registry.get(website)
+    list_deals = await _call_upstream(website, token, _fetch_deals_list(website, site.deals_list_url, _auth_cookie(site, token)))
+    if list_deals is None:
+        return False
+    session_store.mark_validated(website, token)
+    return True
 
 
+async def iter_deal_files(website: str, token: str, deal_ids: List[int], cache_control: Optional[str] = None) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    #fetch files for many deals with bounded concurrency, yielding (deal_id, result) as each completes
+    semaphore = asyncio.Semaphore(config.BATCH_FILES_CONCURRENCY)
+    session_error: List[str] = []
+    
+    async def fetch_one(deal_id: int) -> Tuple[int, Dict[str, Any]]:
+        async with semaphore:
+            #once the token is rejected, the remaining deals fail without another upstream call
+            if session_error:
+                return deal_id, {"files": [], "total": 0, "error": session_error[0]}
+            try:
+                return deal_id, await download_deal_files(website, token, deal_id, cache_control)
+            except ValueError as e:
+                if str(e) in SESSION_ERRORS:
+                    session_error.append(str(e))
+                return deal_id, {"files": [], "total": 0, "error": str(e)}
+            except Exception as e:
+                return deal_id, {"files": [], "total": 0, "error": f"Error fetching files: {str(e)}"}
+    
+    tasks = [asyncio.ensure_future(fetch_one(deal_id)) for deal_id in deal_ids]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        #the client went away mid-stream: stop the outstanding fetches
+        for task in tasks:
+            task.cancel()
+
+
+async def iter_sites_deals(sites: List[Tuple[str, str]], cache_control: Optional[str] = None) -> AsyncIterator[Tuple[str, List[DealRecord], Optional[Exception]]]:
+    #fetch deals from several websites concurrently, yielding (website, deals, error) as each website answers,
+    #so one slow or failing website never holds back the others
+    async def fetch_one(website: str, token: str) -> Tuple[str, List[DealRecord], Optional[Exception]]:
+        try:
+            return website, await fetch_deals(website, token, cache_control), None
+        except Exception as e:
+            return website, [], e
+    
+    tasks = [asyncio.ensure_future(fetch_one(website, token)) for website, token in sites]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        #the client went away mid-stream: stop the outstanding fetches
+        for task in tasks:
+            task.cancel()
+
+
+async def open_deal_file(website: str, token: str, deal_id: int, file_id: str, request_headers: Dict[str, str]) -> Tuple[FileRecord, httpx.Response]:
+    """
+    Open a streaming upstream response for one file of a deal.
+    Returns the file info and the response, whose body has not been read yet; the caller must close it.
+    """
+    result = await download_deal_files(website, token, deal_id)
+    if result.get("error"):
+        raise RuntimeError(result["error"])
+    
+    file_info = next((f for f in result["files"] if str(f.id) == file_id), None)
+    if file_info is None:
+        raise ValueError("FILE_NOT_FOUND")
+    
+    response = await open_file(website, token, file_info, request_headers)
+    return file_info, response
+
+
+async def open_file(website: str, token: str, file_info: FileRecord, request_headers: Dict[str, str]) -> httpx.Response:
+    #open a streaming upstream response for a parsed file entry; the caller must close it
+    file_url = file_info.download_url or file_info.url
+    if not file_url:
+        raise ValueError("FILE_NOT_FOUND")
+    
+    site = site_registry.get(website)
+    if file_url.startswith("/"):
+        file_url = f"{site.base_url}{file_url}"
+    
+    #identity encoding keeps Content-Length and byte ranges meaningful end to end
+    headers = {"Accept-Encoding": "identity"}
+    for name in FILE_FORWARD_HEADERS:
+        if name in request_headers:
+            headers[name] = request_headers[name]
+    
+    #files on the website API need the session cookie, external storage URLs must not get it
+    on_site = file_url.startswith(site.api_prefix)
+    if on_site:
+        headers.update(_auth_cookie(site, token))
+    
+    request_log.sampled(DEBUG, "file_stream_request", website=website, file_id=file_info.id, url=file_url)
+    
+    return await _call_upstream(website, token, _open_file_upstream(website, file_url, headers, on_site))
 
-def download_deal_files(website: str, token: str, deal_id: int) -> Dict[str, Any]:
+
+async def _open_file_upstream(website: str, file_url: str, headers: Dict[str, str], on_site: bool) -> httpx.Response:
+    response = await _send(
+        website,
+        "file",
+        "GET",
+        file_url,
+        headers=headers,
+        stream=True,
+        external=not on_site,
+        follow_redirects=True
+    )
+    
+    if response.status_code in FILE_PASSTHROUGH_STATUSES:
+        return response
+    
+    await response.aclose()
+    #external storage never saw the session cookie, so its 401 / 409 says nothing about the session
+    if not on_site:
+        raise RuntimeError(f"Failed to fetch file (status: {response.status_code})")
+    if response.status_code == 409:
+        log.debug("session_conflict", endpoint="file", url=file_url)
+        raise ValueError("SESSION_CONFLICT")
+    elif response.status_code == 401:
+        log.debug("session_unauthorized", endpoint="file", url=file_url)
+        raise ValueError("UNAUTHORIZED")
+    raise RuntimeError(f"Failed to fetch file (status: {response.status_code})")
+
+
+async def _download_deal_files_upstream(website: str, token: str, deal_id: int) -> Dict[str, Any]:
     #fetch files for a specific deal
-    files_url = config.get_endpoint_url(website, config.DEALS_FILES_ENDPOINT, deal_id=deal_id)
-    headers = config.get_common_headers(website)
+    site = site_registry.get(website)
+    files_url = site.files_url(deal_id)
+    headers = _auth_cookie(site, token)
     
     try:
-        if config.should_log_requests():
-            print(f"DEBUG: Fetching files for deal {deal_id} from {files_url}")
+        request_log.sampled(DEBUG, "files_request", website=website, deal_id=deal_id, url=files_url)
         
-        response = requests.get(
+        response = await _send(
+            website,
+            "files",
+            "GET",
             files_url,
             headers=headers,
-            cookies={config.TOKEN_COOKIE_NAME: token},
-            timeout=config.REQUEST_TIMEOUT
+            stream=True
         )
         
-        if config.should_log_requests():
-            print(f"DEBUG: Files response status: {response.status_code}")
-        
-        if response.status_code == 409:
-            if config.is_debug_enabled():
-                print(f"DEBUG: Session conflict detected (409) - user logged in from another device")
-            raise ValueError("SESSION_CONFLICT")
-        elif response.status_code == 401:
-            if config.is_debug_enabled():
-                print(f"DEBUG: Unauthorized (401) - token invalid or expired")
-            raise ValueError("UNAUTHORIZED")
-        elif response.status_code != 200:
-            error_msg = f"Failed to fetch files (status: {response.status_code})"
-            if config.is_debug_enabled():
-                print(f"DEBUG: {error_msg}")
-            return {
-                "error": error_msg,
-                "files": [],
-                "total": 0
-            }
-        
-        data = response.json()
-        files = _parse_files_response(data)
+        try:
+            if response.status_code == 409:
+                log.debug("session_conflict", website=website, endpoint="files")
+                raise ValueError("SESSION_CONFLICT")
+            elif response.status_code == 401:
+                log.debug("session_unauthorized", website=website, endpoint="files")
+                raise ValueError("UNAUTHORIZED")
+            elif response.status_code != 200:
+                error_msg = f"Failed to fetch files (status: {response.status_code})"
+                log.debug("files_failed", website=website, deal_id=deal_id, status=response.status_code)
+                return {
+                    "error": error_msg,
+                    "files": [],
+                    "total": 0
+                }
+            
+            #map each file entry as it is parsed from the stream
+            files = []
+            async for file_id, file_item in DataRecords(response):
+                if isinstance(file_item, dict):
+                    files.append(_map_file(file_item, file_id))
+            files = validate_files(files)
+        finally:
+            await response.aclose()
         
-        if config.should_log_requests():
-            print(f"DEBUG: Successfully fetched {len(files)} files")
+        request_log.sampled(DEBUG, "files_received", website=website, deal_id=deal_id, files=len(files))
         return {
             "files": files,
             "total": len(files),
             "error": None
         }
         
-    except ValueError as e:
+    except (ValueError, UpstreamUnavailableError) as e:
         # re-raise specific errors for the API to handle
         raise e
     except Exception as e:
         error_msg = f"Error fetching files: {str(e)}"
-        if config.is_debug_enabled():
-            print(f"DEBUG: {error_msg}")
+        log.warning("files_error", website=website, deal_id=deal_id, error=str(e))
         return {
             "error": error_msg,
             "files": [],
@@ -222,79 +647,133 @@ def download_deal_files(website: str, token: str, deal_id: int) -> Dict[str, Any
         }
 
 
-def _parse_deals_response(data: Dict[str, Any]) -> List[Dict[str, Any]]:
-    #parse deals response into standardized format
-    if not isinstance(data, dict) or 'data' not in data:
-        return []
-    
-    deals_data = data['data']
-    if not deals_data:
-        return []
-    
-    deals = []
-    
-    #handle deals-cards format (with pagination)
-    if 'current_page' in data:
-        for deal in deals_data:
-            simplified_deal = {
-                "id": deal.get("id"),
-                "title": deal.get("title", "Unnamed Deal"),
-                "created_at": deal.get("created_at", ""),
-                "firm": deal.get("deal_owner_value", ""),
-                "asset_class": deal.get("asset_class", {}).get("name", "General") if deal.get("asset_class") else "General",
-                "deal_status": deal.get("status", {}).get("name", "Unknown") if deal.get("status") else "Unknown",
-                "currency": deal.get("currencies", [{}])[0].get("value", "USD") if deal.get("currencies") else "USD",
-                "user_id": deal.get("user_id", 0),
-                "deal_capital_seeker_email": ""
-            }
-            deals.append(simplified_deal)
-    
-    #handle deals-list format (simple list)
-    else:
-        deals = deals_data
-    
-    return deals
+
+async def _send(website: str, endpoint: str, method: str, url: str, **kwargs: Any) -> httpx.Response:
+    #send one upstream request once admitted, under the endpoint's retry policy and the website's circuit breaker;
+    #a streamed response keeps its admission slot until it is closed, except file content, which is read at the
+    #client's pace: it frees the call slot once the headers arrived and holds a download body slot instead.
+    #external=True sends through the download client, admitted and circuit broken apart from the website
+    external = kwargs.get("external", False)
+    client_paced = kwargs.get("stream", False) and endpoint in CLIENT_PACED_ENDPOINTS
+    if client_paced:
+        await admission.acquire_body(website, external)
+    try:
+        await admission.acquire(website, endpoint, external)
+    except BaseException:
+        if client_paced:
+            admission.release_body(website, external)
+        raise
+    breaker_name = f"{website}-storage" if external else website
+    in_flight = metrics.UPSTREAM_IN_FLIGHT.labels(website, endpoint)
+    status: Any = "error"
+    keep_slot = False
+    keep_body = False
+    start = time.perf_counter()
+    in_flight.inc()
+    try:
+        response = await call_with_retry(
+            breaker_name,
+            endpoint,
+            lambda: http_client.request(website, method, url, **kwargs)
+        )
+        status = response.status_code
+        if client_paced:
+            response.stream = _AdmittedStream(response, website, endpoint, lambda: admission.release_body(website, external))
+            keep_body = True
+        elif kwargs.get("stream"):
+            response.stream = _AdmittedStream(response, website, endpoint, lambda: admission.release(website, endpoint, external))
+            keep_slot = True
+        else:
+            metrics.UPSTREAM_RESPONSE_BYTES.labels(website, endpoint).observe(response.num_bytes_downloaded)
+        return response
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    finally:
+        in_flight.dec()
+        metrics.UPSTREAM_REQUEST_SECONDS.labels(website, endpoint).observe(time.perf_counter() - start)
+        metrics.UPSTREAM_RESPONSES.labels(website, endpoint, status).inc()
+        if not keep_slot:
+            admission.release(website, endpoint, external)
+        if client_paced and not keep_body:
+            admission.release_body(website, external)
 
 
-def _parse_files_response(data: Dict[str, Any]) -> List[Dict[str, Any]]:
-    #parse files response into standardized format
-    if not isinstance(data, dict) or 'data' not in data:
-        return []
-    
-    files_data = data['data']
-    if not files_data:
-        return []
-    
-    files = []
-    
-    #handle dict format (file_id -> file_info)
-    if isinstance(files_data, dict):
-        for file_id, file_item in files_data.items():
-            if isinstance(file_item, dict):
-                files.append({
-                    "id": file_item.get("id", file_id),
-                    "name": file_item.get("name", "Unknown"),
-                    "size": file_item.get("size_in_bytes", 0),
-                    "url": file_item.get("file_url", ""),
-                    "type": file_item.get("type", ""),
-                    "download_url": file_item.get("file_url", ""),
-                    "created_at": file_item.get("created_at", ""),
-                    "state": file_item.get("state", "")
-                })
-    
-    #handle list format
-    elif isinstance(files_data, list):
-        for file_item in files_data:
-            if isinstance(file_item, dict):
-                files.append({
-                    "id": file_item.get("id"),
-                    "name": file_item.get("name", "Unknown"),
-                    "size": file_item.get("size_in_bytes", 0),
-                    "url": file_item.get("file_url", ""),
-                    "type": file_item.get("type", ""),
-                    "download_url": file_item.get("file_url", ""),
-                    "created_at": file_item.get("created_at", ""),
-                    "state": file_item.get("state", "")
-                })
-    
-    return files
+class _AdmittedStream(httpx.AsyncByteStream):
+    """
+    The body of a streamed upstream response. Closing it (response.aclose, by whoever holds the
+    response) records how much of the body was read and frees the admission slot it holds, once.
+    """
+
+    def __init__(self, response: httpx.Response, website: str, endpoint: str, release: Callable[[], None]):
+        self._response = response
+        self._stream = response.stream
+        self._website = website
+        self._endpoint = endpoint
+        self._release: Optional[Callable[[], None]] = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        release, self._release = self._release, None
+        if release is None:
+            return
+        metrics.UPSTREAM_RESPONSE_BYTES.labels(self._website, self._endpoint).observe(self._response.num_bytes_downloaded)
+        try:
+            await self._stream.aclose()
+        finally:
+            release()
+
+
+async def _call_upstream(website: str, token: str, call: Awaitable[Any]) -> Any:
+    #await an upstream call; when the upstream rejects the token, remember it and drop its cached data
+    try:
+        return await call
+    except ValueError as e:
+        await _forget_rejected_token(website, token, e)
+        raise
+
+
+async def _forget_rejected_token(website: str, token: str, e: ValueError) -> None:
+    if str(e) in SESSION_ERRORS:
+        session_store.mark_rejected(website, token, str(e))
+        await cache.invalidate_token(website, token)
+        #snapshots of a user outlive their tokens; those keyed by the token itself die with it
+        if session_store.username_for_token(website, token) is None:
+            await snapshot_store.invalidate(user_key(website, token))
+
+
+def _auth_cookie(site: Site, token: str) -> Dict[str, str]:
+    #build the cookie header carrying the upstream session token
+    return {"Cookie": f"{site.token_cookie}={token}"}
+
+
+def _map_card(deal: Dict[str, Any]) -> Dict[str, Any]:
+    #map one deals-cards record into the standardized deal format
+    return {
+        "id": deal.get("id"),
+        "title": deal.get("title", "Unnamed Deal"),
+        "created_at": deal.get("created_at", ""),
+        "firm": deal.get("deal_owner_value", ""),
+        "asset_class": deal.get("asset_class", {}).get("name", "General") if deal.get("asset_class") else "General",
+        "deal_status": deal.get("status", {}).get("name", "Unknown") if deal.get("status") else "Unknown",
+        "currency": deal.get("currencies", [{}])[0].get("value", "USD") if deal.get("currencies") else "USD",
+        "user_id": deal.get("user_id", 0),
+        "deal_capital_seeker_email": ""
+    }
+
+
+def _map_file(file_item: Dict[str, Any], file_id: Any = None) -> Dict[str, Any]:
+    #map one files record into the standardized format; file_id is the key when files come as a dict
+    return {
+        "id": file_item.get("id", file_id),
+        "name": file_item.get("name", "Unknown"),
+        "size": file_item.get("size_in_bytes", 0),
+        "url": file_item.get("file_url", ""),
+        "type": file_item.get("type", ""),
+        "download_url": file_item.get("file_url", ""),
+        "created_at": file_item.get("created_at", ""),
+        "state": file_item.get("state", "")
+    }
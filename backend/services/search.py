@@ -0,0 +1,342 @@
+"""In-process full-text search over deal titles, firms and file names"""
+
+import bisect
+import heapq
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from config import config
+from services.records import DealRecord, FileRecord
+
+
+#("deal", deal_id, None) or ("file", deal_id, file_id)
+DocKey = Tuple[str, Any, Any]
+
+_TERM_PATTERN = re.compile(r"[^\W_]+")
+
+#score per query term, by how the indexed term matched it
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+FUZZY_SCORE = 1.0
+
+
+def _union(groups: List[Set[int]]) -> Set[int]:
+    #a single set is returned as is (shared, not to be modified)
+    if len(groups) == 1:
+        return groups[0]
+    return set().union(*groups)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TERM_PATTERN.findall(text.casefold())
+
+
+def _deletions(term: str) -> Set[str]:
+    #every variant of the term with one character removed (symmetric-delete fuzzy matching)
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+@dataclass
+class SearchHit:
+    type: str
+    deal_id: Any
+    file_id: Any
+    title: str
+    firm: str
+    score: float
+
+
+class ScopeIndex:
+    """Inverted index of one user's deals and files"""
+
+    def __init__(self):
+        #documents get small integer ids: postings hold ints, which hash and compare much faster than keys
+        self._ids: Dict[DocKey, int] = {}
+        #doc id -> (key, title, firm, terms)
+        self._docs: Dict[int, Tuple[DocKey, str, str, Tuple[str, ...]]] = {}
+        self._next_id = 0
+        #the deal documents, and the file documents of each deal, so a replace touches only its own
+        self._deal_keys: Set[DocKey] = set()
+        self._file_keys: Dict[Any, Set[DocKey]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        #deletion variant -> terms it came from, for edit distance 1 matches
+        self._variants: Dict[str, Set[str]] = {}
+        #every indexed term, kept sorted for prefix lookups
+        self._sorted_terms: List[str] = []
+        #doc id -> display order key (deals first, then by title)
+        self._order: Dict[int, Tuple[bool, str, str, str]] = {}
+        #(order key, doc id) kept sorted, one list per document type (False: deals, True: files)
+        self._ranked: Dict[bool, List[Tuple[Tuple[bool, str, str, str], int]]] = {False: [], True: []}
+        self._deal_docs: Set[int] = set()
+        #identity of the last indexed source lists, so unchanged cache hits are skipped
+        self.deals_source: Optional[list] = None
+        self.files_sources: Dict[Any, list] = {}
+
+    def replace_deals(self, deals: List[DealRecord]) -> None:
+        self.deals_source = deals
+        self._replace(self._deal_keys, ((("deal", deal.id, None), deal.title or "", deal.firm or "") for deal in deals))
+
+    def replace_files(self, deal_id: Any, files: List[FileRecord]) -> None:
+        self.files_sources[deal_id] = files
+        keys = self._file_keys.setdefault(deal_id, set())
+        self._replace(keys, ((("file", deal_id, f.id), f.name or "", "") for f in files))
+        if not keys:
+            del self._file_keys[deal_id]
+
+    def _replace(self, keys: Set[DocKey], new_docs: Iterable[Tuple[DocKey, str, str]]) -> None:
+        #only documents that are new, gone or retitled are re-indexed: a refresh that changes nothing costs one pass
+        wanted = {key: (title, firm) for key, title, firm in new_docs}
+        stale = [key for key in keys if self._docs[self._ids[key]][1:3] != wanted.get(key)]
+        new_terms: List[str] = []
+        gone_terms: Set[str] = set()
+        removed = [self._ids[key] for key in stale]
+        self._unrank(removed)
+        for key in stale:
+            self._remove(key, gone_terms)
+            keys.discard(key)
+        added = []
+        for key, (title, firm) in wanted.items():
+            if key not in keys:
+                added.append(self._add(key, title, firm, new_terms))
+                keys.add(key)
+        self._rank(added)
+        self._update_terms(new_terms, gone_terms)
+
+    def _add(self, key: DocKey, title: str, firm: str, new_terms: List[str]) -> int:
+        terms = tuple(dict.fromkeys(tokenize(title) + tokenize(firm)))
+        doc_id = self._next_id
+        self._next_id += 1
+        self._ids[key] = doc_id
+        self._docs[doc_id] = (key, title, firm, terms)
+        self._order[doc_id] = (key[0] != "deal", title.casefold(), str(key[1]), str(key[2]))
+        if key[0] == "deal":
+            self._deal_docs.add(doc_id)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = set()
+                new_terms.append(term)
+                for variant in _deletions(term) | {term}:
+                    self._variants.setdefault(variant, set()).add(term)
+            postings.add(doc_id)
+        return doc_id
+
+    def _remove(self, key: DocKey, gone_terms: Set[str]) -> None:
+        doc_id = self._ids.pop(key)
+        _, _, _, terms = self._docs.pop(doc_id)
+        del self._order[doc_id]
+        self._deal_docs.discard(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            postings.discard(doc_id)
+            if not postings:
+                del self._postings[term]
+                gone_terms.add(term)
+                for variant in _deletions(term) | {term}:
+                    sources = self._variants.get(variant)
+                    if sources is not None:
+                        sources.discard(term)
+                        if not sources:
+                            del self._variants[variant]
+
+    def _rank(self, doc_ids: List[int]) -> None:
+        #a few documents are inserted in place; a bulk load is appended sorted and merged (timsort, linear)
+        entries = sorted((self._order[doc_id], doc_id) for doc_id in doc_ids)
+        if len(entries) <= config.SEARCH_BISECT_BATCH:
+            for entry in entries:
+                bisect.insort(self._ranked[entry[0][0]], entry)
+        else:
+            for is_file, ranked in self._ranked.items():
+                ranked.extend(entry for entry in entries if entry[0][0] is is_file)
+                ranked.sort()
+
+    def _unrank(self, doc_ids: List[int]) -> None:
+        #called before the documents are removed, while their order keys are known
+        if len(doc_ids) <= config.SEARCH_BISECT_BATCH:
+            for doc_id in doc_ids:
+                entry = (self._order[doc_id], doc_id)
+                ranked = self._ranked[entry[0][0]]
+                del ranked[bisect.bisect_left(ranked, entry)]
+        else:
+            gone = set(doc_ids)
+            for is_file, ranked in self._ranked.items():
+                self._ranked[is_file] = [entry for entry in ranked if entry[1] not in gone]
+
+    def _update_terms(self, new_terms: List[str], gone_terms: Set[str]) -> None:
+        #a term can go and come back within one replace; it is then still indexed
+        gone_terms = {term for term in gone_terms if term not in self._postings}
+        new_terms = [term for term in new_terms if term not in gone_terms]
+        if len(new_terms) + len(gone_terms) <= config.SEARCH_BISECT_BATCH:
+            for term in gone_terms:
+                index = bisect.bisect_left(self._sorted_terms, term)
+                if index < len(self._sorted_terms) and self._sorted_terms[index] == term:
+                    del self._sorted_terms[index]
+            for term in new_terms:
+                index = bisect.bisect_left(self._sorted_terms, term)
+                if index == len(self._sorted_terms) or self._sorted_terms[index] != term:
+                    self._sorted_terms.insert(index, term)
+        else:
+            self._sorted_terms = sorted(self._postings)
+
+    def _expand(self, query_term: str) -> Dict[str, float]:
+        #indexed terms matching one query term, with the score of the best way they matched
+        matches: Dict[str, float] = {}
+
+        start = bisect.bisect_left(self._sorted_terms, query_term)
+        for term in self._sorted_terms[start:start + config.SEARCH_MAX_EXPANSIONS]:
+            if not term.startswith(query_term):
+                break
+            matches[term] = EXACT_SCORE if term == query_term else PREFIX_SCORE
+
+        #typo tolerance for terms long enough that one edit is still meaningful
+        if len(query_term) >= config.SEARCH_FUZZY_MIN_LENGTH:
+            for variant in _deletions(query_term) | {query_term}:
+                for term in self._variants.get(variant, ()):
+                    matches.setdefault(term, FUZZY_SCORE)
+
+        return matches
+
+    def search(self, query: str, limit: int) -> List[SearchHit]:
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return []
+
+        #per query term: matching documents grouped by match quality
+        levels_per_term = [self._levels(query_term) for query_term in query_terms]
+
+        if len(levels_per_term) == 1:
+            #one term (the common case while typing): the groups are the levels themselves, and a
+            #lower group is only built when the ones above it did not fill the page
+            levels = levels_per_term[0]
+            exact, prefix, fuzzy = levels[EXACT_SCORE], levels[PREFIX_SCORE], levels[FUZZY_SCORE]
+            ranked_groups = (
+                (EXACT_SCORE, lambda: exact),
+                (PREFIX_SCORE, lambda: prefix - exact),
+                (FUZZY_SCORE, lambda: fuzzy - exact - prefix)
+            )
+            hits: List[SearchHit] = []
+            for score, group in ranked_groups:
+                self._add_hits(hits, group(), score, limit)
+                if len(hits) >= limit:
+                    break
+            return hits
+
+        #every query term must match a document (AND); intersect starting from the rarest term
+        matches_per_term = [_union([group for group in levels.values() if group]) for levels in levels_per_term]
+        matches_per_term.sort(key=len)
+        candidates = matches_per_term[0].intersection(*matches_per_term[1:])
+        if not candidates:
+            return []
+
+        #split the candidates into groups of equal score with set operations, instead of scoring
+        #documents one by one: group bonus = extra points over a fuzzy match on every term
+        groups: Dict[float, Set[int]] = {0.0: candidates}
+        for levels in levels_per_term:
+            exact = levels[EXACT_SCORE]
+            prefix = levels[PREFIX_SCORE]
+            split: Dict[float, Set[int]] = {}
+            for bonus, group in groups.items():
+                for extra, subset in (
+                    (EXACT_SCORE - FUZZY_SCORE, group & exact),
+                    (PREFIX_SCORE - FUZZY_SCORE, (group & prefix) - exact),
+                    (0.0, group - exact - prefix)
+                ):
+                    if subset:
+                        split.setdefault(bonus + extra, set()).update(subset)
+            groups = split
+
+        base_score = FUZZY_SCORE * len(levels_per_term)
+        hits = []
+        for bonus in sorted(groups, reverse=True):
+            self._add_hits(hits, groups[bonus], base_score + bonus, limit)
+            if len(hits) >= limit:
+                break
+        return hits
+
+    def _levels(self, query_term: str) -> Dict[float, Set[int]]:
+        #documents matching one query term per match quality; a level fed by a single indexed term
+        #shares its postings set instead of copying it, so the result must not be modified
+        terms: Dict[float, List[Set[int]]] = {EXACT_SCORE: [], PREFIX_SCORE: [], FUZZY_SCORE: []}
+        for term, score in self._expand(query_term).items():
+            terms[score].append(self._postings[term])
+        return {score: _union(postings) for score, postings in terms.items()}
+
+    def _add_hits(self, hits: List[SearchHit], group: Set[int], score: float, limit: int) -> None:
+        #deals before files at equal score, then alphabetical
+        for doc_id in self._first_in_order(group, limit - len(hits)):
+            key, title, firm, _ = self._docs[doc_id]
+            hits.append(SearchHit(type=key[0], deal_id=key[1], file_id=key[2], title=title, firm=firm, score=score))
+
+    def _first_in_order(self, group: Set[int], count: int) -> List[int]:
+        #deals come first, so the group is split by type and each part taken in its own display order
+        deals = group & self._deal_docs
+        first = self._first_of_type(deals, self._ranked[False], count)
+        if len(first) < count:
+            first += self._first_of_type(group - deals, self._ranked[True], count - len(first))
+        return first
+
+    def _first_of_type(self, group: Set[int], ranked: List[Tuple[Tuple[bool, str, str, str], int]], count: int) -> List[int]:
+        #walking the display order meets about len(group) / len(ranked) members per step, so a large
+        #group is found sooner by walking than by selecting from all of it
+        if not group:
+            return []
+        if len(group) ** 2 > 2 * count * len(ranked):
+            first = []
+            for _, doc_id in ranked:
+                if doc_id in group:
+                    first.append(doc_id)
+                    if len(first) == count:
+                        break
+            return first
+        return heapq.nsmallest(count, group, key=self._order.__getitem__)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+
+class SearchIndex:
+    """Per-user scope indexes, bounded by SEARCH_MAX_SCOPES (least recently used dropped)"""
+
+    def __init__(self, max_scopes: int):
+        self.max_scopes = max_scopes
+        self._scopes: "OrderedDict[str, ScopeIndex]" = OrderedDict()
+
+    def _scope(self, scope: str) -> ScopeIndex:
+        index = self._scopes.get(scope)
+        if index is None:
+            index = self._scopes[scope] = ScopeIndex()
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+        self._scopes.move_to_end(scope)
+        return index
+
+    def index_deals(self, scope: str, deals: List[DealRecord]) -> None:
+        index = self._scope(scope)
+        if index.deals_source is not deals:
+            index.replace_deals(deals)
+
+    def index_files(self, scope: str, deal_id: Any, files: List[FileRecord]) -> None:
+        index = self._scope(scope)
+        if index.files_sources.get(deal_id) is not files:
+            index.replace_files(deal_id, files)
+
+    def has_deals(self, scope: str) -> bool:
+        index = self._scopes.get(scope)
+        return index is not None and index.deals_source is not None
+
+    def search(self, scope: str, query: str, limit: int) -> List[SearchHit]:
+        index = self._scopes.get(scope)
+        if index is None:
+            return []
+        return index.search(query, limit)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "scopes": len(self._scopes),
+            "documents": sum(len(index) for index in self._scopes.values())
+        }
+
+
+#global search index
+search_index = SearchIndex(config.SEARCH_MAX_SCOPES)
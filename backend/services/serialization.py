@@ -0,0 +1,69 @@
+"""Fast path for JSON responses: upstream data is validated once when parsed, then encoded as-is"""
+
+import gzip
+import json
+from typing import Any, Dict, Optional, Tuple
+from fastapi import Request, Response
+from config import config
+from services.records import json_default
+
+try:
+    import orjson
+except ImportError:  # optional, the standard library encoder is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only
+    brotli = None
+
+
+def dumps(content: Any) -> bytes:
+    #records (slotted dataclasses) encode to the Deal / FileInfo JSON shape; this is their only conversion
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=json_default).encode("utf-8")
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    #whether the Accept-Encoding header allows a content coding (q=0 means refused)
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip() != coding:
+            continue
+        try:
+            quality = float(params.strip()[2:]) if params.strip().startswith("q=") else 1.0
+        except ValueError:
+            quality = 1.0
+        return quality > 0
+    return False
+
+
+def compress(body: bytes, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+    """Compress a response body for the client, returning (body, content coding or None)"""
+    if not config.RESPONSE_COMPRESSION or len(body) < config.RESPONSE_COMPRESS_MIN_SIZE:
+        return body, None
+    if brotli is not None and _accepts(accept_encoding, "br"):
+        return brotli.compress(body, quality=config.RESPONSE_BROTLI_QUALITY), "br"
+    if _accepts(accept_encoding, "gzip"):
+        return gzip.compress(body, compresslevel=config.RESPONSE_GZIP_LEVEL, mtime=0), "gzip"
+    return body, None
+
+
+def json_response(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Encode already-validated content straight to a response. Returning a Response from a
+    route skips FastAPI's response_model validation, which is kept only for the API docs.
+    """
+    body, coding = compress(dumps(content), request.headers.get("accept-encoding", ""))
+    headers = dict(headers or {})
+    if config.RESPONSE_COMPRESSION:
+        headers["Vary"] = "Accept-Encoding"
+    if coding:
+        headers["Content-Encoding"] = coding
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,218 @@
+"""Server-side store of upstream login sessions, keyed by an opaque session id"""
+
+import asyncio
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from config import config
+from services.cache import token_prefix, token_hash
+from services import admission
+from services.log import get_logger
+
+
+log = get_logger("sessions")
+
+
+@dataclass
+class Session:
+    """One upstream login, as seen by the server"""
+    session_id: str
+    website: str
+    username: str
+    token: str
+    created_at: float
+    last_validated: float
+    last_used: float
+    error: Optional[str] = None  # SESSION_CONFLICT / UNAUTHORIZED once the upstream rejected the token
+
+
+def is_idle(session: Session, now: float) -> bool:
+    #unused for longer than the upstream keeps a login: background calls would only keep an abandoned login alive
+    return now - session.last_used > config.UPSTREAM_SESSION_LIFETIME
+
+
+class SessionStore:
+    """
+    In-memory session store, private to one process: under several workers a session id
+    only resolves on the worker that created it (clients there should send the token).
+
+    Besides sessions, it remembers tokens the upstream rejected (401/409), so a
+    rejected token is answered from memory instead of another upstream round-trip.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, Session] = {}
+        #(website, token) key -> ids of the sessions holding that token
+        self._by_token: Dict[str, Set[str]] = {}
+        #(website, token) key -> (error, seen_at) for tokens the upstream rejected
+        self._rejected: Dict[str, Tuple[str, float]] = {}
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {
+            "created": 0,
+            "evicted": 0,
+            "revalidated": 0,
+            "rejections_served": 0
+        }
+
+    def create(self, website: str, username: str, token: str) -> Session:
+        now = time.time()
+        session = Session(
+            session_id=secrets.token_urlsafe(32),
+            website=website,
+            username=username,
+            token=token,
+            created_at=now,
+            last_validated=now,
+            last_used=now
+        )
+        self._sessions[session.session_id] = session
+        self._by_token.setdefault(token_prefix(website, token), set()).add(session.session_id)
+        self.stats["created"] += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if self._is_expired(session, time.time()):
+            self._remove(session_id)
+            self.stats["evicted"] += 1
+            return None
+        return session
+
+    def delete(self, session_id: str) -> None:
+        if session_id in self._sessions:
+            self._remove(session_id)
+
+    def resolve_token(self, website: str, token: Optional[str], session_id: Optional[str]) -> str:
+        """
+        Return the upstream token for a request carrying a session id or a raw token.
+        Raises ValueError("UNAUTHORIZED" / "SESSION_CONFLICT") when the state is already known.
+        """
+        if session_id:
+            session = self.get(session_id)
+            if session is None or session.website != website:
+                raise ValueError("UNAUTHORIZED")
+            session.last_used = time.time()
+            if session.error:
+                self.stats["rejections_served"] += 1
+                raise ValueError(session.error)
+            return session.token
+
+        if not token:
+            raise ValueError("UNAUTHORIZED")
+
+        rejected = self._rejected.get(token_prefix(website, token))
+        if rejected is not None:
+            self.stats["rejections_served"] += 1
+            raise ValueError(rejected[0])
+
+        for sid in self._by_token.get(token_prefix(website, token), ()):
+            self._sessions[sid].last_used = time.time()
+        return token
+
+    def username_for_token(self, website: str, token: str) -> Optional[str]:
+        #the username a token was issued to, when it came from a login on this server
+        for sid in self._by_token.get(token_prefix(website, token), ()):
+            return self._sessions[sid].username
+        return None
+
+    def mark_rejected(self, website: str, token: str, error: str) -> None:
+        #remember that the upstream rejected a token (401/409)
+        key = token_prefix(website, token)
+        self._rejected[key] = (error, time.time())
+        for sid in self._by_token.get(key, ()):
+            self._sessions[sid].error = error
+
+    def mark_validated(self, website: str, token: str) -> None:
+        #the upstream just accepted this token
+        now = time.time()
+        for sid in self._by_token.get(token_prefix(website, token), ()):
+            self._sessions[sid].last_validated = now
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        expired = [sid for sid, session in self._sessions.items() if self._is_expired(session, now)]
+        for sid in expired:
+            self._remove(sid)
+        self.stats["evicted"] += len(expired)
+
+        #rejected tokens are only worth remembering while clients may still send them
+        for key in [key for key, (_, seen_at) in self._rejected.items() if now - seen_at > config.SESSION_IDLE_TIMEOUT]:
+            del self._rejected[key]
+        return len(expired)
+
+    def due_for_validation(self) -> List[Session]:
+        #in-use, still-valid sessions whose last validation is older than SESSION_REVALIDATE_AFTER
+        now = time.time()
+        return [
+            session for session in self._sessions.values()
+            if session.error is None
+            and now - session.last_validated > config.SESSION_REVALIDATE_AFTER
+            and not is_idle(session, now)
+            and not self._is_expired(session, now)
+        ]
+
+    def start(self, validate: Callable[[str, str], Awaitable[Any]]) -> None:
+        #start the background eviction / re-validation loop
+        if self._maintenance_task is None:
+            self._maintenance_task = asyncio.ensure_future(self._maintain(validate))
+
+    async def stop(self) -> None:
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+
+    async def _maintain(self, validate: Callable[[str, str], Awaitable[Any]]) -> None:
+        admission.request_priority.set(admission.BACKGROUND)
+        while True:
+            await asyncio.sleep(config.SESSION_MAINTENANCE_INTERVAL)
+            self.evict_expired()
+            for session in self.due_for_validation():
+                try:
+                    #validate raises ValueError on 401/409, which marks the session through the scraper
+                    await validate(session.website, session.token)
+                    self.stats["revalidated"] += 1
+                except ValueError:
+                    pass
+                except Exception as e:
+                    log.warning("session_revalidation_failed", website=session.website, error=str(e))
+
+    def _is_expired(self, session: Session, now: float) -> bool:
+        return (
+            now - session.created_at > config.SESSION_TTL
+            or now - session.last_used > config.SESSION_IDLE_TIMEOUT
+        )
+
+    def _remove(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id)
+        key = token_prefix(session.website, session.token)
+        ids = self._by_token.get(key)
+        if ids is not None:
+            ids.discard(session_id)
+            if not ids:
+                del self._by_token[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            **self.stats,
+            "active": len(self._sessions),
+            "rejected_tokens": len(self._rejected)
+        }
+
+
+#global session store
+session_store = SessionStore()
+
+
+def user_key(website: str, token: str) -> str:
+    #tokens change on every login, so logged-in users are keyed by username
+    username = session_store.username_for_token(website, token)
+    if username:
+        return f"{website}:user:{username.lower()}"
+    return f"{website}:token:{token_hash(token)}"
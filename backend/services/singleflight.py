@@ -0,0 +1,54 @@
+"""Single-flight coalescing of identical in-flight upstream calls"""
+
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict
+from services import admission
+
+
+class SingleFlight:
+    """Runs at most one call per key; concurrent callers share its outcome.
+
+    The call runs in its own task, so a caller that disconnects (and is
+    cancelled) never cancels the work the other callers are waiting on.
+    Its upstream calls are admitted at the most urgent priority among the
+    callers, so an interactive caller never waits on a background flight.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._priorities: Dict[str, admission.SharedPriority] = {}
+        self.stats: Dict[str, int] = {
+            "calls": 0,
+            "shared": 0
+        }
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            #the task copies the caller's context; the flight's priority is shared by all its callers instead
+            shared = admission.SharedPriority(admission.current_priority())
+            context = contextvars.copy_context()
+            context.run(admission.shared_priority.set, shared)
+            task = asyncio.get_running_loop().create_task(fn(), context=context)
+            self._calls[key] = task
+            self._priorities[key] = shared
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.stats["calls"] += 1
+        else:
+            admission.raise_priority(self._priorities[key], admission.current_priority())
+            self.stats["shared"] += 1
+
+        #every caller receives the same result or the same exception
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._priorities[key]
+        #mark the exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "in_flight": len(self._calls)}
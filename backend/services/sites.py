@@ -0,0 +1,170 @@
+"""Registry of upstream sites (data rooms), built once at startup from SITES / SITES_FILE and the environment"""
+
+import json
+import os
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Tuple
+from config import config
+
+
+#how deals-cards is paged: "pages" fans out over ?page=2..last_page, "single" is one unpaged request
+PAGINATION_STYLES = ("pages", "single")
+
+#upstream calls limited separately within a site; "file" is file content (downloads and ZIP archives)
+UPSTREAM_ENDPOINTS = ("login", "list", "cards", "files", "file")
+
+#built-in URLs of the original sites; any other site needs a base_url
+_DEFAULT_URLS = {
+    "fo1": ("https://fo1.api.altius.finance", "https://fo1.altius.finance"),
+    "fo2": ("https://fo2.api.altius.finance", "https://fo2.altius.finance")
+}
+
+
+@dataclass(frozen=True)
+class Limits:
+    """Admission limits of one upstream target"""
+    rate: float  # requests per second, 0 = unlimited
+    burst: float
+    concurrency: int
+
+
+def _limits(settings: Dict[str, Any], rate: float, burst: float, concurrency: int) -> Limits:
+    return Limits(
+        rate=float(settings.get("rate_limit", rate)),
+        burst=float(settings.get("rate_burst", burst)),
+        concurrency=int(settings.get("max_concurrency", concurrency))
+    )
+
+
+@dataclass(frozen=True)
+class Site:
+    """One upstream site with every URL, header set and tuning value precomputed"""
+    name: str
+    base_url: str
+    #base_url + "/": file URLs starting with it are on the site's own API and get the session cookie
+    api_prefix: str
+    website_url: str
+    #default headers of the site's connection pool (read-only, shared)
+    headers: Mapping[str, str]
+    token_cookie: str
+    login_url: str
+    deals_list_url: str
+    deals_cards_url: str
+    #deal files URL on either side of the deal id
+    files_url_prefix: str
+    files_url_suffix: str
+    request_timeout: float
+    connect_timeout: float
+    pool_size: int
+    cards_page_concurrency: int
+    pagination: str
+    #admission limits for the whole site, for each of UPSTREAM_ENDPOINTS and for its external file storage
+    limits: Limits
+    endpoint_limits: Mapping[str, Limits]
+    storage_limits: Limits
+
+    def files_url(self, deal_id: int) -> str:
+        return f"{self.files_url_prefix}{deal_id}{self.files_url_suffix}"
+
+
+def build_site(name: str, settings: Dict[str, Any]) -> Site:
+    #settings come from SITES_FILE; {NAME}_BASE_URL / {NAME}_WEBSITE_URL in the environment win over them
+    default_base_url, default_website_url = _DEFAULT_URLS.get(name, (None, None))
+    base_url = os.getenv(f"{name.upper()}_BASE_URL") or settings.get("base_url") or default_base_url
+    if not base_url:
+        raise ValueError(f"Site {name} has no base_url (set it in SITES_FILE or {name.upper()}_BASE_URL)")
+    base_url = base_url.rstrip("/")
+    website_url = (os.getenv(f"{name.upper()}_WEBSITE_URL") or settings.get("website_url") or default_website_url or base_url).rstrip("/")
+
+    pagination = settings.get("pagination", "pages")
+    if pagination not in PAGINATION_STYLES:
+        raise ValueError(f"Site {name}: unsupported pagination {pagination}. Supported: {list(PAGINATION_STYLES)}")
+
+    endpoints = {
+        "login": config.LOGIN_ENDPOINT,
+        "deals_list": config.DEALS_LIST_ENDPOINT,
+        "deals_cards": config.DEALS_CARDS_ENDPOINT,
+        "deals_files": config.DEALS_FILES_ENDPOINT,
+        **settings.get("endpoints", {})
+    }
+    files_url_prefix, _, files_url_suffix = f"{base_url}{endpoints['deals_files']}".partition("{deal_id}")
+
+    headers = {
+        "User-Agent": config.USER_AGENT,
+        "Accept": config.ACCEPT_TYPE,
+        "Content-Type": config.CONTENT_TYPE,
+        "Origin": website_url,
+        "Referer": f"{website_url}/",
+        **settings.get("headers", {})
+    }
+
+    return Site(
+        name=name,
+        base_url=base_url,
+        api_prefix=f"{base_url}/",
+        website_url=website_url,
+        headers=MappingProxyType(headers),
+        token_cookie=settings.get("token_cookie", config.TOKEN_COOKIE_NAME),
+        login_url=f"{base_url}{endpoints['login']}",
+        deals_list_url=f"{base_url}{endpoints['deals_list']}",
+        deals_cards_url=f"{base_url}{endpoints['deals_cards']}",
+        files_url_prefix=files_url_prefix,
+        files_url_suffix=files_url_suffix,
+        request_timeout=float(settings.get("request_timeout", config.REQUEST_TIMEOUT)),
+        connect_timeout=float(settings.get("connect_timeout", config.HTTP_CONNECT_TIMEOUT)),
+        pool_size=int(settings.get("pool_size", config.HTTP_POOL_SIZE)),
+        cards_page_concurrency=int(settings.get("cards_page_concurrency", config.DEALS_CARDS_PAGE_CONCURRENCY)),
+        pagination=pagination,
+        limits=_limits(settings, config.UPSTREAM_RATE_LIMIT, config.UPSTREAM_RATE_BURST, config.UPSTREAM_MAX_CONCURRENCY),
+        endpoint_limits=MappingProxyType({
+            endpoint: _limits(
+                settings.get("endpoint_limits", {}).get(endpoint, {}),
+                config.ENDPOINT_RATE_LIMIT, config.ENDPOINT_RATE_BURST, config.ENDPOINT_MAX_CONCURRENCY
+            )
+            for endpoint in UPSTREAM_ENDPOINTS
+        }),
+        storage_limits=_limits(
+            settings.get("storage_limits", {}),
+            config.STORAGE_RATE_LIMIT, config.STORAGE_RATE_BURST, config.STORAGE_MAX_CONCURRENCY
+        )
+    )
+
+
+class SiteRegistry:
+    """Sites by name; lookups are one dict access and allocate nothing"""
+
+    def __init__(self, sites: Dict[str, Site]):
+        self._sites = sites
+        self.names: Tuple[str, ...] = tuple(sites)
+
+    def get(self, name: str) -> Site:
+        site = self._sites.get(name)
+        if site is None:
+            raise ValueError(f"Unsupported website: {name}. Supported: {list(self.names)}")
+        return site
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sites
+
+
+def load_registry() -> SiteRegistry:
+    """
+    Sites named in SITES, plus every site in SITES_FILE, a JSON object of
+    name -> settings (base_url, website_url, endpoints, headers, token_cookie,
+    request_timeout, connect_timeout, pool_size, cards_page_concurrency, pagination,
+    rate_limit, rate_burst, max_concurrency, endpoint_limits: endpoint -> the same three,
+    and storage_limits: the same three for file downloads from external storage).
+    """
+    file_settings: Dict[str, Dict[str, Any]] = {}
+    if config.SITES_FILE:
+        with open(config.SITES_FILE) as f:
+            file_settings = json.load(f)
+
+    names = [name.strip() for name in config.SITES.split(",") if name.strip()]
+    names += [name for name in file_settings if name not in names]
+    return SiteRegistry({name: build_site(name, file_settings.get(name, {})) for name in names})
+
+
+#global site registry
+site_registry = load_registry()
@@ -0,0 +1,257 @@
+"""On-disk snapshots of parsed deals and files, kept across restarts and shared by workers"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+from config import config
+from services.records import DealRecord, FileRecord, validate_deals, validate_files
+from services.serialization import dumps
+from services.log import get_logger
+
+
+log = get_logger("snapshots")
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deal_snapshots (
+    scope TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deals (
+    scope TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (scope, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS file_snapshots (
+    scope TEXT NOT NULL,
+    deal_id INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (scope, deal_id)
+) WITHOUT ROWID;
+"""
+
+#rows of an unchanged deal are left alone, so a refresh that finds nothing new writes (almost) nothing
+_UPSERT_DEAL = """
+INSERT INTO deals (scope, id, position, data) VALUES (?, ?, ?, ?)
+ON CONFLICT (scope, id) DO UPDATE SET position = excluded.position, data = excluded.data
+WHERE deals.position != excluded.position OR deals.data != excluded.data
+"""
+
+
+class SnapshotStore:
+    """
+    SQLite store (WAL mode) of the last parsed deals and file listings per user.
+
+    Deals are one row each, keyed by (scope, id); a deal's files
+    are one row keyed by (scope, deal_id). The scope is sessions.user_key, so a user's
+    snapshot survives re-logins. Writes run in the background and each fetch is upserted
+    in one transaction; beyond SNAPSHOT_MAX_BYTES the least recently read snapshots are
+    dropped. Every operation is best effort: a database error reads as a miss.
+    """
+
+    def __init__(self):
+        self._conn: Optional[sqlite3.Connection] = None
+        #one connection, used from worker threads one call at a time
+        self._lock = threading.Lock()
+        self._writes: Set[asyncio.Task] = set()
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "rows_written": 0,
+            "compactions": 0,
+            "evicted": 0,
+            "errors": 0
+        }
+
+    # ---------------------------------------- deals ----------------------------------------
+
+    async def load_deals(self, scope: str) -> Optional[List[DealRecord]]:
+        #the user's last deals, in upstream order; None when there is no snapshot younger than SNAPSHOT_MAX_AGE
+        return self._count(await self._run(self._load_deals, scope))
+
+    def save_deals(self, scope: str, deals: List[DealRecord]) -> None:
+        #upsert one fetch of deals in the background
+        self._write(self._save_deals, scope, deals)
+
+    # ---------------------------------------- files ----------------------------------------
+
+    async def load_files(self, scope: str, deal_id: int) -> Optional[List[FileRecord]]:
+        return self._count(await self._run(self._load_files, scope, deal_id))
+
+    def save_files(self, scope: str, deal_id: int, files: List[FileRecord]) -> None:
+        self._write(self._save_files, scope, deal_id, files)
+
+    # ---------------------------------------- lifecycle ----------------------------------------
+
+    async def invalidate(self, scope: str) -> None:
+        await self._run(self._invalidate, scope)
+
+    async def close(self) -> None:
+        #let pending writes land, then close the database
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        if not config.SNAPSHOT_ENABLED:
+            return {"enabled": False}
+        return {"enabled": True, **self.stats, "pending_writes": len(self._writes)}
+
+    # ---------------------------------------- internals (worker threads) ----------------------------------------
+
+    def _count(self, records: Optional[list]) -> Optional[list]:
+        self.stats["hits" if records is not None else "misses"] += 1
+        return records
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if not config.SNAPSHOT_ENABLED:
+            return None
+        return await asyncio.to_thread(self._locked, fn, *args)
+
+    def _write(self, fn: Callable[..., Any], *args: Any) -> None:
+        if not config.SNAPSHOT_ENABLED:
+            return
+        task = asyncio.ensure_future(asyncio.to_thread(self._locked, fn, *args))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    def _locked(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            try:
+                return fn(self._connection(), *args)
+            except sqlite3.Error as e:
+                self.stats["errors"] += 1
+                log.warning("snapshot_store_error", error=str(e))
+                return None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(config.SNAPSHOT_PATH, isolation_level=None, check_same_thread=False)
+            #WAL: readers in other workers never block on a writer; NORMAL sync is safe with WAL
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={config.SNAPSHOT_BUSY_TIMEOUT_MS}")
+            #set before the first table exists, so compaction can hand freed pages back to the OS
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._compact(conn)
+        return self._conn
+
+    def _load_deals(self, conn: sqlite3.Connection, scope: str) -> Optional[List[DealRecord]]:
+        row = conn.execute("SELECT fetched_at FROM deal_snapshots WHERE scope = ?", (scope,)).fetchone()
+        if row is None or time.time() - row[0] > config.SNAPSHOT_MAX_AGE:
+            return None
+        rows = conn.execute("SELECT data FROM deals WHERE scope = ? ORDER BY position", (scope,)).fetchall()
+        conn.execute("UPDATE deal_snapshots SET accessed_at = ? WHERE scope = ?", (time.time(), scope))
+        return validate_deals([json.loads(data) for (data,) in rows])
+
+    def _save_deals(self, conn: sqlite3.Connection, scope: str, deals: List[DealRecord]) -> None:
+        rows = [(scope, deal.id, position, dumps(deal)) for position, deal in enumerate(deals)]
+        now = time.time()
+        #one transaction per fetch: committed on success, rolled back on error
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany(_UPSERT_DEAL, rows)
+            written = conn.total_changes - before
+            conn.execute(
+                "DELETE FROM deals WHERE scope = ? AND id NOT IN (SELECT value FROM json_each(?))",
+                (scope, json.dumps([deal.id for deal in deals]))
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO deal_snapshots (scope, fetched_at, accessed_at, size) VALUES (?, ?, ?, ?)",
+                (scope, now, now, sum(len(row[3]) for row in rows))
+            )
+        self.stats["writes"] += 1
+        self.stats["rows_written"] += written
+        self._compact_if_needed(conn)
+
+    def _load_files(self, conn: sqlite3.Connection, scope: str, deal_id: int) -> Optional[List[FileRecord]]:
+        row = conn.execute(
+            "SELECT fetched_at, data FROM file_snapshots WHERE scope = ? AND deal_id = ?", (scope, deal_id)
+        ).fetchone()
+        if row is None or time.time() - row[0] > config.SNAPSHOT_MAX_AGE:
+            return None
+        conn.execute("UPDATE file_snapshots SET accessed_at = ? WHERE scope = ? AND deal_id = ?", (time.time(), scope, deal_id))
+        return validate_files(json.loads(row[1]))
+
+    def _save_files(self, conn: sqlite3.Connection, scope: str, deal_id: int, files: List[FileRecord]) -> None:
+        data = dumps(files)
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO file_snapshots (scope, deal_id, fetched_at, accessed_at, size, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (scope, deal_id, now, now, len(data), data)
+        )
+        self.stats["writes"] += 1
+        self.stats["rows_written"] += 1
+        self._compact_if_needed(conn)
+
+    def _invalidate(self, conn: sqlite3.Connection, scope: str) -> None:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._drop_deals(conn, scope)
+            conn.execute("DELETE FROM file_snapshots WHERE scope = ?", (scope,))
+
+    def _drop_deals(self, conn: sqlite3.Connection, scope: str) -> None:
+        conn.execute("DELETE FROM deals WHERE scope = ?", (scope,))
+        conn.execute("DELETE FROM deal_snapshots WHERE scope = ?", (scope,))
+
+    def _total_size(self, conn: sqlite3.Connection) -> int:
+        return conn.execute(
+            "SELECT (SELECT COALESCE(SUM(size), 0) FROM deal_snapshots) + (SELECT COALESCE(SUM(size), 0) FROM file_snapshots)"
+        ).fetchone()[0]
+
+    def _compact_if_needed(self, conn: sqlite3.Connection) -> None:
+        if self._total_size(conn) > config.SNAPSHOT_MAX_BYTES:
+            self._compact(conn)
+
+    def _compact(self, conn: sqlite3.Connection) -> None:
+        #drop expired snapshots, then the least recently read ones down to 90% of SNAPSHOT_MAX_BYTES
+        cutoff = time.time() - config.SNAPSHOT_MAX_AGE
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            expired = [scope for (scope,) in conn.execute("SELECT scope FROM deal_snapshots WHERE fetched_at < ?", (cutoff,))]
+            for scope in expired:
+                self._drop_deals(conn, scope)
+            evicted = len(expired) + conn.execute("DELETE FROM file_snapshots WHERE fetched_at < ?", (cutoff,)).rowcount
+
+            excess = self._total_size(conn) - int(config.SNAPSHOT_MAX_BYTES * 0.9)
+            if excess > 0:
+                candidates = conn.execute(
+                    "SELECT accessed_at, size, scope, NULL FROM deal_snapshots "
+                    "UNION ALL SELECT accessed_at, size, scope, deal_id FROM file_snapshots ORDER BY accessed_at"
+                ).fetchall()
+                for _, size, scope, deal_id in candidates:
+                    if excess <= 0:
+                        break
+                    if deal_id is None:
+                        self._drop_deals(conn, scope)
+                    else:
+                        conn.execute("DELETE FROM file_snapshots WHERE scope = ? AND deal_id = ?", (scope, deal_id))
+                    excess -= size
+                    evicted += 1
+
+        if evicted:
+            conn.execute("PRAGMA incremental_vacuum")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.stats["compactions"] += 1
+        self.stats["evicted"] += evicted
+
+
+#global snapshot store
+snapshot_store = SnapshotStore()
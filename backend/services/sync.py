@@ -0,0 +1,130 @@
+"""Incremental deals sync: per-user snapshots and deltas between them"""
+
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from config import config
+from services.records import DealRecord
+from services.serialization import dumps
+
+
+@dataclass
+class DealsSnapshot:
+    """One version of a user's deals, identified by its cursor"""
+    cursor: str
+    #deal id -> fingerprint of the deal record (includes created_at)
+    fingerprints: Dict[Any, bytes]
+    #full records, only kept on the latest snapshot of a user
+    deals: Dict[Any, DealRecord] = field(default_factory=dict)
+    #the list the snapshot was recorded from, so recording the same list again (a cache hit) is free
+    source: Optional[list] = None
+
+
+@dataclass
+class DealsDelta:
+    cursor: str
+    full: bool
+    added: List[DealRecord]
+    changed: List[DealRecord]
+    removed: List[Any]
+
+
+def _fingerprint(deal: DealRecord) -> bytes:
+    #records encode their fields in declaration order, so equal records give equal bytes
+    return hashlib.blake2b(dumps(deal), digest_size=8).digest()
+
+
+class SyncStore:
+    """Keeps the last few deals snapshots per (website, user), bounded in users, history and total deals"""
+
+    def __init__(self, max_users: int, history: int, max_entries: int):
+        self.max_users = max_users
+        self.history = history
+        self.max_entries = max_entries
+        #fingerprints held across all snapshots
+        self.entries = 0
+        #user key -> snapshots by cursor, oldest first
+        self._users: "OrderedDict[str, OrderedDict[str, DealsSnapshot]]" = OrderedDict()
+
+    def record(self, key: str, deals: List[DealRecord]) -> Tuple[DealsSnapshot, Optional[DealsSnapshot]]:
+        """Store the current deals and return (current snapshot, snapshot the user had before)"""
+        snapshots = self._users.get(key)
+        if snapshots is None:
+            snapshots = self._users[key] = OrderedDict()
+        self._users.move_to_end(key)
+
+        previous = next(reversed(snapshots.values()), None)
+        if previous is not None and previous.source is deals:
+            return previous, previous
+
+        #fingerprints are computed once per fetched list, a list seen before is matched above
+        fingerprints = {deal.id: _fingerprint(deal) for deal in deals}
+        digest = hashlib.sha1()
+        for deal_id, fingerprint in sorted(fingerprints.items(), key=lambda item: str(item[0])):
+            digest.update(f"{deal_id}:".encode("utf-8") + fingerprint)
+        cursor = digest.hexdigest()[:20]
+
+        if previous is not None and previous.cursor == cursor:
+            previous.source = deals
+            return previous, previous
+
+        if previous is not None:
+            #older snapshots only need fingerprints to compute deltas
+            previous.deals = {}
+            previous.source = None
+
+        snapshot = DealsSnapshot(cursor=cursor, fingerprints=fingerprints, deals={deal.id: deal for deal in deals}, source=deals)
+        self._drop(snapshots.pop(cursor, None))
+        snapshots[cursor] = snapshot
+        self.entries += len(fingerprints)
+        while len(snapshots) > self.history:
+            self._drop(snapshots.popitem(last=False)[1])
+        self._evict(key)
+        return snapshot, previous
+
+    def _drop(self, snapshot: Optional[DealsSnapshot]) -> None:
+        if snapshot is not None:
+            self.entries -= len(snapshot.fingerprints)
+
+    def _evict(self, current_key: str) -> None:
+        #least recently synced users go first; the current user then loses its oldest snapshots,
+        #keeping at least its latest one
+        while len(self._users) > 1 and (len(self._users) > self.max_users or self.entries > self.max_entries):
+            _, snapshots = self._users.popitem(last=False)
+            self.entries -= sum(len(snapshot.fingerprints) for snapshot in snapshots.values())
+        snapshots = self._users[current_key]
+        while len(snapshots) > 1 and self.entries > self.max_entries:
+            self._drop(snapshots.popitem(last=False)[1])
+
+    def latest(self, key: str) -> Optional[DealsSnapshot]:
+        #the user's most recent snapshot, None when nothing was recorded yet
+        snapshots = self._users.get(key)
+        return next(reversed(snapshots.values()), None) if snapshots else None
+
+    def diff(self, key: str, since_cursor: Optional[str], current: DealsSnapshot) -> DealsDelta:
+        #delta from the client's cursor to the current snapshot; a full listing when the cursor is unknown
+        base = self._users.get(key, {}).get(since_cursor) if since_cursor else None
+        if base is None:
+            return DealsDelta(cursor=current.cursor, full=True, added=list(current.deals.values()), changed=[], removed=[])
+
+        added, changed = [], []
+        for deal_id, fingerprint in current.fingerprints.items():
+            old_fingerprint = base.fingerprints.get(deal_id)
+            if old_fingerprint is None:
+                added.append(current.deals[deal_id])
+            elif old_fingerprint != fingerprint:
+                changed.append(current.deals[deal_id])
+        removed = [deal_id for deal_id in base.fingerprints if deal_id not in current.fingerprints]
+        return DealsDelta(cursor=current.cursor, full=False, added=added, changed=changed, removed=removed)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._users),
+            "snapshots": sum(len(snapshots) for snapshots in self._users.values()),
+            "entries": self.entries
+        }
+
+
+#global sync store
+sync_store = SyncStore(config.SYNC_MAX_USERS, config.SYNC_HISTORY, config.SYNC_MAX_ENTRIES)
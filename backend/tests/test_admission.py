@@ -0,0 +1,119 @@
+"""Admission gates: priority order, queue deadlines, and slots held by streamed upstream responses"""
+
+import asyncio
+import httpx
+import pytest
+from services import admission, http_client, scraper
+from services.admission import BACKGROUND, INTERACTIVE, Gate, UpstreamBusyError
+from services.sites import Limits
+
+
+def _gate(rate: float = 0, concurrency: int = 1) -> Gate:
+    return Gate("test", Limits(rate=rate, burst=1, concurrency=concurrency), max_queue=10)
+
+
+def test_queued_calls_are_admitted_by_priority_then_arrival():
+    async def run():
+        gate = _gate()
+        await gate.acquire(INTERACTIVE, 1)
+        admitted = []
+
+        async def call(name: str, priority: int) -> None:
+            await gate.acquire(priority, 1)
+            admitted.append(name)
+            gate.release()
+
+        calls = [
+            asyncio.ensure_future(call("background", BACKGROUND)),
+            asyncio.ensure_future(call("first", INTERACTIVE)),
+            asyncio.ensure_future(call("second", INTERACTIVE))
+        ]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*calls)
+        return admitted, gate.get_stats()
+
+    admitted, stats = asyncio.run(run())
+    assert admitted == ["first", "second", "background"]
+    assert stats["in_use"] == 0 and stats["waiting"] == 0
+
+
+def test_a_call_still_queued_at_its_deadline_is_rejected():
+    async def run():
+        gate = _gate()
+        await gate.acquire(INTERACTIVE, 1)
+        with pytest.raises(UpstreamBusyError) as busy:
+            await gate.acquire(INTERACTIVE, 0.01)
+        return busy.value, gate.get_stats()
+
+    error, stats = asyncio.run(run())
+    assert error.status_code == 503
+    assert stats["timed_out"] == 1 and stats["waiting"] == 0 and stats["in_use"] == 1
+
+
+def test_a_call_the_rate_alone_cannot_admit_in_time_fails_fast():
+    async def run():
+        gate = _gate(rate=1, concurrency=10)
+        await gate.acquire(INTERACTIVE, 1)
+        with pytest.raises(UpstreamBusyError) as busy:
+            await gate.acquire(INTERACTIVE, 0.1)
+        return busy.value, gate.get_stats()
+
+    error, stats = asyncio.run(run())
+    assert error.status_code == 429 and error.retry_after >= 1
+    assert stats["rate_limited"] == 1 and stats["queued"] == 0
+
+
+def _upstream(monkeypatch: pytest.MonkeyPatch) -> None:
+    #fresh gates, and an upstream answering every call with an unread 200 body
+    monkeypatch.setattr(admission, "_gates", {})
+
+    async def request(website, method, url, stream=False, **kwargs):
+        return httpx.Response(200, stream=httpx.ByteStream(b"body"), request=httpx.Request(method, url))
+
+    monkeypatch.setattr(http_client, "request", request)
+
+
+def _in_use() -> dict:
+    return {name: stats["in_use"] for name, stats in admission.get_admission_stats().items() if name != "enabled"}
+
+
+def test_a_streamed_call_keeps_its_slots_until_closed_once(monkeypatch):
+    _upstream(monkeypatch)
+
+    async def run():
+        response = await scraper._send("fo1", "list", "POST", "http://fo1.test/list", stream=True)
+        held = _in_use()
+        await response.aclose()
+        await response.stream.aclose()
+        return held, _in_use()
+
+    held, after = asyncio.run(run())
+    assert held == {"fo1 list": 1, "fo1": 1}
+    assert after == {"fo1 list": 0, "fo1": 0}
+
+
+def test_file_content_frees_its_call_slots_once_the_headers_arrived(monkeypatch):
+    _upstream(monkeypatch)
+
+    async def run():
+        response = await scraper._send("fo1", "file", "GET", "http://fo1.test/file", stream=True)
+        held = _in_use()
+        await response.aclose()
+        return held, _in_use()
+
+    held, after = asyncio.run(run())
+    assert held == {"fo1 bodies": 1, "fo1 file": 0, "fo1": 0}
+    assert after == {"fo1 bodies": 0, "fo1 file": 0, "fo1": 0}
+
+
+def test_external_storage_is_admitted_apart_from_the_website(monkeypatch):
+    _upstream(monkeypatch)
+
+    async def run():
+        response = await scraper._send("fo1", "file", "GET", "http://storage.test/file", stream=True, external=True)
+        held = _in_use()
+        await response.aclose()
+        return held
+
+    assert asyncio.run(run()) == {"fo1-storage bodies": 1, "fo1-storage": 0}
@@ -0,0 +1,90 @@
+"""stream_deal_archive: entries, names, failed downloads, and downloads stopped with the client"""
+
+import asyncio
+import io
+import zipfile
+import httpx
+from services import archive
+from services.records import FileRecord
+
+
+class _Body(httpx.AsyncByteStream):
+    #a file body in chunks, optionally failing after them, recording whether it was closed
+    def __init__(self, chunks, fail: bool = False):
+        self.chunks = chunks
+        self.fail = fail
+        self.closed = False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+        if self.fail:
+            raise httpx.ReadError("connection reset")
+
+    async def aclose(self):
+        self.closed = True
+
+
+def _file(file_id: int, name: str) -> FileRecord:
+    return FileRecord(id=file_id, name=name, size=0, url="", download_url="")
+
+
+def _upstream(monkeypatch, bodies: dict) -> None:
+    #file id -> _Body, or an exception raised when the download is opened
+    async def open_file(website, token, file_info, headers):
+        body = bodies[file_info.id]
+        if isinstance(body, Exception):
+            raise body
+        return httpx.Response(200, stream=body)
+
+    monkeypatch.setattr(archive, "open_file", open_file)
+
+
+def _archive(files) -> zipfile.ZipFile:
+    async def run():
+        return b"".join([chunk async for chunk in archive.stream_deal_archive("fo1", "token", files)])
+
+    return zipfile.ZipFile(io.BytesIO(asyncio.run(run())))
+
+
+def test_every_file_becomes_an_entry_with_a_unique_name(monkeypatch):
+    _upstream(monkeypatch, {
+        1: _Body([b"one ", b"two"]),
+        2: _Body([b"other"]),
+        3: _Body([b"third"]),
+        4: _Body([b"hidden"])
+    })
+    zip_file = _archive([_file(1, "report.pdf"), _file(2, "report.pdf"), _file(3, "a/b\\c"), _file(4, ".env")])
+    assert sorted(zip_file.namelist()) == ["a_b_c", "env", "report (1).pdf", "report.pdf"]
+    assert {zip_file.read(name) for name in ("report.pdf", "report (1).pdf")} == {b"one two", b"other"}
+    assert zip_file.testzip() is None
+
+
+def test_failed_downloads_are_listed_in_the_archive(monkeypatch):
+    _upstream(monkeypatch, {
+        1: _Body([b"ok"]),
+        2: ValueError("FILE_NOT_FOUND"),
+        3: _Body([b"partial"], fail=True)
+    })
+    zip_file = _archive([_file(1, "ok.pdf"), _file(2, "gone.pdf"), _file(3, "cut.pdf")])
+    errors = zip_file.read("_errors.txt").decode().splitlines()
+    assert "gone.pdf: FILE_NOT_FOUND" in errors
+    assert any(line.startswith("cut.pdf: incomplete") for line in errors)
+    assert zip_file.read("ok.pdf") == b"ok"
+
+
+def test_a_client_that_goes_away_stops_the_downloads(monkeypatch):
+    bodies = {file_id: _Body([b"x" * 10] * 1000) for file_id in range(3)}
+    _upstream(monkeypatch, bodies)
+
+    async def run():
+        stream = archive.stream_deal_archive("fo1", "token", [_file(file_id, f"{file_id}.bin") for file_id in bodies])
+        await stream.__anext__()
+        await stream.aclose()
+        #let the cancelled downloads run their cleanup
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert all(body.closed for body in bodies.values())
@@ -0,0 +1,75 @@
+"""MemoryCache: entry sizing, LRU eviction under the byte bound, expiry and token invalidation"""
+
+import asyncio
+from services import cache
+from services.cache import SIZE_SAMPLE, MemoryCache, _entry_size
+from services.records import DealRecord
+from services.serialization import dumps
+
+
+def _deals(count: int):
+    return [DealRecord(id=i, title=f"Deal {i}", created_at="2024-01-01") for i in range(count)]
+
+
+def test_short_values_are_sized_by_their_encoding():
+    value = {"files": [], "total": 0, "error": None}
+    assert _entry_size(value) == len(dumps(value))
+    assert _entry_size(_deals(SIZE_SAMPLE)) == len(dumps(_deals(SIZE_SAMPLE)))
+
+
+def test_long_listings_are_sized_from_a_sample():
+    deals = _deals(SIZE_SAMPLE * 20)
+    exact = len(dumps(deals))
+    assert abs(_entry_size(deals) - exact) < exact * 0.05
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    async def run():
+        size = _entry_size("x" * 100)
+        memory = MemoryCache(max_bytes=size * 3)
+        for key in ("a", "b", "c"):
+            await memory.set(key, "x" * 100, ttl=60)
+        await memory.get("a")
+        await memory.set("d", "x" * 100, ttl=60)
+        return [key for key in "abcd" if await memory.get(key) is not None], memory.get_stats()
+
+    kept, stats = asyncio.run(run())
+    assert kept == ["a", "c", "d"]
+    assert stats["evictions"] == 1 and stats["used_bytes"] <= stats["max_bytes"]
+
+
+def test_values_over_the_bound_and_replaced_keys_keep_the_accounting_right():
+    async def run():
+        memory = MemoryCache(max_bytes=200)
+        await memory.set("big", "x" * 500, ttl=60)
+        await memory.set("key", "x" * 10, ttl=60)
+        await memory.set("key", "x" * 50, ttl=60)
+        return await memory.get("big"), memory.get_stats()
+
+    big, stats = asyncio.run(run())
+    assert big is None
+    assert stats["entries"] == 1 and stats["used_bytes"] == _entry_size("x" * 50)
+
+
+def test_expired_entries_miss_and_free_their_bytes():
+    async def run():
+        memory = MemoryCache(max_bytes=1000)
+        await memory.set("key", "value", ttl=0)
+        return await memory.get("key"), memory.get_stats()
+
+    value, stats = asyncio.run(run())
+    assert value is None
+    assert stats["misses"] == 1 and stats["entries"] == 0 and stats["used_bytes"] == 0
+
+
+def test_invalidating_a_token_drops_only_its_entries():
+    async def run():
+        memory = MemoryCache(max_bytes=10_000)
+        await memory.set(cache.make_key("fo1", "old", "deals"), [], ttl=60)
+        await memory.set(cache.make_key("fo1", "old", "files", 7), {}, ttl=60)
+        await memory.set(cache.make_key("fo1", "other", "deals"), [], ttl=60)
+        await memory.invalidate_prefix(cache.token_prefix("fo1", "old"))
+        return memory.get_stats()
+
+    stats = asyncio.run(run())
+    assert stats["entries"] == 1 and stats["invalidations"] == 2
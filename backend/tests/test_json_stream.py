@@ -0,0 +1,75 @@
+"""DataRecords: records and top-level fields of a payload, parsed from the stream or in one piece"""
+
+import asyncio
+import json
+import httpx
+import pytest
+from config import config
+from services import json_stream
+from services.json_stream import DataRecords
+
+
+class _Chunks(httpx.AsyncByteStream):
+    #a body sent in small chunks, recording how many were read so far
+    def __init__(self, body: bytes, size: int):
+        self.chunks = [body[i:i + size] for i in range(0, len(body), size)]
+        self.read = 0
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+def _records(payload: dict, size: int = 7):
+    async def run():
+        records = DataRecords(httpx.Response(200, stream=_Chunks(json.dumps(payload).encode(), size)))
+        items = [item async for item in records]
+        return items, records.meta, records.count
+
+    return asyncio.run(run())
+
+
+@pytest.fixture(params=[True, False], ids=["streamed", "buffered"])
+def parse_mode(request, monkeypatch):
+    if request.param and json_stream.ijson is None:
+        pytest.skip("ijson is not installed")
+    monkeypatch.setattr(config, "UPSTREAM_STREAM_PARSE", request.param)
+
+
+def test_list_records_and_top_level_fields(parse_mode):
+    payload = {
+        "current_page": 1,
+        "data": [{"id": 1, "tags": [{"name": "a"}], "price": 1.5}, {"id": 2, "nested": {"deep": [1, [2]]}}, 3],
+        "last_page": 4,
+        "links": {"next": "?page=2"}
+    }
+    items, meta, count = _records(payload)
+    assert items == [(None, record) for record in payload["data"]]
+    assert meta == {"current_page": 1, "last_page": 4}
+    assert count == 3
+
+
+def test_records_keyed_by_id(parse_mode):
+    payload = {"data": {"10": {"name": "a.pdf"}, "11": {"name": "b.pdf"}}}
+    items, meta, count = _records(payload)
+    assert items == [("10", {"name": "a.pdf"}), ("11", {"name": "b.pdf"})]
+    assert meta == {} and count == 2
+
+
+def test_missing_data_yields_nothing(parse_mode):
+    items, meta, count = _records({"total": 0})
+    assert items == [] and meta == {"total": 0} and count == 0
+
+
+def test_streamed_records_arrive_before_the_body_is_read(monkeypatch):
+    if json_stream.ijson is None:
+        pytest.skip("ijson is not installed")
+    monkeypatch.setattr(config, "UPSTREAM_STREAM_PARSE", True)
+    body = _Chunks(json.dumps({"data": [{"id": i, "title": "x" * 50} for i in range(200)]}).encode(), 64)
+
+    async def run():
+        async for _ in DataRecords(httpx.Response(200, stream=body)):
+            return body.read
+
+    assert asyncio.run(run()) < len(body.chunks) // 10
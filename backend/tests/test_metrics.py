@@ -0,0 +1,24 @@
+"""MetricsMiddleware: route timing labelled by route template"""
+
+import asyncio
+from prometheus_client import generate_latest
+from services.metrics import MetricsMiddleware, registry
+
+
+def _request(scope: dict) -> None:
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 404})
+
+    async def send(message):
+        pass
+
+    asyncio.run(MetricsMiddleware(app)({"type": "http", "method": "GET", **scope}, None, send))
+
+
+def test_requests_are_labelled_by_route_template():
+    _request({"path": "/deals/4242/files", "route": object(), "path_params": {"deal_id": "4242"}})
+    _request({"path": "/wp-admin/setup.php"})
+    exposition = generate_latest(registry).decode()
+    assert 'http_request_seconds_count{method="GET",route="/deals/{deal_id}/files",status="404"} 1.0' in exposition
+    assert 'http_request_seconds_count{method="GET",route="unmatched",status="404"} 1.0' in exposition
+    assert "4242" not in exposition and "http_requests_in_flight 0.0" in exposition
@@ -0,0 +1,32 @@
+"""PrefetchScheduler: refreshes follow session activity"""
+
+import asyncio
+from config import config
+from services import prefetch
+from services.prefetch import PrefetchScheduler
+from services.sessions import SessionStore
+
+
+def test_refreshes_pause_while_the_session_is_idle_and_resume_with_use(monkeypatch):
+    store = SessionStore()
+    monkeypatch.setattr(prefetch, "session_store", store)
+    monkeypatch.setattr(config, "PREFETCH_ENABLED", True)
+    monkeypatch.setattr(config, "PREFETCH_TICK", 0.001)
+
+    async def run():
+        scheduler = PrefetchScheduler()
+        session = store.create("fo1", "alice", "token-1")
+        scheduler.register(session)
+        job = scheduler._jobs[session.session_id]
+        session.last_used -= config.UPSTREAM_SESSION_LIFETIME + 1
+        schedule = asyncio.ensure_future(scheduler._schedule())
+        await asyncio.sleep(0.01)
+        idle = list(job.pending)
+        store.resolve_token("fo1", None, session.session_id)
+        await asyncio.sleep(0.01)
+        schedule.cancel()
+        return idle, list(job.pending), scheduler.get_stats()["sessions"]
+
+    idle, active, jobs = asyncio.run(run())
+    assert idle == [] and active == [("deals", None)]
+    assert jobs == 1
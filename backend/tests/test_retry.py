@@ -0,0 +1,65 @@
+"""A final retryable response is closed before UpstreamUnavailableError is raised"""
+
+import asyncio
+import httpx
+import pytest
+from services import retry
+from services.retry import RetryBudget, RetryPolicy, UpstreamUnavailableError, call_with_retry
+
+
+class _Body(httpx.AsyncByteStream):
+    #an unread response body that records whether it was closed (its pooled connection given back)
+    def __init__(self):
+        self.closed = False
+
+    async def __aiter__(self):
+        yield b"down"
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+def _always_503(website: str):
+    #stream=True responses, as the list / cards / files calls send them; returns the client and the bodies
+    bodies = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(_Body())
+        return httpx.Response(503, stream=bodies[-1])
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def send() -> httpx.Response:
+        return await client.send(client.build_request("GET", f"http://{website}/deals"), stream=True)
+
+    return client, send, bodies
+
+
+def _run(website: str, policy: RetryPolicy, budget: RetryBudget, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setitem(retry.POLICIES, "list", policy)
+    monkeypatch.setitem(retry._budgets, website, budget)
+    client, send, bodies = _always_503(website)
+
+    async def call() -> None:
+        try:
+            with pytest.raises(UpstreamUnavailableError):
+                await call_with_retry(website, "list", send)
+        finally:
+            await client.aclose()
+
+    asyncio.run(call())
+    return bodies
+
+
+def test_exhausted_retries_close_every_response(monkeypatch):
+    policy = RetryPolicy(max_attempts=2, base_delay=0, max_delay=0, idempotent=True)
+    bodies = _run("retries.test", policy, RetryBudget(1.0, 10), monkeypatch)
+    assert len(bodies) == 2
+    assert all(body.closed for body in bodies)
+
+
+def test_exhausted_budget_closes_the_response(monkeypatch):
+    policy = RetryPolicy(max_attempts=4, base_delay=0, max_delay=0, idempotent=True)
+    bodies = _run("budget.test", policy, RetryBudget(0.0, 0), monkeypatch)
+    assert len(bodies) == 1
+    assert bodies[0].closed
@@ -0,0 +1,105 @@
+"""ScopeIndex: match quality and display order, and incremental updates against a fresh build"""
+
+import random
+import pytest
+from config import config
+from services.records import DealRecord, FileRecord
+from services.search import EXACT_SCORE, FUZZY_SCORE, PREFIX_SCORE, ScopeIndex, SearchIndex
+
+
+def _deal(deal_id: int, title: str, firm: str = "") -> DealRecord:
+    return DealRecord(id=deal_id, title=title, created_at="2024-01-01", firm=firm)
+
+
+def _file(file_id: int, name: str) -> FileRecord:
+    return FileRecord(id=file_id, name=name, size=1, url="", download_url="")
+
+
+def _found(index: ScopeIndex, query: str, limit: int = 20):
+    return [(hit.type, hit.deal_id, hit.file_id, hit.score) for hit in index.search(query, limit)]
+
+
+def test_exact_matches_rank_above_prefix_and_fuzzy_ones():
+    index = ScopeIndex()
+    index.replace_deals([_deal(1, "Solar farm"), _deal(2, "Solaris towers"), _deal(3, "Solat fund")])
+    assert _found(index, "solar") == [
+        ("deal", 1, None, EXACT_SCORE),
+        ("deal", 2, None, PREFIX_SCORE),
+        ("deal", 3, None, FUZZY_SCORE)
+    ]
+
+
+def test_deals_come_before_files_then_titles_in_order():
+    index = ScopeIndex()
+    index.replace_deals([_deal(1, "Beta report"), _deal(2, "Alpha report")])
+    index.replace_files(1, [_file(10, "Annual report.pdf"), _file(11, "Model.xlsx")])
+    assert _found(index, "report") == [
+        ("deal", 2, None, EXACT_SCORE),
+        ("deal", 1, None, EXACT_SCORE),
+        ("file", 1, 10, EXACT_SCORE)
+    ]
+    assert _found(index, "report", limit=2) == _found(index, "report")[:2]
+
+
+def test_every_query_term_must_match():
+    index = ScopeIndex()
+    index.replace_deals([_deal(1, "Solar farm", "Acme"), _deal(2, "Solar park", "Globex")])
+    assert _found(index, "solar acme") == [("deal", 1, None, 2 * EXACT_SCORE)]
+    assert _found(index, "solar initech") == []
+    assert _found(index, "  ") == []
+
+
+def test_replacing_documents_updates_only_what_changed():
+    index = ScopeIndex()
+    index.replace_deals([_deal(1, "Solar farm"), _deal(2, "Wind farm")])
+    index.replace_files(1, [_file(10, "Solar model.xlsx")])
+    index.replace_files(2, [_file(20, "Wind model.xlsx")])
+
+    index.replace_deals([_deal(1, "Hydro plant"), _deal(3, "Solar roofs")])
+    index.replace_files(2, [])
+    assert _found(index, "solar") == [("deal", 3, None, EXACT_SCORE), ("file", 1, 10, EXACT_SCORE)]
+    assert _found(index, "wind") == []
+    assert _found(index, "hydro") == [("deal", 1, None, EXACT_SCORE)]
+    assert len(index) == 3
+
+
+@pytest.mark.parametrize("batch", [0, 1000], ids=["merged", "in-place"])
+def test_updates_give_the_same_index_as_a_fresh_build(batch, monkeypatch):
+    monkeypatch.setattr(config, "SEARCH_BISECT_BATCH", batch)
+    words = ["solar", "solid", "wind", "winter", "hydro", "fund", "funds", "model", "report", "capital"]
+    choose = random.Random(7)
+
+    def title() -> str:
+        return " ".join(choose.sample(words, 2))
+
+    index = ScopeIndex()
+    for _ in range(5):
+        deals = [_deal(deal_id, title(), choose.choice(["Acme", "Globex", ""])) for deal_id in choose.sample(range(40), 25)]
+        files = {deal.id: [_file(deal.id * 100 + n, f"{title()}.pdf") for n in range(choose.randrange(3))] for deal in deals[:10]}
+        index.replace_deals(deals)
+        for deal_id in list(index.files_sources):
+            if deal_id not in files:
+                index.replace_files(deal_id, [])
+        for deal_id, deal_files in files.items():
+            index.replace_files(deal_id, deal_files)
+
+        fresh = ScopeIndex()
+        fresh.replace_deals(deals)
+        for deal_id, deal_files in files.items():
+            fresh.replace_files(deal_id, deal_files)
+        assert index._sorted_terms == fresh._sorted_terms
+        for query in ["sol", "solar", "solr", "wind fund", "acme", "model capital", "fundz"]:
+            assert _found(index, query, limit=8) == _found(fresh, query, limit=8)
+
+
+def test_unchanged_sources_are_not_reindexed():
+    search = SearchIndex(max_scopes=1)
+    deals = [_deal(1, "Solar farm")]
+    search.index_deals("fo1:a", deals)
+    index = search._scopes["fo1:a"]
+    index.replace_deals = None
+    search.index_deals("fo1:a", deals)
+    assert search.has_deals("fo1:a")
+
+    search.index_deals("fo1:b", deals)
+    assert not search.has_deals("fo1:a") and search.search("fo1:a", "solar", 10) == []
@@ -0,0 +1,87 @@
+"""SessionStore: token resolution, rejected tokens, expiry and re-validation"""
+
+import pytest
+from config import config
+from services import sessions
+from services.sessions import SessionStore
+
+
+class _Clock:
+    #stands in for time.time in the sessions module
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(sessions.time, "time", clock)
+    return clock
+
+
+def test_a_session_id_resolves_to_its_token_on_its_website_only(clock):
+    store = SessionStore()
+    session = store.create("fo1", "Alice", "token-1")
+    assert store.resolve_token("fo1", None, session.session_id) == "token-1"
+    assert store.resolve_token("fo1", "raw-token", None) == "raw-token"
+    for website, token, session_id in (("fo2", None, session.session_id), ("fo1", None, "unknown"), ("fo1", None, None)):
+        with pytest.raises(ValueError, match="UNAUTHORIZED"):
+            store.resolve_token(website, token, session_id)
+    assert store.username_for_token("fo1", "token-1") == "Alice"
+
+
+def test_a_rejected_token_is_answered_from_memory(clock):
+    store = SessionStore()
+    session = store.create("fo1", "alice", "token-1")
+    store.mark_rejected("fo1", "token-1", "SESSION_CONFLICT")
+    with pytest.raises(ValueError, match="SESSION_CONFLICT"):
+        store.resolve_token("fo1", None, session.session_id)
+    with pytest.raises(ValueError, match="SESSION_CONFLICT"):
+        store.resolve_token("fo1", "token-1", None)
+    assert store.resolve_token("fo2", "token-1", None) == "token-1"
+    assert store.get_stats()["rejections_served"] == 2
+
+    clock.now += config.SESSION_IDLE_TIMEOUT + 1
+    store.evict_expired()
+    assert store.resolve_token("fo1", "token-1", None) == "token-1"
+
+
+def test_sessions_expire_when_idle_or_too_old(clock):
+    store = SessionStore()
+    idle = store.create("fo1", "alice", "token-1")
+    used = store.create("fo1", "bob", "token-2")
+    clock.now += config.SESSION_IDLE_TIMEOUT - 10
+    store.resolve_token("fo1", "token-2", None)
+    clock.now += 20
+    assert store.get(idle.session_id) is None
+    assert store.get(used.session_id) is used
+
+    clock.now = used.created_at + config.SESSION_TTL + 1
+    used.last_used = clock.now
+    assert store.evict_expired() == 1
+    assert store.get_stats()["active"] == 0 and store.username_for_token("fo1", "token-2") is None
+
+
+def test_only_valid_sessions_past_the_interval_are_revalidated(clock):
+    store = SessionStore()
+    fresh = store.create("fo1", "alice", "token-1")
+    stale = store.create("fo1", "bob", "token-2")
+    rejected = store.create("fo1", "carol", "token-3")
+    clock.now += config.SESSION_REVALIDATE_AFTER + 1
+    for session in (fresh, stale, rejected):
+        session.last_used = clock.now
+    store.mark_validated("fo1", "token-1")
+    store.mark_rejected("fo1", "token-3", "UNAUTHORIZED")
+    assert store.due_for_validation() == [stale]
+
+
+def test_sessions_idle_past_the_upstream_lifetime_are_left_to_expire(clock):
+    store = SessionStore()
+    session = store.create("fo1", "alice", "token-1")
+    clock.now += max(config.SESSION_REVALIDATE_AFTER, config.UPSTREAM_SESSION_LIFETIME) + 1
+    assert store.due_for_validation() == []
+    store.resolve_token("fo1", None, session.session_id)
+    assert store.due_for_validation() == [session]
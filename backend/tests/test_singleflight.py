@@ -0,0 +1,99 @@
+"""SingleFlight: one call per key, shared outcomes, callers that go away, and the flight's priority"""
+
+import asyncio
+import pytest
+from services import admission
+from services.admission import BACKGROUND, INTERACTIVE, Gate
+from services.singleflight import SingleFlight
+from services.sites import Limits
+
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return ["deal"]
+
+        results = await asyncio.gather(*(flight.do("deals", fetch) for _ in range(5)))
+        again = await flight.do("deals", fetch)
+        return results, again, len(calls), flight.get_stats()
+
+    results, again, calls, stats = asyncio.run(run())
+    assert results == [["deal"]] * 5 and again == ["deal"]
+    assert calls == 2
+    assert stats == {"calls": 2, "shared": 4, "in_flight": 0}
+
+
+def test_every_caller_receives_the_exception():
+    async def run():
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError("UNAUTHORIZED")
+
+        return await asyncio.gather(*(flight.do("deals", fetch) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert [str(error) for error in errors] == ["UNAUTHORIZED"] * 3
+    assert errors[0] is errors[1] is errors[2]
+
+
+def test_a_cancelled_caller_does_not_cancel_the_flight():
+    async def run():
+        flight = SingleFlight()
+        finished = asyncio.Event()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            finished.set()
+            return "done"
+
+        leaving = asyncio.ensure_future(flight.do("deals", fetch))
+        staying = asyncio.ensure_future(flight.do("deals", fetch))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        return await staying, finished.is_set()
+
+    assert asyncio.run(run()) == ("done", True)
+
+
+def test_an_interactive_caller_raises_a_queued_background_flight(monkeypatch):
+    gate = Gate("fo1", Limits(rate=0, burst=1, concurrency=1), max_queue=10)
+    monkeypatch.setattr(admission, "_gates", {("fo1", None): gate})
+
+    async def run():
+        flight = SingleFlight()
+        admitted = []
+        await gate.acquire(INTERACTIVE, 1)
+
+        async def fetch():
+            #the priority seen inside the flight, as scraper._send reads it
+            await gate.acquire(admission.current_priority(), 1)
+            admitted.append("flight")
+            gate.release()
+
+        async def other():
+            await gate.acquire(INTERACTIVE, 1)
+            admitted.append("other")
+            gate.release()
+
+        reset = admission.request_priority.set(BACKGROUND)
+        background = asyncio.ensure_future(flight.do("deals", fetch))
+        admission.request_priority.reset(reset)
+        await asyncio.sleep(0)
+        queued = asyncio.ensure_future(other())
+        await asyncio.sleep(0)
+        joined = asyncio.ensure_future(flight.do("deals", fetch))
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(background, queued, joined)
+        return admitted
+
+    assert asyncio.run(run()) == ["flight", "other"]
@@ -0,0 +1,75 @@
+"""SyncStore: deltas between snapshots, repeated lists, and the user, history and entry bounds"""
+
+from services.records import DealRecord
+from services.sync import SyncStore
+
+
+def _deal(deal_id: int, title: str = "") -> DealRecord:
+    return DealRecord(id=deal_id, title=title or f"Deal {deal_id}", created_at="2024-01-01")
+
+
+def _store(max_users: int = 10, history: int = 3, max_entries: int = 1000) -> SyncStore:
+    return SyncStore(max_users=max_users, history=history, max_entries=max_entries)
+
+
+def test_a_known_cursor_gets_added_changed_and_removed_deals():
+    store = _store()
+    first, _ = store.record("fo1:user", [_deal(1), _deal(2), _deal(3)])
+    current, previous = store.record("fo1:user", [_deal(1), _deal(2, "Renamed"), _deal(4)])
+    assert previous is first and current.cursor != first.cursor
+
+    delta = store.diff("fo1:user", first.cursor, current)
+    assert not delta.full and delta.cursor == current.cursor
+    assert [deal.id for deal in delta.added] == [4]
+    assert [deal.title for deal in delta.changed] == ["Renamed"]
+    assert delta.removed == [3]
+
+
+def test_an_unknown_or_missing_cursor_gets_the_full_listing():
+    store = _store()
+    current, _ = store.record("fo1:user", [_deal(1), _deal(2)])
+    for cursor in (None, "unknown"):
+        delta = store.diff("fo1:user", cursor, current)
+        assert delta.full and [deal.id for deal in delta.added] == [1, 2]
+        assert delta.changed == [] and delta.removed == []
+
+
+def test_recording_the_same_deals_again_keeps_the_snapshot():
+    store = _store()
+    deals = [_deal(1), _deal(2)]
+    first, _ = store.record("fo1:user", deals)
+    #the cached list itself, then an equal list fetched again
+    assert store.record("fo1:user", deals) == (first, first)
+    assert store.record("fo1:user", [_deal(1), _deal(2)]) == (first, first)
+    assert store.diff("fo1:user", first.cursor, first).added == []
+    assert store.get_stats() == {"users": 1, "snapshots": 1, "entries": 2}
+
+
+def test_history_keeps_the_latest_snapshots_with_full_records_on_the_newest_only():
+    store = _store(history=2)
+    snapshots = [store.record("fo1:user", [_deal(1, f"v{version}")])[0] for version in range(3)]
+    assert store.diff("fo1:user", snapshots[0].cursor, snapshots[2]).full
+    assert not store.diff("fo1:user", snapshots[1].cursor, snapshots[2]).full
+    assert snapshots[1].deals == {} and store.latest("fo1:user") is snapshots[2]
+    assert store.get_stats() == {"users": 1, "snapshots": 2, "entries": 2}
+
+
+def test_least_recently_synced_users_are_evicted_first():
+    store = _store(max_users=2)
+    store.record("fo1:a", [_deal(1)])
+    store.record("fo1:b", [_deal(1)])
+    store.record("fo1:a", [_deal(2)])
+    store.record("fo1:c", [_deal(1)])
+    assert store.latest("fo1:b") is None
+    assert store.latest("fo1:a") is not None and store.latest("fo1:c") is not None
+
+
+def test_the_entry_bound_drops_other_users_then_older_snapshots():
+    store = _store(max_entries=5)
+    store.record("fo1:a", [_deal(i) for i in range(3)])
+    store.record("fo1:b", [_deal(i) for i in range(3)])
+    assert store.latest("fo1:a") is None
+    store.record("fo1:b", [_deal(i) for i in range(4)])
+    #the current user keeps its latest snapshot even when that alone is over the bound
+    store.record("fo1:b", [_deal(i) for i in range(6)])
+    assert store.get_stats() == {"users": 1, "snapshots": 1, "entries": 6}